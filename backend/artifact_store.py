@@ -0,0 +1,363 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Union
+
+from google.adk.artifacts.base_artifact_service import ArtifactVersion, BaseArtifactService
+from google.adk.artifacts.in_memory_artifact_service import InMemoryArtifactService
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_STORE = os.getenv("ARTIFACT_STORE", "filesystem").lower()
+# Directory of the filesystem store; it must be persistent, as the index and blobs must outlive
+# the process (a temp dir is wiped on restart while sessions still reference them). Without it,
+# artifacts are kept in memory.
+ARTIFACT_STORE_DIR = os.getenv("ARTIFACT_STORE_DIR", "")
+ARTIFACT_SESSION_QUOTA_BYTES = int(os.getenv("ARTIFACT_SESSION_QUOTA_BYTES", str(256 * 1024 * 1024)))
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Scope of artifacts whose filename starts with "user:"; they are shared by all sessions of a user.
+_USER_SCOPE = "user:"
+
+
+class ArtifactQuotaExceededError(ValueError):
+    """Raised when saving an artifact would exceed the per-artifact or per-session size limit."""
+
+
+class FileSystemArtifactService(BaseArtifactService):
+    """
+    Artifact service storing payloads as content-addressed files on local disk.
+
+    Each distinct payload is written once to blobs/<sha256[:2]>/<sha256>, so identical
+    versions (a chart re-rendered unchanged, the same CSV saved by two turns) share one
+    file. Versions are recorded in a small SQLite index. Payloads are only read into
+    memory when the agent loads them; the HTTP endpoint serves the file directly (see
+    `resolve_artifact_file`). Saves beyond `max_artifact_bytes`, or that would take a
+    session's artifacts past `session_quota_bytes`, are rejected.
+    """
+    def __init__(
+        self,
+        root_dir: str = ARTIFACT_STORE_DIR,
+        session_quota_bytes: int = ARTIFACT_SESSION_QUOTA_BYTES,
+        max_artifact_bytes: int = ARTIFACT_MAX_BYTES,
+    ):
+        self.root_dir = root_dir
+        self.session_quota_bytes = session_quota_bytes
+        self.max_artifact_bytes = max_artifact_bytes
+        self._blob_dir = os.path.join(root_dir, "blobs")
+        os.makedirs(self._blob_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(root_dir, "index.sqlite"), check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS artifact_versions (
+                    app_name TEXT NOT NULL, user_id TEXT NOT NULL, scope TEXT NOT NULL,
+                    filename TEXT NOT NULL, version INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL, size INTEGER NOT NULL, mime_type TEXT,
+                    is_text INTEGER NOT NULL, custom_metadata TEXT, create_time REAL NOT NULL,
+                    PRIMARY KEY (app_name, user_id, scope, filename, version)
+                )
+                """
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS artifact_versions_sha256 ON artifact_versions (sha256)")
+
+    # --- BaseArtifactService ---
+
+    async def save_artifact(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        filename: str,
+        artifact: Union[types.Part, Dict[str, Any]],
+        session_id: Optional[str] = None,
+        custom_metadata: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        if isinstance(artifact, dict):
+            artifact = types.Part.model_validate(artifact)
+        if artifact.inline_data is not None:
+            data, mime_type, is_text = artifact.inline_data.data or b"", artifact.inline_data.mime_type, False
+        elif artifact.text is not None:
+            data, mime_type, is_text = artifact.text.encode("utf-8"), "text/plain", True
+        else:
+            raise ValueError("Only inline data and text artifacts can be stored.")
+        return await asyncio.to_thread(
+            self._save, app_name, user_id, self._scope(filename, session_id), filename, data, mime_type, is_text,
+            custom_metadata,
+        )
+
+    async def load_artifact(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        filename: str,
+        session_id: Optional[str] = None,
+        version: Optional[int] = None,
+    ) -> Optional[types.Part]:
+        row = await asyncio.to_thread(self._find_version, app_name, user_id, self._scope(filename, session_id), filename, version)
+        if row is None:
+            return None
+        data = await asyncio.to_thread(self._read_blob, row["sha256"])
+        if row["is_text"]:
+            return types.Part(text=data.decode("utf-8"))
+        return types.Part.from_bytes(data=data, mime_type=row["mime_type"])
+
+    async def list_artifact_keys(self, *, app_name: str, user_id: str, session_id: Optional[str] = None) -> List[str]:
+        return await asyncio.to_thread(self._list_keys, app_name, user_id, session_id)
+
+    async def delete_artifact(
+        self, *, app_name: str, user_id: str, filename: str, session_id: Optional[str] = None
+    ) -> None:
+        await asyncio.to_thread(self._delete, app_name, user_id, self._scope(filename, session_id), filename)
+
+    async def list_versions(
+        self, *, app_name: str, user_id: str, filename: str, session_id: Optional[str] = None
+    ) -> List[int]:
+        return [version.version for version in await self.list_artifact_versions(
+            app_name=app_name, user_id=user_id, filename=filename, session_id=session_id
+        )]
+
+    async def list_artifact_versions(
+        self, *, app_name: str, user_id: str, filename: str, session_id: Optional[str] = None
+    ) -> List[ArtifactVersion]:
+        rows = await asyncio.to_thread(self._list_versions, app_name, user_id, self._scope(filename, session_id), filename)
+        return [
+            ArtifactVersion(
+                version=version,
+                canonical_uri=f"file://{self._blob_path(sha256)}",
+                custom_metadata=json.loads(custom_metadata) if custom_metadata else {},
+                create_time=create_time,
+                mime_type=mime_type,
+            )
+            for version, sha256, mime_type, custom_metadata, create_time in rows
+        ]
+
+    async def get_artifact_version(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        filename: str,
+        session_id: Optional[str] = None,
+        version: Optional[int] = None,
+    ) -> Optional[ArtifactVersion]:
+        versions = await self.list_artifact_versions(
+            app_name=app_name, user_id=user_id, filename=filename, session_id=session_id
+        )
+        if not versions:
+            return None
+        if version is None:
+            return versions[-1]
+        return next((artifact_version for artifact_version in versions if artifact_version.version == version), None)
+
+    # --- Direct file access ---
+
+    def resolve_artifact_file(
+        self, app_name: str, user_id: str, session_id: Optional[str], filename: str, version: Optional[int] = None
+    ) -> Optional[dict]:
+        """
+        Returns the 'path', 'sha256', 'size' and 'mime_type' of a stored version without
+        reading it, or None if it does not exist. The file is immutable, so its hash can be
+        used as a strong ETag.
+        """
+        row = self._find_version(app_name, user_id, self._scope(filename, session_id), filename, version)
+        if row is None:
+            return None
+        return {
+            "path": self._blob_path(row["sha256"]),
+            "sha256": row["sha256"],
+            "size": row["size"],
+            "mime_type": row["mime_type"] or "application/octet-stream",
+        }
+
+    def delete_session_artifacts(self, app_name: str, user_id: str, session_id: str) -> int:
+        """
+        Deletes every artifact of a session, e.g. once the session store has purged it, and
+        the blobs no other version uses. Returns the number of versions removed.
+        """
+        with self._lock:
+            with self._connection:
+                hashes = {sha256 for (sha256,) in self._connection.execute(
+                    "SELECT sha256 FROM artifact_versions WHERE app_name = ? AND user_id = ? AND scope = ?",
+                    (app_name, user_id, session_id),
+                )}
+                removed = self._connection.execute(
+                    "DELETE FROM artifact_versions WHERE app_name = ? AND user_id = ? AND scope = ?",
+                    (app_name, user_id, session_id),
+                ).rowcount
+            for sha256 in hashes:
+                self._remove_unused_blob(sha256)
+        return removed
+
+    def usage(self, app_name: str, user_id: str, session_id: str) -> int:
+        """Bytes of all artifact versions of a session, as counted against its quota."""
+        with self._lock:
+            return self._scope_usage(app_name, user_id, session_id)
+
+    # --- Storage ---
+
+    @staticmethod
+    def _scope(filename: str, session_id: Optional[str]) -> str:
+        if filename.startswith(_USER_SCOPE):
+            return _USER_SCOPE
+        if not session_id:
+            raise ValueError("Session ID must be provided for session-scoped artifacts.")
+        return session_id
+
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self._blob_dir, sha256[:2], sha256)
+
+    def _read_blob(self, sha256: str) -> bytes:
+        with open(self._blob_path(sha256), "rb") as blob_file:
+            return blob_file.read()
+
+    def _write_blob(self, sha256: str, data: bytes) -> None:
+        path = self._blob_path(sha256)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_")
+        try:
+            with os.fdopen(temp_fd, "wb") as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _remove_unused_blob(self, sha256: str) -> None:
+        """Removes a blob no version refers to. Call with the lock held."""
+        still_used = self._connection.execute(
+            "SELECT 1 FROM artifact_versions WHERE sha256 = ? LIMIT 1", (sha256,)
+        ).fetchone()
+        if not still_used and os.path.exists(self._blob_path(sha256)):
+            os.remove(self._blob_path(sha256))
+
+    def _list_keys(self, app_name: str, user_id: str, session_id: Optional[str]) -> List[str]:
+        scopes = [_USER_SCOPE] + ([session_id] if session_id else [])
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT DISTINCT filename FROM artifact_versions WHERE app_name = ? AND user_id = ? "
+                f"AND scope IN ({','.join('?' * len(scopes))}) ORDER BY filename",
+                (app_name, user_id, *scopes),
+            ).fetchall()
+        return [filename for (filename,) in rows]
+
+    def _list_versions(self, app_name: str, user_id: str, scope: str, filename: str) -> list:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT version, sha256, mime_type, custom_metadata, create_time FROM artifact_versions "
+                "WHERE app_name = ? AND user_id = ? AND scope = ? AND filename = ? ORDER BY version",
+                (app_name, user_id, scope, filename),
+            ).fetchall()
+
+    def _scope_usage(self, app_name: str, user_id: str, scope: str) -> int:
+        return self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM artifact_versions WHERE app_name = ? AND user_id = ? AND scope = ?",
+            (app_name, user_id, scope),
+        ).fetchone()[0]
+
+    def _save(self, app_name, user_id, scope, filename, data, mime_type, is_text, custom_metadata) -> int:
+        if len(data) > self.max_artifact_bytes:
+            raise ArtifactQuotaExceededError(
+                f"Artifact '{filename}' is {len(data)} bytes; the limit is {self.max_artifact_bytes} bytes."
+            )
+        sha256 = hashlib.sha256(data).hexdigest()
+        # Written before the index row, so a recorded version always has its file, and
+        # outside the lock, so a large upload does not stall other sessions' reads.
+        self._write_blob(sha256, data)
+        with self._lock, self._connection:
+            usage = self._scope_usage(app_name, user_id, scope)
+            if usage + len(data) > self.session_quota_bytes:
+                self._remove_unused_blob(sha256)
+                raise ArtifactQuotaExceededError(
+                    f"Saving '{filename}' ({len(data)} bytes) would exceed the artifact quota of "
+                    f"{self.session_quota_bytes} bytes ({usage} bytes used)."
+                )
+            if not os.path.exists(self._blob_path(sha256)):
+                # A concurrent delete removed the blob after it was written.
+                self._write_blob(sha256, data)
+            version = self._connection.execute(
+                "SELECT COALESCE(MAX(version) + 1, 0) FROM artifact_versions "
+                "WHERE app_name = ? AND user_id = ? AND scope = ? AND filename = ?",
+                (app_name, user_id, scope, filename),
+            ).fetchone()[0]
+            self._connection.execute(
+                "INSERT INTO artifact_versions (app_name, user_id, scope, filename, version, sha256, size, mime_type, "
+                "is_text, custom_metadata, create_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    app_name, user_id, scope, filename, version, sha256, len(data), mime_type, int(is_text),
+                    json.dumps(custom_metadata) if custom_metadata else None, time.time(),
+                ),
+            )
+        logger.info(f"Saved artifact '{filename}' version {version} ({len(data)} bytes, blob {sha256[:12]}).")
+        return version
+
+    def _find_version(self, app_name, user_id, scope, filename, version) -> Optional[dict]:
+        query = (
+            "SELECT sha256, size, mime_type, is_text FROM artifact_versions "
+            "WHERE app_name = ? AND user_id = ? AND scope = ? AND filename = ?"
+        )
+        params = [app_name, user_id, scope, filename]
+        if version is None:
+            query += " ORDER BY version DESC LIMIT 1"
+        else:
+            query += " AND version = ?"
+            params.append(version)
+        with self._lock:
+            row = self._connection.execute(query, params).fetchone()
+        if row is None:
+            return None
+        return {"sha256": row[0], "size": row[1], "mime_type": row[2], "is_text": bool(row[3])}
+
+    def _delete(self, app_name, user_id, scope, filename) -> None:
+        with self._lock:
+            with self._connection:
+                hashes = {sha256 for (sha256,) in self._connection.execute(
+                    "SELECT sha256 FROM artifact_versions WHERE app_name = ? AND user_id = ? AND scope = ? AND filename = ?",
+                    (app_name, user_id, scope, filename),
+                )}
+                self._connection.execute(
+                    "DELETE FROM artifact_versions WHERE app_name = ? AND user_id = ? AND scope = ? AND filename = ?",
+                    (app_name, user_id, scope, filename),
+                )
+            for sha256 in hashes:
+                self._remove_unused_blob(sha256)
+
+
+def create_artifact_service() -> BaseArtifactService:
+    """Returns the artifact service selected by ARTIFACT_STORE ('filesystem' or 'memory')."""
+    if ARTIFACT_STORE == "memory":
+        return InMemoryArtifactService()
+    if not ARTIFACT_STORE_DIR:
+        logger.warning(
+            "ARTIFACT_STORE_DIR is not set; keeping artifacts in memory, so they are lost on restart. "
+            "Point it at a persistent directory to store them on disk."
+        )
+        return InMemoryArtifactService()
+    return FileSystemArtifactService()
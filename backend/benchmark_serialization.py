@@ -0,0 +1,104 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Micro-benchmark of the per-payload serialization cost of the API.
+
+Compares the previous path (a recursive sanitizing copy followed by json.dumps) with
+`backend.serialization.dumps` on payloads of the sizes the chat stream and the table
+endpoints typically send. Run with `python -m backend.benchmark_serialization`.
+"""
+
+import base64
+import datetime
+import decimal
+import json
+import random
+import timeit
+
+from backend.serialization import dumps, orjson
+
+
+def _legacy_sanitize(data):
+    if isinstance(data, dict):
+        return {k: _legacy_sanitize(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [_legacy_sanitize(i) for i in data]
+    elif isinstance(data, bytes):
+        return base64.b64encode(data).decode('utf-8')
+    elif isinstance(data, set):
+        return list(data)
+    return data
+
+
+def _legacy_default(obj):
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    return str(obj)
+
+
+def legacy_dumps(obj) -> bytes:
+    return json.dumps(_legacy_sanitize(obj), default=_legacy_default).encode("utf-8")
+
+
+def _sample_payloads() -> dict:
+    rng = random.Random(0)
+    text_event = {
+        "author": "data_agent",
+        "content": {"role": "model", "parts": [{"text": "Negative sentiment about battery life rose 12% week over week. " * 3}]},
+    }
+    tool_event = {
+        "author": "data_agent",
+        "content": {"role": "user", "parts": [{"function_response": {
+            "name": "execute_sql",
+            "response": {"status": "SUCCESS", "rows_count": 20, "cached": False},
+        }}]},
+    }
+    now = datetime.datetime(2025, 6, 1, 12, 30, tzinfo=datetime.timezone.utc)
+
+    def row(i):
+        return {
+            "id": i,
+            "created_at": now - datetime.timedelta(minutes=i),
+            "brand": "Acme",
+            "sentiment": "negative",
+            "score": decimal.Decimal("0.8312"),
+            "text": "The battery barely lasts half a day after the update, very disappointed. " * 2,
+            "tags": ["battery", "update"],
+            "raw": b"\x00\x01\x02binary",
+            "text_embedding": [rng.uniform(-1, 1) for _ in range(768)],
+        }
+
+    return {
+        "sse text event": text_event,
+        "sse tool event": tool_event,
+        "table_data (3 rows)": {"data": [row(i) for i in range(3)], "description": "Social media posts."},
+        "table_data (50 rows)": {"data": [row(i) for i in range(50)], "description": "Social media posts."},
+    }
+
+
+def main(number: int = 200, repeat: int = 5) -> None:
+    print(f"Serializer: {'orjson' if orjson is not None else 'json (orjson not installed)'}")
+    print(f"{'payload':<22}{'bytes':>10}{'legacy us':>12}{'dumps us':>12}{'speedup':>10}")
+    for name, payload in _sample_payloads().items():
+        legacy = min(timeit.repeat(lambda: legacy_dumps(payload), number=number, repeat=repeat)) / number
+        current = min(timeit.repeat(lambda: dumps(payload), number=number, repeat=repeat)) / number
+        print(
+            f"{name:<22}{len(dumps(payload)):>10}{legacy * 1e6:>12.1f}{current * 1e6:>12.1f}"
+            f"{legacy / current if current else 0:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import logging
+import os
+import statistics
+import threading
+from collections import deque
+
+from fastapi import Request
+
+logger = logging.getLogger(__name__)
+
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "1.0"))
+# Completed turns whose durations are used to estimate the work a cancelled turn would still have done.
+_COMPLETED_TURNS_WINDOW = 200
+
+
+async def cancel_on_disconnect(request: Request, task: asyncio.Task, poll_seconds: float = DISCONNECT_POLL_SECONDS) -> None:
+    """
+    Cancels `task`, the task producing a chat stream, once the client has disconnected.
+
+    A disconnect is otherwise only noticed on the next write, which may be minutes away
+    while the model or a BigQuery job is busy. Run it as a task and cancel it when the
+    stream ends.
+    """
+    while True:
+        await asyncio.sleep(poll_seconds)
+        if await request.is_disconnected():
+            task.cancel()
+            return
+
+
+class TurnCancellationStats:
+    """
+    Counts chat turns that completed and those cancelled because the client went away.
+
+    The time a cancelled turn saved is estimated as the median duration of recently
+    completed turns minus the time it had already run.
+    """
+    def __init__(self, window: int = _COMPLETED_TURNS_WINDOW):
+        self._lock = threading.Lock()
+        self._durations = deque(maxlen=window)
+        self.completed = 0
+        self.cancelled = 0
+        self.cancelled_elapsed_seconds = 0.0
+        self.estimated_seconds_saved = 0.0
+
+    def record_completed(self, duration: float) -> None:
+        with self._lock:
+            self.completed += 1
+            self._durations.append(duration)
+
+    def record_cancelled(self, elapsed: float) -> float:
+        """Records a cancelled turn and returns the estimated seconds of work it saved."""
+        with self._lock:
+            saved = max(0.0, statistics.median(self._durations) - elapsed) if self._durations else 0.0
+            self.cancelled += 1
+            self.cancelled_elapsed_seconds += elapsed
+            self.estimated_seconds_saved += saved
+        return saved
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "cancelled_elapsed_seconds": round(self.cancelled_elapsed_seconds, 2),
+                "estimated_seconds_saved": round(self.estimated_seconds_saved, 2),
+            }
+
+
+turn_cancellation_stats = TurnCancellationStats()
@@ -14,19 +14,18 @@
 
 import os
 import logging
-import json
-import io
 import sys
 import asyncio
-import base64
+import hashlib
+import time
+from contextlib import asynccontextmanager
 from typing import List, Dict, Any, Optional
 
 from fastapi import FastAPI, HTTPException, Request, Response
-from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from dotenv import load_dotenv
-import pandas as pd # --- MODIFICATION: Import pandas ---
 
 # --- Basic Logging Configuration ---
 logging.basicConfig(
@@ -52,14 +51,43 @@ try:
     from data_agent.agent import root_agent
     from data_agent.agent import root_agent
     from google.adk.runners import Runner
-    from google.adk.sessions.in_memory_session_service import InMemorySessionService
-    from google.adk.artifacts.in_memory_artifact_service import InMemoryArtifactService
     from google.genai import types as genai_types
+    from backend.executor import BlockingCallExecutor
+    from backend.metadata_service import TableMetadataService
+    from data_agent.query_cache import get_query_result_cache
+    from backend.serialization import FastJSONResponse
+    from backend.session_store import SESSION_PURGE_INTERVAL_SECONDS, create_session_service
+    from backend.artifact_store import FileSystemArtifactService, create_artifact_service
+    from backend.uploads import (
+        SPREADSHEET_MIME_TYPES, UploadRejectedError, build_upload_prompt, parse_spreadsheet_upload, upload_artifact_name
+    )
+    from data_agent.tracing import tracer
+    from google.adk.agents.run_config import RunConfig, StreamingMode
+    from data_agent.progress import progress_bus
+    from data_agent.bigquery_jobs import query_job_stats
+    from backend.cancellation import cancel_on_disconnect, turn_cancellation_stats
+    from backend.sse import (
+        SSE_STREAM_MODEL_OUTPUT, encode_frame, encode_stream, interleave_progress, negotiate_encoding, project_event,
+        sse_stream_stats,
+    )
     logger.info("Successfully imported ADK components and agents.")
 except ImportError as e:
     logger.critical(f"FATAL: Could not import required components. Error: {e}", exc_info=True)
     sys.exit(1)
 
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches `etag` (weak comparison, as RFC 9110 requires for it)."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in [candidate.removeprefix("W/") for candidate in candidates]
+
+
+def artifact_cache_headers(etag: str) -> Dict[str, str]:
+    # Artifact versions are immutable; the URL changes with every new version.
+    return {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+
+
 # --- Pydantic Models for Request/Response Validation ---
 class ChatMessagePart(BaseModel):
     text: Optional[str] = None
@@ -76,18 +104,6 @@ class AgentRunRequest(BaseModel):
     new_message: ChatMessage
 
 
-def sanitize_for_json(data):
-    """Recursively sanitizes data to be JSON serializable."""
-    if isinstance(data, dict):
-        return {k: sanitize_for_json(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [sanitize_for_json(i) for i in data]
-    elif isinstance(data, bytes):
-        return base64.b64encode(data).decode('utf-8')
-    elif isinstance(data, set):
-        return list(data)
-    return data
-
 class DataAgentWebServer:
     """
     A class that encapsulates the FastAPI application, services, and runners for both agents.
@@ -95,6 +111,9 @@ class DataAgentWebServer:
     def __init__(self, data_agent, session_service, artifact_service):
         self.session_service = session_service
         self.artifact_service = artifact_service
+        self.table_metadata_service = TableMetadataService()
+        # Synchronous BigQuery helpers run here instead of on the event loop.
+        self.blocking_executor = BlockingCallExecutor()
         self.app_name = "data_agent_chatbot"
         
         self.data_agent_runner = Runner(
@@ -109,104 +128,210 @@ class DataAgentWebServer:
             session_service=self.session_service,
             artifact_service=self.artifact_service,
         )
+        # Streamed model output is sent as partial text events, followed by the complete response.
+        self.run_config = RunConfig(streaming_mode=StreamingMode.SSE if SSE_STREAM_MODEL_OUTPUT else StreamingMode.NONE)
         logger.info("DataAgentWebServer initialized with data runner.")
 
+    def _purge_expired_sessions(self) -> None:
+        """Deletes the sessions past their retention, and their artifacts. Blocking; run in a thread."""
+        if not hasattr(self.session_service, "purge_expired_sessions"):
+            return
+        removed_versions = 0
+        for app_name, user_id, session_id in self.session_service.purge_expired_sessions():
+            if isinstance(self.artifact_service, FileSystemArtifactService):
+                removed_versions += self.artifact_service.delete_session_artifacts(app_name, user_id, session_id)
+        if removed_versions:
+            logger.info(f"Removed {removed_versions} artifact versions of expired sessions.")
+
+    async def _purge_expired_sessions_periodically(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self._purge_expired_sessions)
+            except Exception as e:
+                logger.error(f"Purging expired sessions failed: {e}", exc_info=True)
+            await asyncio.sleep(SESSION_PURGE_INTERVAL_SECONDS)
+
+    async def _process_spreadsheet_upload(self, inline_data: dict, index: int, user_id: str, session_id: str) -> str:
+        """
+        Parses an uploaded spreadsheet off the event loop, stores the table as a CSV session
+        artifact and returns the compact description that replaces the file in the prompt.
+        """
+        try:
+            with tracer.span("upload.parse", mime_type=inline_data.get('mime_type')):
+                parsed = await self.blocking_executor.run(
+                    parse_spreadsheet_upload, inline_data.get('data') or "", inline_data.get('mime_type')
+                )
+        except UploadRejectedError as e:
+            logger.warning(f"Rejected uploaded spreadsheet: {e}")
+            return f"(System error: The uploaded file was not read. {e})"
+        except Exception as e:
+            logger.error(f"Failed to process uploaded spreadsheet: {e}", exc_info=True)
+            return "(System error: Could not read the uploaded file.)"
+
+        artifact_name = upload_artifact_name(inline_data.get('display_name') or inline_data.get('name'), index)
+        artifact_version = None
+        try:
+            artifact_version = await self.artifact_service.save_artifact(
+                app_name=self.app_name, user_id=user_id, session_id=session_id, filename=artifact_name,
+                artifact=genai_types.Part.from_bytes(data=parsed["csv"], mime_type="text/csv"),
+            )
+        except Exception as e:
+            # The prompt summary is still useful without the stored table.
+            logger.warning(f"Could not save uploaded spreadsheet as artifact '{artifact_name}': {e}")
+        return build_upload_prompt(parsed, artifact_name, artifact_version)
+
     def get_fast_api_app(self):
         """Creates and configures the FastAPI application instance."""
-        app = FastAPI(title="Data Agent Chatbot API")
+        @asynccontextmanager
+        async def lifespan(app: FastAPI):
+            # Warm the sidebar metadata so the first page load is served from memory.
+            self.table_metadata_service.start()
+            session_purger = asyncio.create_task(self._purge_expired_sessions_periodically())
+            yield
+            session_purger.cancel()
+            self.blocking_executor.shutdown()
+
+        app = FastAPI(title="Data Agent Chatbot API", lifespan=lifespan, default_response_class=FastJSONResponse)
 
         # --- API Routes ---
         @app.post("/api/run_sse")
-        async def agent_run_sse(req: AgentRunRequest):
-            """Handles chat requests with server-sent events (SSE)."""
+        async def agent_run_sse(req: AgentRunRequest, request: Request):
+            """
+            Handles chat requests with server-sent events (SSE).
+
+            Each ADK event is projected onto the fields the UI renders (tool responses are
+            reduced to their status and sizes), frames arriving within a short window are
+            coalesced, and the stream is gzip/brotli compressed when the client accepts it.
+            Progress events of the turn (model planning, query checks, BigQuery job state)
+            are sent as `progress` frames as soon as they happen, and model text is streamed
+            as `partial` frames. If the client disconnects, the turn is cancelled, including
+            the running BigQuery job.
+            """
             async def event_generator():
                 session_id = req.session_id
+                turn_start = time.time()
+                # Stops the turn, model calls and BigQuery jobs included, once the browser goes away.
+                disconnect_watcher = asyncio.create_task(cancel_on_disconnect(request, asyncio.current_task()))
                 try:
-                    if session_id:
-                        session = await self.session_service.get_session(app_name=req.app_name, user_id=req.user_id, session_id=session_id)
-                        if not session:
-                            session = await self.session_service.create_session(app_name=req.app_name, user_id=req.user_id)
-                            session_id = session.id
-                    else:
-                        session = await self.session_service.create_session(app_name=req.app_name, user_id=req.user_id)
-                        session_id = session.id
-
-                    session_event = json.dumps({'session_id': session_id})
-                    yield f"data: {session_event}\n\n"
-
-                    processed_parts = []
-                    for part_data in req.new_message.parts:
-                        if part_data.inline_data:
-                            mime_type = part_data.inline_data.get('mime_type')
-                            data_b64 = part_data.inline_data.get('data')
-
-                            excel_mimes = [
-                                'application/vnd.ms-excel',
-                                'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                            ]
-
-                            if mime_type in excel_mimes:
-                                try:
-                                    decoded_data = base64.b64decode(data_b64)
-                                    df = pd.read_excel(io.BytesIO(decoded_data))
-                                    csv_data = df.to_csv(index=False)
-                                    
-                                    # Replace the file part with a text part containing CSV data
-                                    processed_parts.append({
-                                        "text": f"The user uploaded an Excel file. Here is its content in CSV format:\n\n---\n{csv_data}\n---"
-                                    })
-                                    logger.info("Successfully converted an uploaded Excel file to CSV.")
-                                except Exception as e:
-                                    logger.error(f"Failed to process Excel file: {e}")
-                                    processed_parts.append({
-                                        "text": "(System error: Could not read the uploaded Excel file.)"
-                                    })
-                                continue # Move to the next part
-                        
-                        # If it's not an excel file or has no inline_data, add it as is
-                        processed_parts.append(part_data.model_dump(exclude_none=True))
-                    
-                    new_message = genai_types.Content(parts=processed_parts, role='user')
-
-                    async_generator = self.data_agent_runner.run_async(user_id=req.user_id, session_id=session_id, new_message=new_message)
-
-                    async for event in async_generator:
-                        event_dict = event.model_dump(exclude_none=True)
-                        logger.debug(f"Raw event from runner: {event_dict}")
-
-                        if event_dict.get('content'):
-                            for part in event_dict['content'].get('parts', []):
-                                if 'code_execution_result' in part and part['code_execution_result'].get('artifacts'):
-                                    artifact_delta = {
-                                        artifact_info.get('name'): str(artifact_info.get('version', 0))
-                                        for artifact_info in part['code_execution_result']['artifacts']
-                                        if artifact_info.get('name')
-                                    }
-                                    if artifact_delta:
-                                        signal_event = {"actions": {"artifact_delta": artifact_delta}}
-                                        logger.info(f"ARTIFACT DETECTED. Sending signal: {signal_event}")
-                                        yield f"data: {json.dumps(signal_event)}\n\n"
-
-                        sanitized_event = json.dumps(sanitize_for_json(event_dict))
-                        yield f"data: {sanitized_event}\n\n"
-
-                except Exception as e:
-                    logger.error(f"Error during agent execution: {e}", exc_info=True)
-                    error_event = json.dumps({'error': str(e)})
-                    yield f"data: {error_event}\n\n"
-
-            return StreamingResponse(event_generator(), media_type="text/event-stream")
+                    with tracer.start_trace("request", user_id=req.user_id) as trace:
+                        serialize_ns = 0
+                        frame_count = 0
+                        try:
+                            with tracer.span("session.lookup"):
+                                if session_id:
+                                    session = await self.session_service.get_session(app_name=req.app_name, user_id=req.user_id, session_id=session_id)
+                                    if not session:
+                                        session = await self.session_service.create_session(app_name=req.app_name, user_id=req.user_id)
+                                        session_id = session.id
+                                else:
+                                    session = await self.session_service.create_session(app_name=req.app_name, user_id=req.user_id)
+                                    session_id = session.id
+                            logger.info(f"Serving chat turn of session {session_id} (trace {trace['trace_id']}).")
+
+                            yield encode_frame({'session_id': session_id})
+                            yield encode_frame({'progress': {'stage': 'accepted', 'message': 'Reading the question'}})
+
+                            processed_parts = []
+                            for index, part_data in enumerate(req.new_message.parts):
+                                if part_data.inline_data and part_data.inline_data.get('mime_type') in SPREADSHEET_MIME_TYPES:
+                                    processed_parts.append({"text": await self._process_spreadsheet_upload(
+                                        part_data.inline_data, index, req.user_id, session_id
+                                    )})
+                                    continue
+
+                                # If it's not a spreadsheet or has no inline_data, add it as is
+                                processed_parts.append(part_data.model_dump(exclude_none=True))
+
+                            new_message = genai_types.Content(parts=processed_parts, role='user')
+
+                            async_generator = self.data_agent_runner.run_async(
+                                user_id=req.user_id, session_id=session_id, new_message=new_message, run_config=self.run_config
+                            )
+
+                            with progress_bus.subscribe(session_id) as progress_queue:
+                                async for kind, item in interleave_progress(async_generator, progress_queue):
+                                    if kind == "progress":
+                                        sse_stream_stats.record(frames=1)
+                                        yield encode_frame({'progress': item})
+                                        continue
+                                    sse_stream_stats.record(events=1)
+                                    serialize_start = time.perf_counter_ns()
+                                    payload = project_event(item)
+                                    frame = encode_frame(payload) if payload is not None else None
+                                    serialize_ns += time.perf_counter_ns() - serialize_start
+                                    if frame is None:
+                                        continue
+                                    if payload.get("actions"):
+                                        logger.info(f"ARTIFACT DETECTED. Sending signal: {payload['actions']}")
+                                    sse_stream_stats.record(frames=1)
+                                    frame_count += 1
+                                    yield frame
+
+                        except Exception as e:
+                            logger.error(f"Error during agent execution: {e}", exc_info=True)
+                            yield encode_frame({'error': str(e)})
+                        finally:
+                            # Projection and encoding time summed over the turn's events.
+                            end_ns = time.time_ns()
+                            tracer.record("sse.serialize", end_ns - serialize_ns, end_ns, frames=frame_count)
+                    turn_cancellation_stats.record_completed(time.time() - turn_start)
+                except (asyncio.CancelledError, GeneratorExit):
+                    elapsed = time.time() - turn_start
+                    saved = turn_cancellation_stats.record_cancelled(elapsed)
+                    logger.info(
+                        f"Client disconnected; cancelled the chat turn of session {session_id} after {elapsed:.1f} seconds "
+                        f"(about {saved:.1f} seconds of work saved)."
+                    )
+                    raise
+                finally:
+                    disconnect_watcher.cancel()
+
+            encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+            headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            if encoding:
+                headers["Content-Encoding"] = encoding
+                headers["Vary"] = "Accept-Encoding"
+            return StreamingResponse(
+                encode_stream(event_generator(), encoding), media_type="text/event-stream", headers=headers
+            )
 
         @app.get("/api/users/{user_id}/sessions/{session_id}/artifacts/{artifact_id}/versions/{version_id}")
-        async def get_artifact(user_id: str, session_id: str, artifact_id: str, version_id: int):
+        async def get_artifact(user_id: str, session_id: str, artifact_id: str, version_id: int, request: Request):
+            """
+            Serves one artifact version. A version never changes, so it is sent with a strong
+            ETag (the content hash) and a long-lived cache header, and a matching If-None-Match
+            is answered with 304. File-backed artifacts are streamed from disk, with Range support.
+            """
             try:
+                if isinstance(self.artifact_service, FileSystemArtifactService):
+                    artifact_file = await self.blocking_executor.run(
+                        self.artifact_service.resolve_artifact_file,
+                        self.app_name, user_id, session_id, artifact_id, version_id,
+                    )
+                    if not artifact_file:
+                        raise HTTPException(status_code=404, detail="Artifact not found")
+                    etag = f'"{artifact_file["sha256"]}"'
+                    if etag_matches(request.headers.get("if-none-match"), etag):
+                        return Response(status_code=304, headers=artifact_cache_headers(etag))
+                    return FileResponse(
+                        artifact_file["path"], media_type=artifact_file["mime_type"], headers=artifact_cache_headers(etag)
+                    )
+
                 artifact_part = await self.artifact_service.load_artifact(
                     app_name=self.app_name, user_id=user_id, session_id=session_id,
                     filename=artifact_id, version=version_id
                 )
-                if not artifact_part or not hasattr(artifact_part, 'inline_data'):
+                if not artifact_part or not artifact_part.inline_data:
                     raise HTTPException(status_code=404, detail="Artifact not found")
-                return Response(content=artifact_part.inline_data.data, media_type=artifact_part.inline_data.mime_type)
+                etag = f'"{hashlib.sha256(artifact_part.inline_data.data).hexdigest()}"'
+                if etag_matches(request.headers.get("if-none-match"), etag):
+                    return Response(status_code=304, headers=artifact_cache_headers(etag))
+                return Response(
+                    content=artifact_part.inline_data.data, media_type=artifact_part.inline_data.mime_type,
+                    headers=artifact_cache_headers(etag),
+                )
+            except HTTPException:
+                raise
             except Exception as e:
                 logger.error(f"Error serving artifact {artifact_id}: {e}", exc_info=True)
                 raise HTTPException(status_code=500, detail="Internal server error")
@@ -218,18 +343,9 @@ class DataAgentWebServer:
         
         @app.get("/api/tables")
         async def list_tables():
-            from backend.utils import get_table_ddl_strings, get_total_rows, get_total_column_count
             try:
-                tables = get_table_ddl_strings()
-                table_names = [table["table_name"] for table in tables]
-                total_rows = sum(get_total_rows(name) for name in table_names)
-                total_columns = get_total_column_count()
-                return JSONResponse(content={
-                    "tables": table_names,
-                    "num_tables": len(table_names),
-                    "total_columns": total_columns,
-                    "total_rows": total_rows
-                })
+                summary = await self.blocking_executor.run(self.table_metadata_service.get_summary)
+                return FastJSONResponse(content=summary)
             except Exception as e:
                 logger.error(f"Error listing tables: {e}", exc_info=True)
                 raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
@@ -237,16 +353,16 @@ class DataAgentWebServer:
         @app.get("/api/table_data")
         async def get_table_data(table_name: str):
             try:
-                from backend.utils import get_table_description, fetch_sample_data_for_single_table, json_serial
-                sample_rows = fetch_sample_data_for_single_table(table_name=table_name)
-                table_description = get_table_description(table_name)
+                from backend.utils import get_table_description, fetch_sample_data_for_single_table
+                sample_rows, table_description = await asyncio.gather(
+                    self.blocking_executor.run(fetch_sample_data_for_single_table, table_name=table_name),
+                    self.blocking_executor.run(get_table_description, table_name),
+                )
 
-                content = {
+                return FastJSONResponse(content={
                     "data": sample_rows,
                     "description": table_description
-                }
-                json_content = json.dumps(content, default=json_serial)
-                return Response(content=json_content, media_type="application/json")
+                })
 
             except Exception as e:
                 logger.error(f"Error getting table data for '{table_name}': {e}", exc_info=True)
@@ -256,15 +372,28 @@ class DataAgentWebServer:
         async def get_table_schema_endpoint(table_name: str):
             try:
                 from backend.utils import get_table_schema
-                schema_info = get_table_schema(table_name=table_name)
+                schema_info = await self.blocking_executor.run(get_table_schema, table_name=table_name)
                 if not schema_info:
                     raise HTTPException(status_code=404, detail="Schema not found or table does not exist.")
-                return JSONResponse(content={"schema": schema_info})
+                return FastJSONResponse(content={"schema": schema_info})
             except Exception as e:
                 logger.error(f"Error getting table schema for '{table_name}': {e}", exc_info=True)
                 raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
 
 
+        @app.get("/api/metrics")
+        async def get_metrics():
+            query_cache = get_query_result_cache()
+            return FastJSONResponse(content={
+                "blocking_executor": self.blocking_executor.metrics(),
+                "query_cache": query_cache.stats() if query_cache else None,
+                "sse": sse_stream_stats.snapshot(),
+                "session_store": self.session_service.stats() if hasattr(self.session_service, "stats") else None,
+                "stages": tracer.stage_stats(),
+                "bigquery_jobs": query_job_stats.snapshot(),
+                "turns": turn_cancellation_stats.snapshot(),
+            })
+
         @app.get("/api/code")
         async def get_code_file(filepath: str):
             if not filepath:
@@ -282,7 +411,7 @@ class DataAgentWebServer:
             try:
                 with open(abs_filepath, 'r') as f:
                     content = f.read()
-                return JSONResponse(content={"content": content})
+                return FastJSONResponse(content={"content": content})
             except FileNotFoundError:
                 logger.error(f"Code file not found: {filepath}")
                 raise HTTPException(status_code=404, detail="File not found")
@@ -309,8 +438,8 @@ class DataAgentWebServer:
 # --- Application Entry Point ---
 server = DataAgentWebServer(
     data_agent=root_agent,
-    session_service=InMemorySessionService(),
-    artifact_service=InMemoryArtifactService()
+    session_service=create_session_service(),
+    artifact_service=create_artifact_service()
 )
 app = server.get_fast_api_app()
 
@@ -0,0 +1,91 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+from backend.utils import get_table_summaries
+
+logger = logging.getLogger(__name__)
+
+TABLE_METADATA_TTL_SECONDS = float(os.getenv("TABLE_METADATA_TTL_SECONDS", "300"))
+
+
+class TableMetadataService:
+    """
+    Serves the dataset summary shown in the sidebar (`/api/tables`) from memory.
+
+    The summary is built from table metadata only. Once loaded, a request never waits
+    on BigQuery: when the snapshot is older than the TTL, the stale snapshot is served
+    and a single background refresh is started.
+    """
+    def __init__(self, loader: Callable[[], list[dict]] = get_table_summaries, ttl_seconds: float = TABLE_METADATA_TTL_SECONDS):
+        self._loader = loader
+        self.ttl_seconds = ttl_seconds
+        self._snapshot: Optional[dict] = None
+        self._loaded_at = 0.0
+        self._load_lock = threading.Lock()
+        self._refresh_state_lock = threading.Lock()
+        self._refresh_in_progress = False
+
+    def start(self) -> None:
+        """Warms the cache in the background so the first page load is already served from memory."""
+        self._refresh_in_background()
+
+    def get_summary(self) -> dict:
+        """Returns the cached summary, loading it synchronously only if nothing has been loaded yet."""
+        if self._snapshot is None:
+            with self._load_lock:
+                if self._snapshot is None:
+                    self._refresh()
+        elif time.time() - self._loaded_at > self.ttl_seconds:
+            self._refresh_in_background()
+        return self._snapshot
+
+    def invalidate(self) -> None:
+        """Marks the snapshot as stale so the next request triggers a refresh."""
+        self._loaded_at = 0.0
+
+    def _refresh(self) -> None:
+        start_time = time.time()
+        tables = self._loader()
+        self._snapshot = {
+            "tables": [table["table_name"] for table in tables],
+            "num_tables": len(tables),
+            "total_columns": sum(table["num_columns"] for table in tables),
+            "total_rows": sum(table["num_rows"] for table in tables),
+        }
+        self._loaded_at = time.time()
+        logger.info(f"Refreshed table metadata for {len(tables)} tables in {self._loaded_at - start_time:.2f} seconds.")
+
+    def _refresh_in_background(self) -> None:
+        with self._refresh_state_lock:
+            if self._refresh_in_progress:
+                return
+            self._refresh_in_progress = True
+        threading.Thread(target=self._background_refresh, name="table-metadata-refresh", daemon=True).start()
+
+    def _background_refresh(self) -> None:
+        try:
+            with self._load_lock:
+                self._refresh()
+        except Exception as e:
+            # Keep serving the previous snapshot; the next stale request retries.
+            logger.error(f"Background refresh of table metadata failed: {e}", exc_info=True)
+        finally:
+            with self._refresh_state_lock:
+                self._refresh_in_progress = False
@@ -0,0 +1,468 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import copy
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from google.adk.events.event import Event
+from google.adk.sessions.base_session_service import BaseSessionService, GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.in_memory_session_service import InMemorySessionService
+from google.adk.sessions.session import Session
+from google.adk.sessions.state import State
+
+logger = logging.getLogger(__name__)
+
+SESSION_STORE = os.getenv("SESSION_STORE", "sqlite").lower()
+# Sessions only survive a restart or redeploy if this is on persistent storage; the temp
+# dir default suits local development only.
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH") or os.path.join(tempfile.gettempdir(), "data_agent_sessions.sqlite")
+SESSION_CACHE_MAX_SESSIONS = int(os.getenv("SESSION_CACHE_MAX_SESSIONS", "256"))
+SESSION_CACHE_MAX_BYTES = int(os.getenv("SESSION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+SESSION_CACHE_IDLE_SECONDS = float(os.getenv("SESSION_CACHE_IDLE_SECONDS", "900"))
+SESSION_MAX_EVENTS = int(os.getenv("SESSION_MAX_EVENTS", "200"))
+SESSION_COMPACT_RESPONSE_MAX_BYTES = int(os.getenv("SESSION_COMPACT_RESPONSE_MAX_BYTES", "2048"))
+SESSION_RETENTION_DAYS = float(os.getenv("SESSION_RETENTION_DAYS", "30"))
+SESSION_PURGE_INTERVAL_SECONDS = float(os.getenv("SESSION_PURGE_INTERVAL_SECONDS", "3600"))
+
+_COMPACTED_NOTE = "Output of an earlier turn, shortened to save memory. Run the tool again if the full result is needed."
+
+
+def _split_state(state: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+    """Splits a state (or state delta) into app-, user- and session-scoped parts; temp keys are dropped."""
+    app_state, user_state, session_state = {}, {}, {}
+    for key, value in (state or {}).items():
+        if key.startswith(State.APP_PREFIX):
+            app_state[key[len(State.APP_PREFIX):]] = value
+        elif key.startswith(State.USER_PREFIX):
+            user_state[key[len(State.USER_PREFIX):]] = value
+        elif not key.startswith(State.TEMP_PREFIX):
+            session_state[key] = value
+    return app_state, user_state, session_state
+
+
+def _compact_response(response: Any) -> Any:
+    """Keeps the status and scalar fields of a tool response and replaces lists by their length."""
+    if not isinstance(response, dict):
+        return {"result": str(response)[:200], "note": _COMPACTED_NOTE}
+    compacted = {}
+    for key, value in response.items():
+        if isinstance(value, list):
+            compacted[f"{key}_count"] = len(value)
+        elif isinstance(value, dict):
+            compacted[key] = json.dumps(value, ensure_ascii=False, default=str)[:200]
+        elif isinstance(value, str):
+            compacted[key] = value[:200]
+        else:
+            compacted[key] = value
+    compacted["note"] = _COMPACTED_NOTE
+    return compacted
+
+
+def compact_event_data(data: dict) -> bool:
+    """
+    Shrinks large tool responses and drops inline file data from a serialized event of an
+    earlier turn. Returns whether anything changed.
+    """
+    changed = False
+    for part in ((data.get("content") or {}).get("parts") or []):
+        function_response = part.get("function_response")
+        if function_response and "response" in function_response:
+            size = len(json.dumps(function_response["response"], ensure_ascii=False, default=str))
+            if size > SESSION_COMPACT_RESPONSE_MAX_BYTES:
+                function_response["response"] = _compact_response(function_response["response"])
+                changed = True
+        inline_data = part.get("inline_data")
+        if inline_data:
+            part.pop("inline_data")
+            part["text"] = f"(An attached {inline_data.get('mime_type') or 'file'} was removed from the history.)"
+            changed = True
+    return changed
+
+
+class SQLiteSessionService(BaseSessionService):
+    """
+    Session service persisted in a local SQLite file, with a bounded in-memory cache.
+
+    - Every event is written as it is appended, so sessions survive restarts as long as
+      `db_path` is on persistent storage.
+    - Recently used sessions stay in an LRU cache bounded by session count, serialized size
+      and idle time. Each read checks the session's update time in the database, so a
+      session written by another process is reloaded instead of served stale.
+    - When a new turn starts, large tool responses and inline files of earlier turns are
+      compacted, and the oldest turns are dropped once a session exceeds `max_events`.
+      The current turn always keeps its full tool output.
+    """
+    def __init__(
+        self,
+        db_path: str = SESSION_DB_PATH,
+        cache_max_sessions: int = SESSION_CACHE_MAX_SESSIONS,
+        cache_max_bytes: int = SESSION_CACHE_MAX_BYTES,
+        cache_idle_seconds: float = SESSION_CACHE_IDLE_SECONDS,
+        max_events: int = SESSION_MAX_EVENTS,
+    ):
+        self.db_path = db_path
+        self.cache_max_sessions = cache_max_sessions
+        self.cache_max_bytes = cache_max_bytes
+        self.cache_idle_seconds = cache_idle_seconds
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                app_name TEXT NOT NULL, user_id TEXT NOT NULL, id TEXT NOT NULL,
+                state TEXT NOT NULL, update_time REAL NOT NULL,
+                PRIMARY KEY (app_name, user_id, id)
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                app_name TEXT NOT NULL, user_id TEXT NOT NULL, session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL, invocation_id TEXT, author TEXT,
+                compacted INTEGER NOT NULL DEFAULT 0, data TEXT NOT NULL,
+                PRIMARY KEY (app_name, user_id, session_id, seq)
+            );
+            CREATE TABLE IF NOT EXISTS app_states (app_name TEXT PRIMARY KEY, state TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS user_states (
+                app_name TEXT NOT NULL, user_id TEXT NOT NULL, state TEXT NOT NULL,
+                PRIMARY KEY (app_name, user_id)
+            );
+            """
+        )
+        # (app_name, user_id, session_id) -> {"session", "update_time", "bytes", "last_access"}
+        self._cache: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._cached_bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "compacted_events": 0, "dropped_events": 0}
+        logger.info(f"SQLite session store opened at {db_path}.")
+
+    # --- Public API ---
+
+    async def create_session(
+        self, *, app_name: str, user_id: str, state: Optional[Dict[str, Any]] = None, session_id: Optional[str] = None
+    ) -> Session:
+        return await asyncio.to_thread(self._create_session, app_name, user_id, state, session_id)
+
+    async def get_session(
+        self, *, app_name: str, user_id: str, session_id: str, config: Optional[GetSessionConfig] = None
+    ) -> Optional[Session]:
+        return await asyncio.to_thread(self._get_session, app_name, user_id, session_id, config)
+
+    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
+        return await asyncio.to_thread(self._list_sessions, app_name, user_id)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        await asyncio.to_thread(self._delete_session, app_name, user_id, session_id)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        event = await super().append_event(session, event)
+        session.last_update_time = event.timestamp
+        await asyncio.to_thread(self._persist_event, session, event)
+        return event
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "cached_sessions": len(self._cache),
+                "cached_bytes": self._cached_bytes,
+                "max_cached_bytes": self.cache_max_bytes,
+            }
+
+    # --- Storage ---
+
+    def _create_session(self, app_name, user_id, state, session_id) -> Session:
+        session_id = (session_id or "").strip() or uuid.uuid4().hex
+        app_delta, user_delta, session_state = _split_state(state)
+        update_time = time.time()
+        with self._lock:
+            try:
+                with self._transaction():
+                    self._connection.execute(
+                        "INSERT INTO sessions (app_name, user_id, id, state, update_time) VALUES (?, ?, ?, ?, ?)",
+                        (app_name, user_id, session_id, self._dumps(session_state), update_time),
+                    )
+                    self._merge_scoped_state(app_name, user_id, app_delta, user_delta)
+            except sqlite3.IntegrityError:
+                raise ValueError(f"Session with id {session_id} already exists.")
+            session = Session(
+                app_name=app_name, user_id=user_id, id=session_id, state=session_state, last_update_time=update_time
+            )
+            self._cache_put((app_name, user_id, session_id), session, update_time, 0)
+            self._evict()
+            return self._with_scoped_state(self._light_copy(session))
+
+    def _get_session(self, app_name, user_id, session_id, config) -> Optional[Session]:
+        key = (app_name, user_id, session_id)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT state, update_time FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?", key
+            ).fetchone()
+            if row is None:
+                self._cache_pop(key)
+                return None
+            entry = self._cache.get(key)
+            if entry is not None and entry["update_time"] == row[1]:
+                self._stats["hits"] += 1
+                entry["last_access"] = time.monotonic()
+                self._cache.move_to_end(key)
+                session = entry["session"]
+            else:
+                self._stats["misses"] += 1
+                session, size = self._load_session(key, json.loads(row[0]), row[1])
+                self._cache_put(key, session, row[1], size)
+            copied = self._light_copy(session)
+            self._evict()
+            copied = self._with_scoped_state(copied)
+
+        if config:
+            if config.num_recent_events is not None:
+                copied.events = copied.events[-config.num_recent_events:] if config.num_recent_events else []
+            if config.after_timestamp:
+                copied.events = [event for event in copied.events if event.timestamp >= config.after_timestamp]
+        return copied
+
+    def _list_sessions(self, app_name, user_id) -> ListSessionsResponse:
+        query = "SELECT user_id, id, state, update_time FROM sessions WHERE app_name = ?"
+        params = [app_name]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        with self._lock:
+            rows = self._connection.execute(query + " ORDER BY update_time, user_id, id", params).fetchall()
+            sessions = [
+                self._with_scoped_state(Session(
+                    app_name=app_name, user_id=row_user_id, id=row_id, state=json.loads(state), last_update_time=update_time
+                ))
+                for row_user_id, row_id, state, update_time in rows
+            ]
+        return ListSessionsResponse(sessions=sessions)
+
+    def _delete_session(self, app_name, user_id, session_id) -> None:
+        key = (app_name, user_id, session_id)
+        with self._lock:
+            with self._transaction():
+                self._connection.execute("DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?", key)
+                self._connection.execute("DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?", key)
+            self._cache_pop(key)
+
+    def _persist_event(self, session: Session, event: Event) -> None:
+        key = (session.app_name, session.user_id, session.id)
+        data = event.model_dump_json(exclude_none=True)
+        app_delta, user_delta, _ = _split_state(event.actions.state_delta if event.actions else None)
+        _, _, session_state = _split_state(session.state)
+        with self._lock:
+            with self._transaction():
+                history_changed = False
+                if event.author == "user":
+                    history_changed = self._compact_history(key, event.invocation_id)
+                next_seq = self._connection.execute(
+                    "SELECT COALESCE(MAX(seq), 0) + 1 FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?", key
+                ).fetchone()[0]
+                self._connection.execute(
+                    "INSERT INTO events (app_name, user_id, session_id, seq, invocation_id, author, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (*key, next_seq, event.invocation_id, event.author, data),
+                )
+                self._connection.execute(
+                    "UPDATE sessions SET state = ?, update_time = ? WHERE app_name = ? AND user_id = ? AND id = ?",
+                    (self._dumps(session_state), event.timestamp, *key),
+                )
+                self._merge_scoped_state(session.app_name, session.user_id, app_delta, user_delta)
+
+            entry = self._cache.get(key)
+            if history_changed or entry is None:
+                # Reloaded (compacted) on the next read.
+                self._cache_pop(key)
+            else:
+                cached = self._light_copy(session)
+                cached.state = session_state
+                self._cache_put(key, cached, event.timestamp, entry["bytes"] + len(data))
+                self._evict()
+
+    def _compact_history(self, key: tuple, invocation_id: Optional[str]) -> bool:
+        """Compacts the events of earlier turns and drops the oldest turns beyond `max_events`."""
+        changed = False
+        rows = self._connection.execute(
+            "SELECT seq, data FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? "
+            "AND compacted = 0 AND (invocation_id IS NULL OR invocation_id != ?)",
+            (*key, invocation_id or ""),
+        ).fetchall()
+        for seq, data in rows:
+            event_data = json.loads(data)
+            compacted = compact_event_data(event_data)
+            self._connection.execute(
+                "UPDATE events SET compacted = 1, data = ? WHERE app_name = ? AND user_id = ? AND session_id = ? AND seq = ?",
+                (json.dumps(event_data, ensure_ascii=False) if compacted else data, *key, seq),
+            )
+            if compacted:
+                self._stats["compacted_events"] += 1
+                changed = True
+
+        events = self._connection.execute(
+            "SELECT seq, author FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? ORDER BY seq", key
+        ).fetchall()
+        # Keep room for the event being appended, and cut only where a user turn starts so
+        # no tool response is left without its call.
+        if len(events) + 1 > self.max_events:
+            cut_seq = None
+            for index, (seq, author) in enumerate(events):
+                if author == "user" and len(events) - index + 1 <= self.max_events:
+                    cut_seq = seq
+                    break
+            if cut_seq is None:
+                cut_seq = events[-1][0] + 1
+            dropped = self._connection.execute(
+                "DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? AND seq < ?", (*key, cut_seq)
+            ).rowcount
+            self._stats["dropped_events"] += dropped
+            changed = changed or dropped > 0
+        return changed
+
+    def _load_session(self, key: tuple, state: dict, update_time: float) -> Tuple[Session, int]:
+        rows = self._connection.execute(
+            "SELECT data FROM events WHERE app_name = ? AND user_id = ? AND session_id = ? ORDER BY seq", key
+        ).fetchall()
+        events = [Event.model_validate_json(data) for (data,) in rows]
+        session = Session(
+            app_name=key[0], user_id=key[1], id=key[2], state=state, events=events, last_update_time=update_time
+        )
+        return session, sum(len(data) for (data,) in rows)
+
+    def _merge_scoped_state(self, app_name: str, user_id: str, app_delta: dict, user_delta: dict) -> None:
+        if app_delta:
+            row = self._connection.execute("SELECT state FROM app_states WHERE app_name = ?", (app_name,)).fetchone()
+            state = {**(json.loads(row[0]) if row else {}), **app_delta}
+            self._connection.execute(
+                "INSERT OR REPLACE INTO app_states (app_name, state) VALUES (?, ?)", (app_name, self._dumps(state))
+            )
+        if user_delta:
+            row = self._connection.execute(
+                "SELECT state FROM user_states WHERE app_name = ? AND user_id = ?", (app_name, user_id)
+            ).fetchone()
+            state = {**(json.loads(row[0]) if row else {}), **user_delta}
+            self._connection.execute(
+                "INSERT OR REPLACE INTO user_states (app_name, user_id, state) VALUES (?, ?, ?)",
+                (app_name, user_id, self._dumps(state)),
+            )
+
+    def _with_scoped_state(self, session: Session) -> Session:
+        """Adds the app- and user-scoped state, with their prefixes, to a session copy."""
+        app_row = self._connection.execute(
+            "SELECT state FROM app_states WHERE app_name = ?", (session.app_name,)
+        ).fetchone()
+        user_row = self._connection.execute(
+            "SELECT state FROM user_states WHERE app_name = ? AND user_id = ?", (session.app_name, session.user_id)
+        ).fetchone()
+        for key, value in (json.loads(app_row[0]) if app_row else {}).items():
+            session.state[State.APP_PREFIX + key] = value
+        for key, value in (json.loads(user_row[0]) if user_row else {}).items():
+            session.state[State.USER_PREFIX + key] = value
+        return session
+
+    def purge_expired_sessions(self) -> list:
+        """
+        Deletes the sessions idle for more than SESSION_RETENTION_DAYS and returns their
+        (app_name, user_id, session_id) keys, so their artifacts can be deleted too.
+        """
+        if SESSION_RETENTION_DAYS <= 0:
+            return []
+        cutoff = time.time() - SESSION_RETENTION_DAYS * 86400
+        with self._lock, self._transaction():
+            removed = [tuple(row) for row in self._connection.execute(
+                "SELECT app_name, user_id, id FROM sessions WHERE update_time < ?", (cutoff,)
+            ).fetchall()]
+            self._connection.execute(
+                "DELETE FROM events WHERE (app_name, user_id, session_id) IN "
+                "(SELECT app_name, user_id, id FROM sessions WHERE update_time < ?)",
+                (cutoff,),
+            )
+            self._connection.execute("DELETE FROM sessions WHERE update_time < ?", (cutoff,))
+            for key in removed:
+                self._cache_pop(key)
+        if removed:
+            logger.info(f"Removed {len(removed)} sessions idle for more than {SESSION_RETENTION_DAYS:g} days.")
+        return removed
+
+    # --- Cache ---
+
+    def _cache_put(self, key: tuple, session: Session, update_time: float, size: int) -> None:
+        self._cache_pop(key)
+        self._cache[key] = {"session": session, "update_time": update_time, "bytes": size, "last_access": time.monotonic()}
+        self._cached_bytes += size
+
+    def _cache_pop(self, key: tuple) -> None:
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self._cached_bytes -= entry["bytes"]
+
+    def _evict(self) -> None:
+        """Drops idle sessions, then least recently used ones while the cache is over its limits."""
+        now = time.monotonic()
+        while self._cache:
+            key, entry = next(iter(self._cache.items()))
+            over_limit = len(self._cache) > self.cache_max_sessions or self._cached_bytes > self.cache_max_bytes
+            if not over_limit and now - entry["last_access"] < self.cache_idle_seconds:
+                break
+            self._cache_pop(key)
+            self._stats["evictions"] += 1
+
+    # --- Helpers ---
+
+    def _transaction(self):
+        return _Transaction(self._connection)
+
+    @staticmethod
+    def _dumps(value: Any) -> str:
+        return json.dumps(value, ensure_ascii=False, default=str)
+
+    @staticmethod
+    def _light_copy(session: Session) -> Session:
+        """Copies the session with its own events list and state dict; events themselves are shared."""
+        copied = session.model_copy(deep=False)
+        copied.events = list(session.events)
+        copied.state = copy.copy(session.state)
+        return copied
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK on an autocommit sqlite3 connection."""
+    def __init__(self, connection: sqlite3.Connection):
+        self._connection = connection
+
+    def __enter__(self):
+        self._connection.execute("BEGIN IMMEDIATE")
+        return self._connection
+
+    def __exit__(self, exc_type, exc, tb):
+        self._connection.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def create_session_service() -> BaseSessionService:
+    """Returns the session service selected by SESSION_STORE ('sqlite' or 'memory')."""
+    if SESSION_STORE == "memory":
+        return InMemorySessionService()
+    return SQLiteSessionService()
@@ -0,0 +1,297 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import logging
+import os
+import threading
+import zlib
+from typing import Any, AsyncIterator, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available.
+    brotli = None
+
+from backend.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+SSE_COALESCE_WINDOW_MS = float(os.getenv("SSE_COALESCE_WINDOW_MS", "30"))
+SSE_COALESCE_MAX_BYTES = int(os.getenv("SSE_COALESCE_MAX_BYTES", str(16 * 1024)))
+SSE_COMPRESSION_ENABLED = os.getenv("SSE_COMPRESSION_ENABLED", "true").lower() not in ("0", "false", "no")
+SSE_FUNCTION_RESPONSE_MAX_CHARS = int(os.getenv("SSE_FUNCTION_RESPONSE_MAX_CHARS", "1000"))
+SSE_STREAM_MODEL_OUTPUT = os.getenv("SSE_STREAM_MODEL_OUTPUT", "true").lower() not in ("0", "false", "no")
+
+# Marks items put on a progress queue by `interleave_progress` itself, as opposed to progress events.
+_RUNNER_ITEM = object()
+
+
+def _truncate(text: str, max_chars: int = SSE_FUNCTION_RESPONSE_MAX_CHARS) -> str:
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... ({len(text) - max_chars} more characters)"
+
+
+def _summarize_function_response(response: Any) -> Any:
+    """
+    Keeps the small, informative fields of a tool response (status, errors, scalars) and
+    replaces lists such as query result rows by their length. The UI never renders rows.
+    """
+    if not isinstance(response, dict):
+        return _truncate(str(response))
+    summary = {}
+    for key, value in response.items():
+        if isinstance(value, (list, tuple)):
+            summary[f"{key}_count"] = len(value)
+        elif isinstance(value, dict):
+            summary[key] = _truncate(dumps(value).decode("utf-8"))
+        elif isinstance(value, str):
+            summary[key] = _truncate(value)
+        else:
+            summary[key] = value
+    return summary
+
+
+def project_event(event) -> Optional[dict]:
+    """
+    Projects an ADK event onto the fields the chat UI uses, reading them from the event
+    object instead of dumping the whole model.
+
+    Returns None for events with nothing to show (e.g. thought-only or state-only events).
+    """
+    payload = {}
+    parts = []
+    artifact_delta = {}
+    content = getattr(event, "content", None)
+    for part in (content.parts or []) if content else []:
+        if part.text and not getattr(part, "thought", False):
+            parts.append({"text": part.text})
+        elif part.function_call:
+            parts.append({"function_call": {"name": part.function_call.name, "args": part.function_call.args}})
+        elif part.function_response:
+            parts.append({"function_response": {
+                "name": part.function_response.name,
+                "response": _summarize_function_response(part.function_response.response),
+            }})
+        elif part.executable_code:
+            parts.append({"executable_code": {"code": part.executable_code.code}})
+        elif part.code_execution_result:
+            result = part.code_execution_result
+            outcome = getattr(result.outcome, "value", result.outcome)
+            parts.append({"code_execution_result": {
+                "outcome": str(outcome) if outcome is not None else None,
+                "output": _truncate(result.output or ""),
+            }})
+            for artifact_info in getattr(result, "artifacts", None) or []:
+                name = artifact_info.get("name") if isinstance(artifact_info, dict) else getattr(artifact_info, "name", None)
+                version = artifact_info.get("version", 0) if isinstance(artifact_info, dict) else getattr(artifact_info, "version", 0)
+                if name:
+                    artifact_delta[name] = str(version)
+    if parts:
+        payload["author"] = event.author
+        payload["content"] = {"role": content.role, "parts": parts}
+
+    actions = getattr(event, "actions", None)
+    if actions is not None and actions.artifact_delta:
+        artifact_delta.update({name: str(version) for name, version in actions.artifact_delta.items()})
+    if artifact_delta:
+        payload["actions"] = {"artifact_delta": artifact_delta}
+    if getattr(event, "error_message", None):
+        payload["error_code"] = event.error_code
+        payload["error_message"] = event.error_message
+    if payload and getattr(event, "partial", None):
+        payload["partial"] = True
+    return payload or None
+
+
+def encode_frame(payload: dict) -> bytes:
+    """Encodes one SSE `data:` frame."""
+    return b"data: " + dumps(payload) + b"\n\n"
+
+
+async def coalesce_frames(
+    frames: AsyncIterator[bytes],
+    window_seconds: float = SSE_COALESCE_WINDOW_MS / 1000,
+    max_bytes: int = SSE_COALESCE_MAX_BYTES,
+) -> AsyncIterator[bytes]:
+    """
+    Merges frames that arrive within `window_seconds` of the first buffered frame into one
+    chunk (at most about `max_bytes`), so bursts of small events cost one write, one
+    compression flush and one network packet. A frame is never held back longer than the window.
+
+    `frames` is consumed by a single producer task, so the generator producing them runs
+    (and sets context variables) in one task, which can be cancelled as a whole. Cancelling
+    it ends the stream after the frames produced so far.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    end_of_frames = object()
+
+    async def produce():
+        try:
+            async for frame in frames:
+                queue.put_nowait(frame)
+        except Exception as e:
+            queue.put_nowait(e)
+        finally:
+            queue.put_nowait(end_of_frames)
+
+    producer = asyncio.create_task(produce())
+    buffer = []
+    buffered_bytes = 0
+    deadline = 0.0
+    try:
+        while True:
+            timeout = max(0.0, deadline - loop.time()) if buffer else None
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield b"".join(buffer)
+                buffer, buffered_bytes = [], 0
+                continue
+            if item is end_of_frames:
+                break
+            if isinstance(item, Exception):
+                raise item
+            if not buffer:
+                deadline = loop.time() + window_seconds
+            buffer.append(item)
+            buffered_bytes += len(item)
+            if buffered_bytes >= max_bytes:
+                yield b"".join(buffer)
+                buffer, buffered_bytes = [], 0
+        if buffer:
+            yield b"".join(buffer)
+    finally:
+        if not producer.done():
+            producer.cancel()
+
+
+async def interleave_progress(events: AsyncIterator[Any], progress_queue: asyncio.Queue) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Yields ('event', event) for each runner event and ('progress', event) for each progress
+    event published to `progress_queue` (a ProgressBus subscription), in the order they occur.
+
+    The runner is consumed by one background task that feeds the same queue, so progress
+    reported while a tool or the model is still working reaches the client immediately, and
+    the runner's own context (e.g. its tracing spans) stays within a single task. The task is
+    cancelled when the stream is closed early.
+    """
+    async def consume_runner():
+        try:
+            async for event in events:
+                progress_queue.put_nowait((_RUNNER_ITEM, "event", event))
+        except Exception as e:
+            progress_queue.put_nowait((_RUNNER_ITEM, "error", e))
+        finally:
+            progress_queue.put_nowait((_RUNNER_ITEM, "end", None))
+
+    runner_task = asyncio.create_task(consume_runner())
+    try:
+        while True:
+            item = await progress_queue.get()
+            if not (isinstance(item, tuple) and item and item[0] is _RUNNER_ITEM):
+                yield "progress", item
+                continue
+            _, kind, value = item
+            if kind == "end":
+                break
+            if kind == "error":
+                raise value
+            yield "event", value
+    finally:
+        if not runner_task.done():
+            runner_task.cancel()
+
+
+class StreamCompressor:
+    """Incremental gzip or brotli compressor that flushes after every chunk so the browser can decode each one immediately."""
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=5)
+        else:
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Picks 'br' (if brotli is installed) or 'gzip' from an Accept-Encoding header, or None."""
+    if not SSE_COMPRESSION_ENABLED or not accept_encoding:
+        return None
+    accepted = {
+        token.split(";")[0].strip().lower()
+        for token in accept_encoding.split(",")
+        if not token.strip().endswith("q=0")
+    }
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class SSEStreamStats:
+    """Process-wide counters of what the chat streams sent, before and after projection and compression."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.streams = 0
+        self.events = 0
+        self.frames = 0
+        self.writes = 0
+        self.frame_bytes = 0
+        self.wire_bytes = 0
+
+    def record(self, **counts: int) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "streams": self.streams,
+                "events": self.events,
+                "frames": self.frames,
+                "writes": self.writes,
+                "frame_bytes": self.frame_bytes,
+                "wire_bytes": self.wire_bytes,
+            }
+
+
+sse_stream_stats = SSEStreamStats()
+
+
+async def encode_stream(frames: AsyncIterator[bytes], encoding: Optional[str]) -> AsyncIterator[bytes]:
+    """Coalesces frames and, if `encoding` is set, compresses the stream. Records wire bytes."""
+    compressor = StreamCompressor(encoding) if encoding else None
+    sse_stream_stats.record(streams=1)
+    async for chunk in coalesce_frames(frames):
+        data = compressor.compress(chunk) if compressor else chunk
+        sse_stream_stats.record(writes=1, frame_bytes=len(chunk), wire_bytes=len(data))
+        yield data
+    if compressor:
+        tail = compressor.finish()
+        sse_stream_stats.record(wire_bytes=len(tail))
+        yield tail
@@ -0,0 +1,232 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import binascii
+import io
+import logging
+import os
+import re
+import time
+from typing import Any, Iterable, List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_MAX_ROWS = int(os.getenv("UPLOAD_MAX_ROWS", "100000"))
+UPLOAD_PREVIEW_ROWS = int(os.getenv("UPLOAD_PREVIEW_ROWS", "5"))
+UPLOAD_PREVIEW_CELL_MAX_CHARS = int(os.getenv("UPLOAD_PREVIEW_CELL_MAX_CHARS", "80"))
+
+XLSX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+XLS_MIME_TYPE = "application/vnd.ms-excel"
+CSV_MIME_TYPE = "text/csv"
+SPREADSHEET_MIME_TYPES = (XLS_MIME_TYPE, XLSX_MIME_TYPE, CSV_MIME_TYPE)
+
+
+class UploadRejectedError(ValueError):
+    """Raised when an upload exceeds the configured limits; the message is shown to the model."""
+
+
+def _decode_base64(data_b64: str, max_bytes: int) -> bytes:
+    # Check the size implied by the encoded length before allocating the decoded copy.
+    estimated_bytes = len(data_b64) * 3 // 4
+    if estimated_bytes > max_bytes:
+        raise UploadRejectedError(
+            f"The file is {estimated_bytes / 1024 ** 2:.1f} MiB; uploads are limited to {max_bytes / 1024 ** 2:.1f} MiB."
+        )
+    try:
+        return base64.b64decode(data_b64, validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise UploadRejectedError(f"The file is not valid base64 data: {e}") from e
+
+
+def _column_names(header: Iterable[Any]) -> List[str]:
+    """Turns a header row into unique, non-empty column names."""
+    names = []
+    seen = set()
+    for index, value in enumerate(header):
+        name = str(value).strip() if value is not None and str(value).strip() else f"column_{index + 1}"
+        unique_name, suffix = name, 2
+        while unique_name in seen:
+            unique_name, suffix = f"{name}_{suffix}", suffix + 1
+        seen.add(unique_name)
+        names.append(unique_name)
+    return names
+
+
+def _read_xlsx_rows(data: bytes, max_rows: int) -> dict:
+    """
+    Reads the active sheet of an .xlsx workbook row by row in openpyxl's read-only mode,
+    which streams the sheet XML instead of building the whole workbook in memory.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        rows_iterator = sheet.iter_rows(values_only=True)
+        header = None
+        for row in rows_iterator:
+            if any(value is not None for value in row):
+                header = row
+                break
+        if header is None:
+            return {"sheet_name": sheet.title, "other_sheets": [], "columns": [], "rows": [], "truncated": False}
+        # Read-only sheets often report trailing empty columns; keep up to the last named one.
+        width = max(index for index, value in enumerate(header) if value is not None) + 1
+        rows = []
+        truncated = False
+        for row in rows_iterator:
+            if not any(value is not None for value in row[:width]):
+                continue
+            if len(rows) >= max_rows:
+                truncated = True
+                break
+            rows.append(tuple(row[:width]) + (None,) * (width - len(row[:width])))
+        return {
+            "sheet_name": sheet.title,
+            "other_sheets": [name for name in workbook.sheetnames if name != sheet.title],
+            "columns": _column_names(header[:width]),
+            "rows": rows,
+            "truncated": truncated,
+        }
+    finally:
+        workbook.close()
+
+
+def _read_xls_rows(data: bytes, max_rows: int) -> dict:
+    """Reads the first sheet of a legacy .xls workbook, which openpyxl cannot open, with at most `max_rows` rows."""
+    workbook = pd.ExcelFile(io.BytesIO(data))
+    frame = workbook.parse(workbook.sheet_names[0], nrows=max_rows + 1).dropna(how="all")
+    truncated = len(frame) > max_rows
+    frame = frame.head(max_rows)
+    return {
+        "sheet_name": workbook.sheet_names[0],
+        "other_sheets": workbook.sheet_names[1:],
+        "columns": _column_names(frame.columns),
+        "rows": list(frame.itertuples(index=False, name=None)),
+        "truncated": truncated,
+    }
+
+
+def _read_csv_rows(data: bytes, max_rows: int) -> dict:
+    """Reads at most `max_rows` rows of an uploaded CSV file."""
+    frame = pd.read_csv(io.BytesIO(data), nrows=max_rows + 1, encoding_errors="replace").dropna(how="all")
+    truncated = len(frame) > max_rows
+    frame = frame.head(max_rows)
+    return {
+        "sheet_name": None,
+        "other_sheets": [],
+        "columns": _column_names(frame.columns),
+        "rows": list(frame.itertuples(index=False, name=None)),
+        "truncated": truncated,
+    }
+
+
+def _column_type(values: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(values):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(values):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(values):
+        return "FLOAT"
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return "TIMESTAMP"
+    return "STRING"
+
+
+def _preview_cell(value: Any) -> Any:
+    if isinstance(value, str) and len(value) > UPLOAD_PREVIEW_CELL_MAX_CHARS:
+        return value[:UPLOAD_PREVIEW_CELL_MAX_CHARS] + "..."
+    return value
+
+
+def parse_spreadsheet_upload(
+    data_b64: str,
+    mime_type: str,
+    max_bytes: int = UPLOAD_MAX_BYTES,
+    max_rows: int = UPLOAD_MAX_ROWS,
+    preview_rows: int = UPLOAD_PREVIEW_ROWS,
+) -> dict:
+    """
+    Parses a base64-encoded Excel or CSV upload within the byte and row limits. Blocking; run it
+    on the blocking executor.
+
+    Returns:
+        A dictionary with 'csv' (the parsed sheet as UTF-8 CSV bytes), 'sheet_name',
+        'other_sheets', 'columns' (list of (name, type)), 'row_count', 'truncated',
+        'head_csv' (the first `preview_rows` rows as CSV text) and 'file_bytes'.
+
+    Raises:
+        UploadRejectedError: If the file exceeds `max_bytes` or is not valid base64.
+    """
+    start_time = time.time()
+    data = _decode_base64(data_b64, max_bytes)
+    if len(data) > max_bytes:
+        raise UploadRejectedError(
+            f"The file is {len(data) / 1024 ** 2:.1f} MiB; uploads are limited to {max_bytes / 1024 ** 2:.1f} MiB."
+        )
+    if mime_type == CSV_MIME_TYPE:
+        sheet = _read_csv_rows(data, max_rows)
+    elif mime_type == XLS_MIME_TYPE:
+        sheet = _read_xls_rows(data, max_rows)
+    else:
+        sheet = _read_xlsx_rows(data, max_rows)
+    frame = pd.DataFrame.from_records(sheet["rows"], columns=sheet["columns"]).infer_objects()
+    csv_text = frame.to_csv(index=False)
+    head_csv = frame.head(preview_rows).map(_preview_cell).to_csv(index=False)
+    logger.info(
+        f"Parsed uploaded spreadsheet: {len(data) / 1024:.0f} KiB, {len(frame)} rows x {len(frame.columns)} columns"
+        f"{' (truncated)' if sheet['truncated'] else ''} (Duration: {time.time() - start_time:.2f} seconds)"
+    )
+    return {
+        "csv": csv_text.encode("utf-8"),
+        "sheet_name": sheet["sheet_name"],
+        "other_sheets": sheet["other_sheets"],
+        "columns": [(column, _column_type(frame[column])) for column in frame.columns],
+        "row_count": len(frame),
+        "truncated": sheet["truncated"],
+        "head_csv": head_csv,
+        "file_bytes": len(data),
+    }
+
+
+def upload_artifact_name(display_name: Optional[str], index: int) -> str:
+    """Session artifact filename of an uploaded sheet, e.g. 'upload_sales_q3.csv'."""
+    stem = os.path.splitext(display_name or "")[0]
+    stem = re.sub(r"[^A-Za-z0-9_-]+", "_", stem).strip("_")[:60] or f"spreadsheet_{index + 1}"
+    return f"upload_{stem}.csv"
+
+
+def build_upload_prompt(parsed: dict, artifact_name: str, artifact_version: Optional[int], max_rows: int = UPLOAD_MAX_ROWS) -> str:
+    """Compact description of an uploaded sheet for the prompt: schema, row count and the first rows."""
+    source = f"an Excel file. Its sheet '{parsed['sheet_name']}'" if parsed["sheet_name"] else "a CSV file. It"
+    lines = [
+        f"The user uploaded {source} was read as a table of "
+        f"{parsed['row_count']} rows and {len(parsed['columns'])} columns.",
+    ]
+    if parsed["truncated"]:
+        lines.append(f"Only the first {max_rows} rows were read; the rest of the sheet was ignored.")
+    if parsed["other_sheets"]:
+        lines.append(f"Other sheets (not read): {', '.join(parsed['other_sheets'])}.")
+    if artifact_version is not None:
+        lines.append(
+            f"The full table is stored as the CSV session artifact '{artifact_name}' (version {artifact_version}) "
+            f"and can be queried with `execute_local_sql` as the table `{os.path.splitext(artifact_name)[0]}`."
+        )
+    lines.append("Columns: " + ", ".join(f"{name} ({column_type})" for name, column_type in parsed["columns"]))
+    lines.append(f"First rows (CSV):\n---\n{parsed['head_csv']}---")
+    return "\n".join(lines)
@@ -12,10 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import logging, os
+import logging, os, re
 from google.cloud import bigquery
-import datetime
 from dotenv import load_dotenv
+from data_agent.clients import get_bigquery_client
+from data_agent.fetch_pipeline import map_concurrently
+from data_agent.utils import ROLLUP_TABLE_SUFFIXES
 
 current_file_path = os.path.abspath(__file__)
 project_root = os.path.dirname(os.path.dirname(current_file_path))
@@ -26,18 +28,20 @@ load_dotenv(dotenv_path=abs_path)
 
 PROJECT_ID = os.getenv("BQ_DATA_PROJECT_ID", "")
 DATASET_NAME = os.getenv("BQ_DATASET_NAME", "")
+LOCATION = os.getenv("BQ_LOCATION", "")
+TABLE_NAMES = os.getenv("BQ_TABLE_NAMES", "").split(",") if os.getenv("BQ_TABLE_NAMES") else []
 
-def json_serial(obj):
-    """JSON serializer for objects not serializable by default json code"""
-    if isinstance(obj, (datetime.datetime, datetime.date)):
-        return obj.isoformat()
-    raise TypeError ("Type %s not serializable" % type(obj))
-
+# Tables derived from the agent's tables by the infrastructure scripts: rollups, the
+# layout migration's backup and the staging tables of CSV ingestion and embedding writes.
+_DERIVED_TABLE_PATTERN = re.compile(
+    "(?:" + "|".join(re.escape(suffix) for suffix in ROLLUP_TABLE_SUFFIXES) + r")$"
+    r"|_pre_partitioning_backup$|_partitioned_migration$|_(?:ingest|embedding)_staging_[0-9a-f]+$"
+)
 
 def get_table_description(table_name: str) -> str:
     """Fetches the description for a given table from BigQuery."""
     try:
-        client = bigquery.Client(project=PROJECT_ID)
+        client = get_bigquery_client(PROJECT_ID, LOCATION)
         table_id = f"{PROJECT_ID}.{DATASET_NAME}.{table_name}"
         table = client.get_table(table_id)
         return table.description or "No description available for this table."
@@ -49,7 +53,7 @@ def get_table_description(table_name: str) -> str:
 def get_table_schema(table_name: str) -> list[dict]:
     """Fetches the detailed schema (name, type, description) for a given table."""
     try:
-        client = bigquery.Client(project=PROJECT_ID)
+        client = get_bigquery_client(PROJECT_ID, LOCATION)
         table_id = f"{PROJECT_ID}.{DATASET_NAME}.{table_name}"
         table = client.get_table(table_id)
         schema_info = []
@@ -67,7 +71,7 @@ def get_table_schema(table_name: str) -> list[dict]:
 
 def get_table_ddl_strings() -> list[dict]:
     """Fetches the DDL strings for all base tables in the dataset."""
-    client = bigquery.Client(project=PROJECT_ID)
+    client = get_bigquery_client(PROJECT_ID, LOCATION)
     query = f"""
         SELECT table_name, ddl
         FROM `{PROJECT_ID}.{DATASET_NAME}.INFORMATION_SCHEMA.TABLES`
@@ -82,19 +86,18 @@ def get_table_ddl_strings() -> list[dict]:
         return []
 
 def get_total_rows(table_name: str) -> int:
-    """Fetches the total number of rows for a given table."""
-    client = bigquery.Client(project=PROJECT_ID)
-    query = f"SELECT COUNT(*) FROM `{PROJECT_ID}.{DATASET_NAME}.{table_name}`"
+    """Fetches the total number of rows for a given table from table metadata, without scanning it."""
+    client = get_bigquery_client(PROJECT_ID, LOCATION)
     try:
-        query_job = client.query(query)
-        return list(query_job.result())[0][0]
+        table = client.get_table(f"{PROJECT_ID}.{DATASET_NAME}.{table_name}")
+        return table.num_rows or 0
     except Exception as e:
         logging.error(f"Error fetching total rows for {table_name}: {e}")
         return 0
 
 def get_total_column_count() -> int:
     """Fetches the total number of columns across all tables."""
-    client = bigquery.Client(project=PROJECT_ID)
+    client = get_bigquery_client(PROJECT_ID, LOCATION)
     query = f"SELECT COUNT(*) FROM `{PROJECT_ID}.{DATASET_NAME}.INFORMATION_SCHEMA.COLUMNS`"
     try:
         query_job = client.query(query)
@@ -103,9 +106,37 @@ def get_total_column_count() -> int:
         logging.error(f"Error fetching total column count: {e}")
         return 0
 
+def get_table_summaries() -> list[dict]:
+    """
+    Fetches the name, row count and column count of the agent's tables: BQ_TABLE_NAMES, or
+    if unset every base table in the dataset except the derived rollup, backup and staging tables.
+    Everything is read from table metadata (`num_rows` and the schema), so no table is scanned.
+    """
+    client = get_bigquery_client(PROJECT_ID, LOCATION)
+    dataset_ref = bigquery.DatasetReference(PROJECT_ID, DATASET_NAME)
+    if TABLE_NAMES:
+        table_refs = [dataset_ref.table(table_name.strip()) for table_name in TABLE_NAMES]
+    else:
+        table_refs = [
+            table.reference for table in client.list_tables(dataset_ref)
+            if table.table_type == "TABLE" and not _DERIVED_TABLE_PATTERN.search(table.table_id)
+        ]
+    summaries = []
+    for table_ref, table, error in map_concurrently(client.get_table, table_refs):
+        if error is not None:
+            logging.error(f"Error fetching metadata for table {table_ref.table_id}: {error}")
+            continue
+        summaries.append({
+            "table_name": table.table_id,
+            "num_rows": table.num_rows or 0,
+            "num_columns": len(table.schema),
+            "last_modified": table.modified.isoformat() if table.modified else None,
+        })
+    return sorted(summaries, key=lambda summary: summary["table_name"])
+
 def fetch_sample_data_for_single_table(table_name: str, num_rows: int = 3) -> list[dict]:
     """Fetches a few sample rows from a specific table."""
-    client = bigquery.Client(project=PROJECT_ID)
+    client = get_bigquery_client(PROJECT_ID, LOCATION)
     full_table_name = f"{PROJECT_ID}.{DATASET_NAME}.{table_name}"
     try:
         rows_iterator = client.list_rows(full_table_name, max_results=num_rows)
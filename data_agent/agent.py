@@ -15,10 +15,13 @@
 import os
 from google.genai import types
 from google.adk.agents import Agent
-from .instructions import return_instructions_bigquery
+from .instructions import get_static_instruction, instruction_provider
 from dotenv import load_dotenv
-from .tools import get_bigquery_toolset
-from .callback import callback_after_tool, callback_before_agent, callback_after_model
+from .tools import BQ_CREDENTIALS_TYPE, execute_local_sql, execute_sql, get_bigquery_toolset, search_similar_posts
+from .callback import (
+    callback_after_agent, callback_after_model, callback_after_tool, callback_before_agent, callback_before_model,
+    callback_before_tool,
+)
 
 current_file_path = os.path.abspath(__file__)
 project_root = os.path.dirname(os.path.dirname(current_file_path))
@@ -27,17 +30,27 @@ abs_path = os.path.join(project_root, '.env')
 # Load environment variables from a .env file for local development
 load_dotenv(dotenv_path=abs_path)
 
-# Call the function to create the BigQueryToolset instance.
-bigquery_toolset = get_bigquery_toolset()
+# With per-user OAuth credentials, queries go through the BigQueryToolset, which runs the
+# OAuth flow. Otherwise `execute_sql` runs them as polled jobs that report their progress.
+if BQ_CREDENTIALS_TYPE == "OAUTH2":
+    sql_tool = get_bigquery_toolset()
+else:
+    sql_tool = execute_sql
+
+# Build the static instruction body once at startup so the first session does not pay for it.
+get_static_instruction()
 
 root_agent = Agent(
     model=os.getenv("DATA_AGENT_MODEL","gemini-2.5-flash"),
     name=os.getenv("AGENT_DISPLAY_NAME","Data_Agent"),
     description=os.getenv("AGENT_DESCRIPTION", "An agent that can answer questions about data in BigQuery."),
-    instruction=return_instructions_bigquery(),
+    instruction=instruction_provider,
     before_agent_callback=callback_before_agent,
+    after_agent_callback=callback_after_agent,
+    before_model_callback=callback_before_model,
+    before_tool_callback=callback_before_tool,
     after_tool_callback=callback_after_tool,
     after_model_callback=callback_after_model,
-    tools=[bigquery_toolset],
+    tools=[sql_tool, search_similar_posts, execute_local_sql],
     generate_content_config=types.GenerateContentConfig(temperature=0.001)
 )
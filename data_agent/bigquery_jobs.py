@@ -0,0 +1,209 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Optional
+
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+from .clients import get_bigquery_client
+from .query_guard import _format_bytes
+
+DISPLAY_NAME = os.getenv("AGENT_DISPLAY_NAME", "")
+LOCATION = os.getenv("BQ_LOCATION", "")
+BQ_JOB_POLL_SECONDS = float(os.getenv("BQ_JOB_POLL_SECONDS", "1.0"))
+BQ_MAX_QUERY_RESULT_ROWS = int(os.getenv("BQ_MAX_QUERY_RESULT_ROWS", "50"))
+
+# Set by the before-tool guard to the query it dry ran and the estimate it got, so the
+# job runner does not dry run the same query again. 'temp:' state is never persisted.
+DRY_RUN_STATE_KEY = "temp:query_dry_run"
+
+# First job state poll; the interval doubles up to BQ_JOB_POLL_SECONDS, so short queries
+# are picked up quickly and long ones are not polled more than once per interval.
+_FIRST_POLL_SECONDS = 0.1
+# A job cancelled while its insert request is still in flight is not found yet; retry this often.
+_CANCEL_ATTEMPTS = 3
+
+# --- Logging Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[..., None]
+
+
+class QueryJobStats:
+    """Process-wide counters of the query jobs run by `run_query_job`, including those cancelled mid-run."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.cancelled = 0
+        # Time the cancelled jobs had been running, and the bytes their dry runs estimated.
+        self.cancelled_job_seconds = 0.0
+        self.cancelled_estimated_bytes = 0
+
+    def record(self, **counts: Any) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "started": self.started,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "cancelled_job_seconds": round(self.cancelled_job_seconds, 2),
+                "cancelled_estimated_bytes": self.cancelled_estimated_bytes,
+            }
+
+
+query_job_stats = QueryJobStats()
+
+
+def _cancel_job(client: bigquery.Client, job_id: str) -> None:
+    for attempt in range(_CANCEL_ATTEMPTS):
+        try:
+            client.cancel_job(job_id, location=LOCATION or None)
+            logger.info(f"[{DISPLAY_NAME}] Cancelled query job {job_id}.")
+            return
+        except NotFound:
+            time.sleep(0.5 * (attempt + 1))
+        except Exception as e:
+            logger.warning(f"[{DISPLAY_NAME}] Could not cancel query job {job_id}: {e}")
+            return
+    logger.warning(f"[{DISPLAY_NAME}] Could not cancel query job {job_id}: the job was not found.")
+
+
+def _json_safe(value: Any) -> Any:
+    try:
+        json.dumps(value)
+    except (TypeError, ValueError, OverflowError):
+        return str(value)
+    return value
+
+
+def _fetch_rows(job: bigquery.QueryJob, max_rows: int) -> list:
+    return [
+        {key: _json_safe(value) for key, value in row.items()}
+        for row in job.result(max_results=max_rows)
+    ]
+
+
+def _cancel_in_background(client: bigquery.Client, job_id: str, start_time: float, estimated_bytes: Optional[int]) -> None:
+    """Cancels a job from a worker thread; the cancelled caller cannot await the request."""
+    elapsed = time.time() - start_time
+    logger.info(f"[{DISPLAY_NAME}] Query job {job_id} abandoned after {elapsed:.1f} seconds; cancelling it.")
+    query_job_stats.record(cancelled=1, cancelled_job_seconds=elapsed, cancelled_estimated_bytes=estimated_bytes or 0)
+    threading.Thread(target=_cancel_job, args=(client, job_id), name="bq-cancel", daemon=True).start()
+
+
+async def run_query_job(
+    sql: str,
+    project_id: str,
+    on_progress: Optional[ProgressCallback] = None,
+    estimated_bytes: Optional[int] = None,
+    max_rows: int = BQ_MAX_QUERY_RESULT_ROWS,
+    poll_seconds: float = BQ_JOB_POLL_SECONDS,
+) -> dict:
+    """
+    Runs a query as a BigQuery job without blocking the event loop, reporting its state.
+
+    The job is started in a worker thread and its state is polled, with `on_progress(stage,
+    message, **details)` called when it starts ('query_started'), while it runs
+    ('query_running', at most once per `poll_seconds`) and when it is done ('query_done').
+    If the calling task is cancelled (e.g. the user closed the chat), the BigQuery job is
+    cancelled through its job id, so an abandoned question stops using slots.
+
+    Returns:
+        The `execute_sql` response: 'status' and 'rows' (at most `max_rows`, with
+        'result_is_likely_truncated' when that limit was reached), or 'error_details'.
+    """
+    def notify(stage: str, message: str, **details) -> None:
+        if on_progress is not None:
+            on_progress(stage, message, **details)
+
+    start_time = time.time()
+    client = get_bigquery_client(project_id, LOCATION)
+    # The job id is chosen here, so the job can be cancelled even before the insert returns.
+    job_id = f"data_agent_{uuid.uuid4().hex}"
+    job_config = bigquery.QueryJobConfig(labels={"data-agent-tool": "execute_sql"})
+    query_job_stats.record(started=1)
+    try:
+        job = await asyncio.to_thread(client.query, sql, job_config=job_config, job_id=job_id)
+    except asyncio.CancelledError:
+        _cancel_in_background(client, job_id, start_time, estimated_bytes)
+        raise
+    except Exception as e:
+        logger.warning(f"[{DISPLAY_NAME}] Could not start the query job: {e}")
+        query_job_stats.record(failed=1)
+        return {"status": "ERROR", "error_details": str(e)}
+
+    estimate = f", about {_format_bytes(estimated_bytes)} to scan" if estimated_bytes is not None else ""
+    notify("query_started", f"Query running{estimate}", job_id=job.job_id, estimated_bytes_processed=estimated_bytes)
+
+    poll_interval = min(_FIRST_POLL_SECONDS, poll_seconds)
+    last_report = time.time()
+    try:
+        while not await asyncio.to_thread(job.done):
+            if time.time() - last_report >= poll_seconds:
+                last_report = time.time()
+                elapsed = last_report - start_time
+                notify(
+                    "query_running", f"Query running for {elapsed:.0f} seconds{estimate}",
+                    job_id=job.job_id, elapsed_seconds=round(elapsed, 1), slot_millis=job.slot_millis,
+                )
+            await asyncio.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, poll_seconds)
+        rows = await asyncio.to_thread(_fetch_rows, job, max_rows)
+    except asyncio.CancelledError:
+        if job.state != "DONE":
+            _cancel_in_background(client, job_id, start_time, estimated_bytes)
+        raise
+    except Exception as e:
+        logger.warning(f"[{DISPLAY_NAME}] Query job {job.job_id} failed: {e}")
+        query_job_stats.record(failed=1)
+        notify("query_failed", "Query failed", job_id=job.job_id)
+        return {"status": "ERROR", "error_details": str(e)}
+
+    duration = time.time() - start_time
+    bytes_processed = job.total_bytes_processed or 0
+    query_job_stats.record(succeeded=1)
+    logger.info(
+        f"[{DISPLAY_NAME}] Query job {job.job_id} returned {len(rows)} rows, processed "
+        f"{_format_bytes(bytes_processed)} (Duration: {duration:.2f} seconds)."
+    )
+    notify(
+        "query_done",
+        f"Query done: {len(rows)} rows, {_format_bytes(bytes_processed)} scanned in {duration:.1f} seconds",
+        job_id=job.job_id, row_count=len(rows), bytes_processed=bytes_processed,
+        cache_hit=job.cache_hit, elapsed_seconds=round(duration, 1),
+    )
+    result = {"status": "SUCCESS", "rows": rows}
+    if len(rows) == max_rows:
+        result["result_is_likely_truncated"] = True
+    return result
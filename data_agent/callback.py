@@ -19,11 +19,15 @@ from typing import Optional
 import json, logging
 from google.adk.agents.callback_context import CallbackContext
 from datetime import date
-from .instructions import return_instructions_bigquery
-from typing import Optional
-from google.adk.models import LlmResponse
-import copy
+from google.adk.models import LlmRequest, LlmResponse
+import asyncio, copy, os
 from google.genai import types
+from .bigquery_jobs import BQ_MAX_QUERY_RESULT_ROWS, DRY_RUN_STATE_KEY
+from .progress import publish_progress
+from .query_cache import get_query_result_cache
+from .query_guard import QUERY_GUARD_ENABLED, QUERY_RAW_ROW_LIMIT, guard_query, inject_limit
+from .result_handling import store_query_result, truncate_for_log
+from .tracing import traced_callback, tracer
 
 # --- Logging Configuration ---
 logging.basicConfig(
@@ -33,27 +37,150 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+DATA_PROJECT_ID = os.getenv("BQ_DATA_PROJECT_ID", "")
+# Whether `callback_before_tool` appended a LIMIT to the current 'execute_sql' query, so
+# `callback_after_tool` can tell the agent its result was capped.
+LIMIT_INJECTED_STATE_KEY = "temp:query_limit_injected"
+# The query result cache key computed by `callback_before_tool`, reused by
+# `callback_after_tool` to store the result without looking up the table versions again.
+QUERY_CACHE_STATE_KEY = "temp:query_cache_entry"
+
+def _agent_span_key(callback_context: CallbackContext) -> tuple:
+    return ("agent", callback_context.invocation_id, callback_context.agent_name)
+
+
+def _model_span_key(callback_context: CallbackContext) -> tuple:
+    return ("model", callback_context.invocation_id, callback_context.agent_name)
+
+
+def _tool_span_key(tool: BaseTool, tool_context: ToolContext) -> tuple:
+    return ("tool", tool_context.invocation_id, tool_context.function_call_id or tool.name)
+
+
+@traced_callback("callback.before_agent")
 def callback_before_agent(callback_context: CallbackContext) -> None:
     """
     Pre-processing callback executed before an agent is called.
 
-    At the start of a new session, this function dynamically gets the current date
-    and prepends it to the agent's instructions. This ensures the agent is always
-    aware of the current date.
+    At the start of a new session, this function stores the current date in the
+    session state. `instruction_provider` prepends it to the shared instruction,
+    so the agent is always aware of the current date without rebuilding the
+    instruction or mutating the shared agent.
+    It also opens the 'agent' span of the turn, closed by `callback_after_agent`.
     """
+    tracer.begin(
+        _agent_span_key(callback_context), "agent", callback_context.invocation_id, agent=callback_context.agent_name
+    )
 
     if "session_initialized" not in callback_context.state:
         callback_context.state["session_initialized"] = "true"
+        callback_context.state["date_today"] = date.today().isoformat()
+    return None
+
+
+def callback_after_agent(callback_context: CallbackContext) -> None:
+    """Closes the 'agent' span opened by `callback_before_agent`."""
+    tracer.end(_agent_span_key(callback_context))
+    return None
+
+
+def callback_before_model(callback_context: CallbackContext, llm_request: LlmRequest) -> None:
+    """
+    Opens the 'model' span of an LLM call; `callback_after_model` closes it on the final response.
+    It also reports whether the model is planning the answer or reading tool results.
+    """
+    tracer.begin(
+        _model_span_key(callback_context), "model", callback_context.invocation_id,
+        agent=callback_context.agent_name, model=llm_request.model,
+    )
+    last_content = llm_request.contents[-1] if llm_request.contents else None
+    if last_content and any(part.function_response for part in last_content.parts or []):
+        publish_progress(callback_context, "model", "Analyzing the results")
+    else:
+        publish_progress(callback_context, "model", "Planning the query")
+    return None
+
+
+@traced_callback("callback.before_tool")
+async def callback_before_tool(tool: BaseTool,
+                         args: Dict[str, Any],
+                         tool_context: ToolContext
+                         ) -> Optional[Dict]:
+    """
+    Pre-processing callback executed before a tool is called.
 
-        date_today = date.today()
+    For 'execute_sql', this function runs the pre-execution stages in order:
+    1. Injects a LIMIT into queries that return raw rows (the rewrite is applied to `args`,
+       and the response gets 'limit_injected').
+    2. Looks the query up in the query result cache. On a hit, the cached response is
+       returned and no BigQuery job is run. The key, whose table versions may need
+       `get_table` calls, is computed in a worker thread and kept in 'temp:' state for
+       `callback_after_tool` to store the result under.
+    3. Dry runs the query and returns a structured error instead of running it if it is
+       not read-only or exceeds the scan budget. The dry run runs in a worker thread; a
+       passing one is kept in 'temp:' state so `execute_sql` does not repeat it.
+    Each stage is reported to the chat stream as a progress event.
 
-        callback_context._invocation_context.agent.instruction = (
-                f""" today's date : {date_today} (UTC). """ + return_instructions_bigquery()
+    Args:
+        tool (BaseTool): The tool instance that is about to be called.
+        args (Dict[str, Any]): The arguments passed to the tool.
+        tool_context (ToolContext): The context containing agent and tool information.
+
+    When the tool will run, a 'tool.<name>' span is opened; `callback_after_tool` closes it.
+
+    Returns:
+        Optional[Dict]: The cached tool response, or None to run the tool.
+    """
+    if tool.name != "execute_sql" or not args.get("query"):
+        tracer.begin(_tool_span_key(tool, tool_context), f"tool.{tool.name}", tool_context.invocation_id)
+        publish_progress(tool_context, "tool", f"Running {tool.name}", tool=tool.name)
+        return None
+
+    if QUERY_GUARD_ENABLED:
+        args["query"], limit_injected = inject_limit(args["query"])
+        tool_context.state[LIMIT_INJECTED_STATE_KEY] = limit_injected
+        if limit_injected:
+            logger.info(f"[Before Tool] Injected LIMIT {QUERY_RAW_ROW_LIMIT} into a query returning raw rows.")
+
+    query_cache = get_query_result_cache()
+    tool_context.state[QUERY_CACHE_STATE_KEY] = None
+    if query_cache is not None:
+        # build_key reads the tables' last_modified times from BigQuery on a version cache miss.
+        cache_entry = await asyncio.to_thread(
+            query_cache.build_key, args["query"], args.get("project_id") or DATA_PROJECT_ID
         )
+        if cache_entry is not None:
+            cached_response = query_cache.get(cache_entry[0])
+            tool_context.state[QUERY_CACHE_STATE_KEY] = {
+                "query": args["query"],
+                "key": cache_entry[0],
+                "table_versions": cache_entry[1],
+                "cache_hit": cached_response is not None,
+            }
+            if cached_response is not None:
+                logger.info(f"[Before Tool] Serving 'execute_sql' from the query result cache. Stats: {query_cache.stats()}")
+                publish_progress(tool_context, "query_done", "Query result served from cache", cache_hit=True)
+                return cached_response
+
+    if QUERY_GUARD_ENABLED:
+        publish_progress(tool_context, "query_check", "Checking the query")
+        with tracer.span("bigquery.dry_run", tool_context.invocation_id):
+            guard_result = await asyncio.to_thread(guard_query, args["query"], args.get("project_id"))
+        if guard_result["error"] is not None:
+            logger.warning(f"[Before Tool] Rejected 'execute_sql' call: {guard_result['error']['error_details']}")
+            publish_progress(tool_context, "query_rejected", "Query rejected by the guard", error_type=guard_result["error"].get("error_type"))
+            return guard_result["error"]
+        if guard_result["statement_type"] == "SELECT":
+            tool_context.state[DRY_RUN_STATE_KEY] = {
+                "query": args["query"],
+                "estimated_bytes_processed": guard_result["estimated_bytes_processed"],
+            }
+    tracer.begin(_tool_span_key(tool, tool_context), f"tool.{tool.name}", tool_context.invocation_id)
     return None
 
 
-def callback_after_tool(tool: BaseTool, 
+@traced_callback("callback.after_tool")
+async def callback_after_tool(tool: BaseTool, 
                         args: Dict[str, Any], 
                         tool_context: ToolContext, 
                         tool_response: Dict
@@ -61,9 +188,13 @@ def callback_after_tool(tool: BaseTool,
     """
     Post-processing callback executed after a tool has been called.
 
-    If the executed tool was 'execute_sql', this function retrieves the query
-    result from the tool's response and saves it into the `tool_context.state`.
+    If the executed tool was 'execute_sql', this function stores a compact, size-bounded
+    summary of the query result in `tool_context.state['query_result']`. Results larger
+    than the summary preview are saved in full as a session artifact and can be read back
+    with `result_handling.load_query_result`.
     This makes the query result available to subsequent tools, specifically for the visualization agent to use.
+    'execute_local_sql' results are not stored, as they would replace the BigQuery rows
+    that `execute_local_sql` reads back as `last_query_result`.
 
     Args:
         tool (BaseTool): The tool instance that was called.
@@ -78,23 +209,69 @@ def callback_after_tool(tool: BaseTool,
     # Get the contextual information from CallbackContext
     agent_name = tool_context.agent_name
     tool_name = tool.name
+    tracer.end(
+        _tool_span_key(tool, tool_context),
+        status=tool_response.get("status") if isinstance(tool_response, dict) else None,
+    )
 
-    print(f"[After Tool] Tool call for tool '{tool_name}' in agent '{agent_name}' and args: {args}, tool_response: {tool_response}")
+    logger.info(
+        "[After Tool] %s",
+        truncate_for_log({
+            "tool": tool_name,
+            "agent": agent_name,
+            "args": args,
+            "status": tool_response.get("status") if isinstance(tool_response, dict) else None,
+            "row_count": len(tool_response.get("rows") or []) if isinstance(tool_response, dict) else None,
+        }),
+    )
+    logger.debug("[After Tool] tool_response: %s", truncate_for_log(tool_response))
+
+    if (
+        tool_name == "execute_sql"
+        and isinstance(tool_response, dict)
+        and tool_response.get("status") == "SUCCESS"
+        and tool_context.state.get(LIMIT_INJECTED_STATE_KEY)
+    ):
+        # execute_sql returns at most BQ_MAX_QUERY_RESULT_ROWS rows, whatever the injected LIMIT.
+        tool_response["limit_injected"] = True
+        tool_response["limit"] = min(QUERY_RAW_ROW_LIMIT, BQ_MAX_QUERY_RESULT_ROWS)
 
     if tool_name == "execute_sql" and "rows" in tool_response:
         query_result  = tool_response.get('rows',[])
-        tool_context.state['query_result'] = query_result
+        tool_context.state['query_result'] = await store_query_result(tool_context, query_result)
+
+    if tool_name == "execute_sql" and "rows" in tool_response:
+        query_cache = get_query_result_cache()
+        cache_entry = tool_context.state.get(QUERY_CACHE_STATE_KEY)
+        if (
+            query_cache is not None
+            and tool_response.get("status") == "SUCCESS"
+            and cache_entry
+            and not cache_entry["cache_hit"]
+            and cache_entry["query"] == args.get("query")
+        ):
+            query_cache.put(cache_entry["key"], tool_response, cache_entry["table_versions"])
 
     return None
 
 # --- Define the Callback Function ---
+@traced_callback("callback.after_model")
 def callback_after_model(
     callback_context: CallbackContext, llm_response: LlmResponse
 ) -> Optional[LlmResponse]:
     """
     After the model responds, this callback replaces any '~' characters
-    in the response text with '-'.
+    in the response text with '-', in streamed chunks and the final response alike.
+    It also closes the 'model' span on the final (non-partial) response.
     """
+    if not llm_response.partial:
+        usage = llm_response.usage_metadata
+        tracer.end(
+            _model_span_key(callback_context),
+            prompt_tokens=usage.prompt_token_count if usage else None,
+            output_tokens=usage.candidates_token_count if usage else None,
+        )
+
     if not (
         llm_response.content
         and llm_response.content.parts
@@ -111,9 +288,8 @@ def callback_after_model(
     modified_parts = [copy.deepcopy(part) for part in llm_response.content.parts]
     modified_parts[0].text = modified_text
 
-    new_response = LlmResponse(
-        content=types.Content(role="model", parts=modified_parts),
-        grounding_metadata=llm_response.grounding_metadata,
-    )
-
-    return new_response
\ No newline at end of file
+    # Copy the response so 'partial', 'turn_complete' and 'usage_metadata' are kept; a
+    # streamed chunk that lost 'partial' would be taken for the final response.
+    return llm_response.model_copy(
+        update={"content": types.Content(role="model", parts=modified_parts)}
+    )
\ No newline at end of file
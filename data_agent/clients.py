@@ -0,0 +1,116 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import threading
+from typing import Optional
+
+import google.auth
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import bigquery, dataplex_v1
+from google import genai
+from requests.adapters import HTTPAdapter
+
+DISPLAY_NAME = os.getenv("AGENT_DISPLAY_NAME", "")
+BQ_HTTP_POOL_SIZE = int(os.getenv("BQ_HTTP_POOL_SIZE", "32"))
+
+# --- Logging Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+# Process-wide registry. Clients are created lazily on first use and reused by every
+# helper and thread, so credential discovery and TLS handshakes happen once per
+# (project, location) instead of once per call.
+_registry_lock = threading.Lock()
+_default_credentials = None
+_bigquery_clients: dict[tuple[str, str], bigquery.Client] = {}
+_dataplex_catalog_client = None
+_genai_client = None
+
+
+def _get_default_credentials():
+    global _default_credentials
+    if _default_credentials is None:
+        _default_credentials = google.auth.default(scopes=bigquery.Client.SCOPE)
+    return _default_credentials
+
+
+def _create_bigquery_client(project: str, location: str) -> bigquery.Client:
+    credentials, default_project = _get_default_credentials()
+    # A single authorized session per client, with a connection pool large enough for
+    # the concurrent metadata fetches and backend endpoint calls that share it.
+    http_session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=BQ_HTTP_POOL_SIZE, pool_maxsize=BQ_HTTP_POOL_SIZE)
+    http_session.mount("https://", adapter)
+    http_session.mount("http://", adapter)
+    client = bigquery.Client(
+        project=project or default_project,
+        location=location or None,
+        credentials=credentials,
+        _http=http_session,
+    )
+    logger.info(
+        f"[{DISPLAY_NAME}] Created shared BigQuery client for project='{client.project}', "
+        f"location='{location or 'default'}' (pool size: {BQ_HTTP_POOL_SIZE})."
+    )
+    return client
+
+
+def get_bigquery_client(project: Optional[str] = None, location: Optional[str] = None) -> bigquery.Client:
+    """
+    Returns the shared BigQuery client for a project and location, creating it on first use.
+
+    Args:
+        project: The project ID. Defaults to the project of the application default credentials.
+        location: The default location for jobs run by the client.
+    Returns:
+        A thread-safe `bigquery.Client` that is reused for the lifetime of the process.
+    """
+    key = (project or "", location or "")
+    client = _bigquery_clients.get(key)
+    if client is None:
+        with _registry_lock:
+            client = _bigquery_clients.get(key)
+            if client is None:
+                client = _create_bigquery_client(project or "", location or "")
+                _bigquery_clients[key] = client
+    return client
+
+
+def get_dataplex_catalog_client() -> dataplex_v1.CatalogServiceClient:
+    """Returns the shared Dataplex catalog client, creating it on first use."""
+    global _dataplex_catalog_client
+    if _dataplex_catalog_client is None:
+        with _registry_lock:
+            if _dataplex_catalog_client is None:
+                _dataplex_catalog_client = dataplex_v1.CatalogServiceClient()
+    return _dataplex_catalog_client
+
+
+def get_genai_client() -> genai.Client:
+    """
+    Returns the shared Google Gen AI client, creating it on first use. It is configured from
+    the same environment as the agent model (GOOGLE_GENAI_USE_VERTEXAI, GOOGLE_CLOUD_PROJECT, ...).
+    """
+    global _genai_client
+    if _genai_client is None:
+        with _registry_lock:
+            if _genai_client is None:
+                _genai_client = genai.Client()
+    return _genai_client
@@ -0,0 +1,184 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+DISPLAY_NAME = os.getenv("AGENT_DISPLAY_NAME", "")
+METADATA_FETCH_MAX_WORKERS = int(os.getenv("METADATA_FETCH_MAX_WORKERS", "8"))
+METADATA_FETCH_TIMEOUT_SECONDS = float(os.getenv("METADATA_FETCH_TIMEOUT_SECONDS", "60"))
+
+# --- Logging Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+# Per-table calls (get_table, list_rows, get_entry) share one bounded pool. Tasks
+# submitted here never submit further tasks to it, so it cannot deadlock when a
+# top-level fetcher fans out while other fetchers are doing the same.
+_table_call_executor = None
+_table_call_executor_lock = threading.Lock()
+
+
+def _get_table_call_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _table_call_executor
+    if _table_call_executor is None:
+        with _table_call_executor_lock:
+            if _table_call_executor is None:
+                _table_call_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=METADATA_FETCH_MAX_WORKERS,
+                    thread_name_prefix="metadata-fetch",
+                )
+    return _table_call_executor
+
+
+class PartialFetchError(Exception):
+    """
+    Raised by a fetcher that got only part of its data, e.g. when some tables could not be read.
+
+    `run_fetchers` uses the partial value instead of the default and reports the fetch as
+    'partial', so callers can still tell that the result is incomplete.
+    """
+    def __init__(self, message: str, partial_value: Any):
+        super().__init__(message)
+        self.partial_value = partial_value
+
+
+def _timed_call(fn: Callable[[], Any]) -> tuple[Any, float, Exception | None]:
+    start_time = time.time()
+    try:
+        return fn(), time.time() - start_time, None
+    except Exception as e:
+        return None, time.time() - start_time, e
+
+
+def run_fetchers(
+    fetchers: dict[str, Callable[[], Any]],
+    defaults: dict[str, Any],
+    timeout: float = METADATA_FETCH_TIMEOUT_SECONDS,
+) -> tuple[dict[str, Any], dict[str, dict]]:
+    """
+    Runs independent metadata fetchers concurrently.
+
+    A fetcher that raises or does not finish within `timeout` seconds is replaced by its
+    default value, so one slow or failing source never blocks the others. A fetcher that
+    raises `PartialFetchError` keeps the partial value it carries.
+    Args:
+        fetchers: Mapping of fetch name to a zero-argument callable.
+        defaults: Mapping of fetch name to the value used when that fetch fails or times out.
+        timeout: Overall time budget in seconds shared by all fetchers.
+    Returns:
+        A tuple of (values, report). `values` maps each fetch name to its result or default.
+        `report` maps each fetch name to a dictionary with 'status' ('ok', 'partial', 'error'
+        or 'timeout'), 'duration' in seconds and 'error'.
+    """
+    start_time = time.time()
+    values: dict[str, Any] = {}
+    report: dict[str, dict] = {}
+    if not fetchers:
+        return values, report
+
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=len(fetchers), thread_name_prefix="instruction-fetch"
+    )
+    try:
+        futures = {
+            executor.submit(_timed_call, fetcher): name
+            for name, fetcher in fetchers.items()
+        }
+        done, not_done = concurrent.futures.wait(futures, timeout=timeout)
+
+        for future in done:
+            name = futures[future]
+            value, duration, error = future.result()
+            if error is None:
+                values[name] = value
+                report[name] = {"status": "ok", "duration": duration, "error": None}
+            elif isinstance(error, PartialFetchError):
+                logger.warning(f"[{DISPLAY_NAME}] Fetch '{name}' is incomplete. Error: {error}")
+                values[name] = error.partial_value
+                report[name] = {"status": "partial", "duration": duration, "error": str(error)}
+            else:
+                logger.error(
+                    f"[{DISPLAY_NAME}] Fetch '{name}' failed. Using default value. Error: {error}",
+                    exc_info=error,
+                )
+                values[name] = defaults.get(name)
+                report[name] = {"status": "error", "duration": duration, "error": str(error)}
+
+        for future in not_done:
+            name = futures[future]
+            future.cancel()
+            logger.warning(
+                f"[{DISPLAY_NAME}] Fetch '{name}' did not finish within {timeout:g} seconds. Using default value."
+            )
+            values[name] = defaults.get(name)
+            report[name] = {"status": "timeout", "duration": timeout, "error": "timeout"}
+    finally:
+        # Do not wait for timed out fetchers; their threads finish in the background.
+        executor.shutdown(wait=False)
+
+    duration = time.time() - start_time
+    timings = ", ".join(
+        f"{name}={result['duration']:.2f}s ({result['status']})"
+        for name, result in sorted(report.items(), key=lambda item: -item[1]["duration"])
+    )
+    logger.info(
+        f"[{DISPLAY_NAME}] --- Fetched {len(fetchers)} metadata sources concurrently "
+        f"(Duration: {duration:.2f} seconds): {timings} ---"
+    )
+    return values, report
+
+
+def map_concurrently(
+    fn: Callable[[Any], Any],
+    items: Iterable[Any],
+    timeout: float = METADATA_FETCH_TIMEOUT_SECONDS,
+) -> list[tuple[Any, Any, Exception | None]]:
+    """
+    Applies `fn` to every item on the shared bounded pool, e.g. one `get_table` call per table.
+
+    Args:
+        fn: A single-argument callable.
+        items: The items to process.
+        timeout: Time budget in seconds for all items together.
+    Returns:
+        A list of (item, result, error) tuples in the original item order. `result` is None
+        and `error` is set when the call raised or did not finish in time.
+    """
+    items = list(items)
+    if not items:
+        return []
+    executor = _get_table_call_executor()
+    futures = [executor.submit(fn, item) for item in items]
+    concurrent.futures.wait(futures, timeout=timeout)
+
+    results = []
+    for item, future in zip(items, futures):
+        if not future.done():
+            future.cancel()
+            results.append((item, None, TimeoutError(f"Call did not finish within {timeout:g} seconds")))
+            continue
+        try:
+            results.append((item, future.result(), None))
+        except Exception as e:
+            results.append((item, None, e))
+    return results
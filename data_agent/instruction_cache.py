@@ -0,0 +1,157 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Optional
+
+DISPLAY_NAME = os.getenv("AGENT_DISPLAY_NAME", "")
+
+# Bump this whenever the layout of the assembled instruction changes so that
+# entries written by an older version of the builder are never served.
+INSTRUCTION_CACHE_VERSION = 1
+INSTRUCTION_CACHE_ENABLED = os.getenv("INSTRUCTION_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+INSTRUCTION_CACHE_DIR = os.getenv("INSTRUCTION_CACHE_DIR") or os.path.join(
+    tempfile.gettempdir(), "data_agent_instruction_cache"
+)
+INSTRUCTION_CACHE_TTL_SECONDS = int(os.getenv("INSTRUCTION_CACHE_TTL_SECONDS", "86400"))
+
+# --- Logging Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+def hash_file(path: str) -> str:
+    """Returns the SHA-256 hex digest of a file's content, or an empty string if it cannot be read."""
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return ""
+
+
+def compute_cache_key(key_material: dict) -> str:
+    """
+    Computes the cache key for an assembled instruction.
+
+    Args:
+        key_material: Everything the instruction depends on, e.g. dataset, table list,
+            YAML content hashes and table `last_modified` times. Must be JSON serializable.
+    Returns:
+        A SHA-256 hex digest identifying the instruction version.
+    """
+    payload = json.dumps(
+        {"version": INSTRUCTION_CACHE_VERSION, **key_material},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _cache_file_path(cache_key: str) -> str:
+    return os.path.join(INSTRUCTION_CACHE_DIR, f"{cache_key}.json")
+
+
+def load_cached_instruction(cache_key: str) -> Optional[str]:
+    """
+    Returns the cached instruction for `cache_key`, or None on a miss.
+    Entries older than INSTRUCTION_CACHE_TTL_SECONDS are treated as misses and removed.
+    """
+    if not INSTRUCTION_CACHE_ENABLED:
+        return None
+    cache_file = _cache_file_path(cache_key)
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"[{DISPLAY_NAME}] Ignoring unreadable instruction cache entry {cache_file}: {e}")
+        return None
+
+    age = time.time() - entry.get("created_at", 0)
+    if age > INSTRUCTION_CACHE_TTL_SECONDS:
+        logger.info(f"[{DISPLAY_NAME}] Instruction cache entry expired (age: {age:.0f} seconds).")
+        _remove_file(cache_file)
+        return None
+
+    logger.info(f"[{DISPLAY_NAME}] --- Instruction cache hit (age: {age:.0f} seconds) ---")
+    return entry.get("instruction")
+
+
+def store_cached_instruction(cache_key: str, instruction: str, key_material: dict) -> None:
+    """
+    Writes the assembled instruction to the cache and prunes expired entries.
+    The file is written atomically so concurrent readers never see a partial entry.
+    """
+    if not INSTRUCTION_CACHE_ENABLED:
+        return
+    try:
+        os.makedirs(INSTRUCTION_CACHE_DIR, exist_ok=True)
+        entry = {
+            "version": INSTRUCTION_CACHE_VERSION,
+            "created_at": time.time(),
+            "key_material": key_material,
+            "instruction": instruction,
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=INSTRUCTION_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, _cache_file_path(cache_key))
+    except OSError as e:
+        logger.warning(f"[{DISPLAY_NAME}] Could not write instruction cache entry: {e}")
+        return
+    _prune_expired_entries()
+
+
+def invalidate_instruction_cache() -> int:
+    """
+    Removes every cached instruction, forcing the next call to rebuild it from BigQuery and Dataplex.
+
+    Returns:
+        The number of cache entries removed.
+    """
+    removed = 0
+    for cache_file in glob.glob(os.path.join(INSTRUCTION_CACHE_DIR, "*.json")):
+        if _remove_file(cache_file):
+            removed += 1
+    logger.info(f"[{DISPLAY_NAME}] Invalidated {removed} instruction cache entries.")
+    return removed
+
+
+def _prune_expired_entries() -> None:
+    now = time.time()
+    for cache_file in glob.glob(os.path.join(INSTRUCTION_CACHE_DIR, "*.json")):
+        try:
+            if now - os.path.getmtime(cache_file) > INSTRUCTION_CACHE_TTL_SECONDS:
+                _remove_file(cache_file)
+        except OSError:
+            continue
+
+
+def _remove_file(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
@@ -16,14 +16,30 @@ import datetime
 import json
 import logging
 import os
+import threading
+import time
 import yaml
+from google.adk.agents.readonly_context import ReadonlyContext
 
+from .fetch_pipeline import run_fetchers
+from .instruction_cache import (
+    compute_cache_key,
+    hash_file,
+    load_cached_instruction,
+    store_cached_instruction,
+)
 from .utils import (
+    ASPECT_TYPES,
+    DATA_PROFILES_TABLE_FULL_ID,
+    FEW_SHOT_EXAMPLES_TABLE_FULL_ID,
     fetch_bigquery_data_profiles,
     fetch_dataset_description,
     fetch_few_shot_examples,
+    fetch_rollup_tables,
     fetch_sample_data_for_tables,
     fetch_table_entry_metadata,
+    fetch_table_last_modified,
+    get_rollup_table_info,
     get_table_info,
 )
 
@@ -31,6 +47,13 @@ DATASET_NAME = os.getenv("BQ_DATASET_NAME", "")
 PROJECT_ID = os.getenv("BQ_DATA_PROJECT_ID", "")
 DISPLAY_NAME = os.getenv("AGENT_DISPLAY_NAME", "")
 TABLE_NAMES = os.getenv("BQ_TABLE_NAMES", "").split(",") if os.getenv("BQ_TABLE_NAMES") else []
+# How often a running process re-checks the instruction cache key, picking up schema,
+# data profile and YAML changes without a restart.
+INSTRUCTION_REFRESH_SECONDS = float(os.getenv("INSTRUCTION_REFRESH_SECONDS", "300"))
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SYS_YAML_FILE_PATH = os.path.join(SCRIPT_DIR, "system_instructions.yaml")
+CUST_YAML_FILE_PATH = os.path.join(SCRIPT_DIR, "custom_instructions.yaml")
 
 
 # --- Logging Configuration ---
@@ -49,19 +72,184 @@ def json_serial_default(obj):
     raise TypeError(f"Type {type(obj)} not serializable")
 
 
-def return_instructions_bigquery() -> str:
+_static_instruction = None
+_static_instruction_checked_at = 0.0
+_static_instruction_lock = threading.Lock()
+_refresh_state_lock = threading.Lock()
+_refresh_in_progress = False
+
+
+def get_static_instruction() -> str:
+    """
+    Returns the static instruction body. It is built once per process; afterwards, every
+    INSTRUCTION_REFRESH_SECONDS a background thread re-checks the cache key and swaps in
+    the new instruction if anything it depends on changed, while callers keep getting
+    the current one.
+    Every session shares this string; per-session fields are added by `instruction_provider`.
+    """
+    global _static_instruction, _static_instruction_checked_at
+    if _static_instruction is None:
+        with _static_instruction_lock:
+            if _static_instruction is None:
+                _static_instruction = return_instructions_bigquery()
+                _static_instruction_checked_at = time.time()
+    elif time.time() - _static_instruction_checked_at > INSTRUCTION_REFRESH_SECONDS:
+        _refresh_static_instruction_in_background()
+    return _static_instruction
+
+
+def _refresh_static_instruction_in_background() -> None:
+    global _refresh_in_progress
+    with _refresh_state_lock:
+        if _refresh_in_progress:
+            return
+        _refresh_in_progress = True
+    threading.Thread(target=_refresh_static_instruction, name="instruction-refresh", daemon=True).start()
+
+
+def _refresh_static_instruction() -> None:
+    global _static_instruction, _static_instruction_checked_at, _refresh_in_progress
+    try:
+        instruction = return_instructions_bigquery()
+        if instruction != _static_instruction:
+            logger.info(f"[{DISPLAY_NAME}] --- Instruction changed; serving the rebuilt instruction ---")
+            _static_instruction = instruction
+    except Exception as e:
+        logger.error(f"[{DISPLAY_NAME}] Instruction refresh failed: {e}", exc_info=True)
+    finally:
+        _static_instruction_checked_at = time.time()
+        with _refresh_state_lock:
+            _refresh_in_progress = False
+
+
+def instruction_provider(context: ReadonlyContext) -> str:
+    """
+    Instruction provider for the root agent.
+
+    Prepends the per-session fields stored in session state by `callback_before_agent`
+    (currently today's date) to the shared static instruction body. This is evaluated on
+    every model call, so it must stay cheap: no metadata is fetched here, and the
+    periodic re-check of the instruction runs in a background thread.
+    """
+    date_today = context.state.get("date_today") or datetime.date.today().isoformat()
+    return f""" today's date : {date_today} (UTC). """ + get_static_instruction()
+
+
+def return_instructions_bigquery(use_cache: bool = True) -> str:
+    """
+    Returns the assembled system instruction, served from the local instruction cache
+    when nothing it depends on has changed.
+
+    The cache key covers the dataset, the table list, the configured aspect types and
+    profile/few-shot tables, the content of both YAML files, the `last_modified` time
+    of every table involved and which rollup tables exist, so a schema or data change
+    produces a new entry. If any of those versions cannot be read, the cache is bypassed.
+    Args:
+        use_cache: Set to False to bypass the cache and always rebuild the instruction.
+    """
+    if not use_cache:
+        return build_instructions_bigquery()
+
+    versions, versions_report = run_fetchers(
+        {
+            "tables_last_modified": lambda: fetch_table_last_modified(
+                [DATA_PROFILES_TABLE_FULL_ID, FEW_SHOT_EXAMPLES_TABLE_FULL_ID]
+            ),
+            "rollup_tables": lambda: sorted(
+                table_obj.full_table_id for table_obj in fetch_rollup_tables()
+            ),
+        },
+        defaults={"tables_last_modified": {}, "rollup_tables": []},
+    )
+    key_material = {
+        "project_id": PROJECT_ID,
+        "dataset_name": DATASET_NAME,
+        "table_names": sorted(TABLE_NAMES),
+        "aspect_types": sorted(ASPECT_TYPES),
+        "data_profiles_table": DATA_PROFILES_TABLE_FULL_ID,
+        "few_shot_examples_table": FEW_SHOT_EXAMPLES_TABLE_FULL_ID,
+        "system_instructions_sha256": hash_file(SYS_YAML_FILE_PATH),
+        "custom_instructions_sha256": hash_file(CUST_YAML_FILE_PATH),
+        "tables_last_modified": versions["tables_last_modified"],
+        "rollup_tables": versions["rollup_tables"],
+    }
+    # Without every version the key cannot tell whether a cached entry is current. A rollup
+    # lookup that failed reports an error here rather than an empty list of rollups.
+    unknown_versions = [name for name, result in versions_report.items() if result["status"] != "ok"] + [
+        table_id for table_id, last_modified in versions["tables_last_modified"].items() if last_modified is None
+    ]
+    if unknown_versions:
+        logger.warning(
+            f"[{DISPLAY_NAME}] Bypassing the instruction cache; could not read the version of: "
+            f"{', '.join(sorted(unknown_versions))}."
+        )
+        return build_instructions_bigquery()
+
+    cache_key = compute_cache_key(key_material)
+    cached_instruction = load_cached_instruction(cache_key)
+    if cached_instruction is not None:
+        return cached_instruction
+
+    final_instruction, failed_sources = _build_instructions_bigquery()
+    if failed_sources:
+        # A degraded instruction is served but not cached, so the next build retries the sources.
+        logger.warning(
+            f"[{DISPLAY_NAME}] Not caching the instruction; these sources failed, timed out or are incomplete: "
+            f"{', '.join(sorted(failed_sources))}."
+        )
+    else:
+        store_cached_instruction(cache_key, final_instruction, key_material)
+    return final_instruction
+
+
+def build_instructions_bigquery() -> str:
     """
     Fetches table metadata, data profiles (and conditionally sample data),
     formats them, and injects them into the main instruction template.
+    All metadata sources are fetched concurrently; a source that fails or times out
+    falls back to its "not available" text.
+    """
+    return _build_instructions_bigquery()[0]
+
+
+def _build_instructions_bigquery() -> tuple[str, list[str]]:
+    """
+    Builds the instruction; returns it with the names of the sources that failed, timed out
+    or were only partly fetched.
     """
-    dataset_description = fetch_dataset_description()
+    fetchers = {
+        "dataset_description": fetch_dataset_description,
+        "table_aspects": fetch_table_entry_metadata,
+        "table_metadata": get_table_info,
+        "data_profiles": fetch_bigquery_data_profiles,
+        "few_shot_examples": fetch_few_shot_examples,
+        "rollup_tables": get_rollup_table_info,
+    }
+    if not DATA_PROFILES_TABLE_FULL_ID:
+        # Profiles cannot be found without a profiles table, so the sample data is
+        # known to be needed and can be fetched alongside everything else.
+        fetchers["sample_data"] = lambda: fetch_sample_data_for_tables(num_rows=3)
+    fetched, report = run_fetchers(
+        fetchers,
+        defaults={
+            "dataset_description": "",
+            "table_aspects": [],
+            "table_metadata": "",
+            "data_profiles": [],
+            "few_shot_examples": [],
+            "rollup_tables": "",
+            "sample_data": [],
+        },
+    )
+
+    dataset_description = fetched["dataset_description"]
     dataset_description_string_for_prompt = (
         dataset_description
         if dataset_description
         else "Dataset description is not available."
     )
 
-    table_aspects_raw = fetch_table_entry_metadata()
+    table_aspects_raw = fetched["table_aspects"]
     if not table_aspects_raw:
         table_aspects_string_for_prompt = "Table aspects information is not available."
     else:
@@ -83,13 +271,13 @@ def return_instructions_bigquery() -> str:
                 )
         table_aspects_string_for_prompt = "\n\n---\n\n".join(formatted_metadata)
 
-    table_metadata_raw = get_table_info()
+    table_metadata_raw = fetched["table_metadata"]
     if not table_metadata_raw:
         table_metadata_string_for_prompt = "Table metadata information is not available."
     else:
         table_metadata_string_for_prompt = table_metadata_raw
 
-    data_profiles_raw = fetch_bigquery_data_profiles()
+    data_profiles_raw = fetched["data_profiles"]
     if data_profiles_raw:
         formatted_profiles = []
         for profile in data_profiles_raw:
@@ -114,7 +302,14 @@ def return_instructions_bigquery() -> str:
             f"[{DISPLAY_NAME}] Data profiles not found. Attempting to fetch sample data..."
         )
         data_profiles_string_for_prompt = "Data profile information is not available. Please refer to the sample data below."
-        sample_data_raw = fetch_sample_data_for_tables(num_rows=3)
+        if "sample_data" not in fetched:
+            sample_data, sample_data_report = run_fetchers(
+                {"sample_data": lambda: fetch_sample_data_for_tables(num_rows=3)},
+                defaults={"sample_data": []},
+            )
+            fetched.update(sample_data)
+            report.update(sample_data_report)
+        sample_data_raw = fetched["sample_data"]
         if sample_data_raw:
             formatted_samples = []
             for item in sample_data_raw:
@@ -140,19 +335,21 @@ def return_instructions_bigquery() -> str:
             )
             samples_string_for_prompt = f"Could not fetch sample data for the target scope: {PROJECT_ID}.{DATASET_NAME} (Tables: {TABLE_NAMES if TABLE_NAMES else 'All'})."
 
-    few_shot_examples_raw = fetch_few_shot_examples()
+    few_shot_examples_raw = fetched["few_shot_examples"]
     if few_shot_examples_raw:
         # The examples are already formatted as strings, so we just join them.
         few_shot_examples_string_for_prompt = "\n\n---\n\n".join(few_shot_examples_raw)
     else:
         few_shot_examples_string_for_prompt = "Few-shot examples are not available for this dataset."
 
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    sys_yaml_file_path = os.path.join(script_dir, "system_instructions.yaml")
-    cust_yaml_file_path = os.path.join(script_dir, "custom_instructions.yaml")
+    rollup_tables_string_for_prompt = (
+        fetched["rollup_tables"]
+        if fetched["rollup_tables"]
+        else "No rollup tables are available. Always query the raw tables."
+    )
 
     try:
-        with open(sys_yaml_file_path, "r") as f:
+        with open(SYS_YAML_FILE_PATH, "r") as f:
             system_instructions_yaml = yaml.safe_load(f)
             system_instruction_template_from_yaml = "\n".join(
                 [
@@ -177,11 +374,12 @@ def return_instructions_bigquery() -> str:
         raise
 
     try:
-        with open(cust_yaml_file_path, "r") as f:
+        with open(CUST_YAML_FILE_PATH, "r") as f:
             custom_instructions_yaml = yaml.safe_load(f)
             custom_instruction_template_from_yaml = "\n".join(
                 [
                     custom_instructions_yaml.get("usecase_specific_information", ""),
+                    custom_instructions_yaml.get("rollup_tables", ""),
                     custom_instructions_yaml.get("few_shot_examples", ""),
                 ]
             )
@@ -206,9 +404,11 @@ def return_instructions_bigquery() -> str:
         data_profiles=data_profiles_string_for_prompt,
         samples=samples_string_for_prompt,
         few_shot_examples=few_shot_examples_string_for_prompt,
+        rollup_tables=rollup_tables_string_for_prompt,
     )
 
     # Replace unwanted characters if necessary
     final_instruction = format_instruction.replace("{", "").replace("}", "").replace("~", "-")
 
-    return final_instruction
+    failed_sources = [name for name, result in report.items() if result["status"] != "ok"]
+    return final_instruction, failed_sources
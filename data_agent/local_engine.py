@@ -0,0 +1,237 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import datetime
+import decimal
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from google.adk.tools.tool_context import ToolContext
+
+from .result_handling import load_query_result
+
+try:
+    import duckdb
+except ImportError:  # execute_local_sql reports the missing dependency instead.
+    duckdb = None
+
+LOCAL_SQL_MAX_ROWS = int(os.getenv("LOCAL_SQL_MAX_ROWS", "200"))
+LOCAL_ENGINE_MAX_SESSIONS = int(os.getenv("LOCAL_ENGINE_MAX_SESSIONS", "32"))
+LOCAL_ENGINE_MEMORY_LIMIT = os.getenv("LOCAL_ENGINE_MEMORY_LIMIT", "512MB")
+LOCAL_ENGINE_THREADS = int(os.getenv("LOCAL_ENGINE_THREADS", "2"))
+
+# Session artifacts with this prefix are uploaded tables (see backend/uploads.py).
+UPLOAD_ARTIFACT_PREFIX = "upload_"
+LAST_QUERY_RESULT_TABLE = "last_query_result"
+
+# --- Logging Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+def table_name_for_artifact(artifact_name: str) -> str:
+    """Local table name of an uploaded artifact, e.g. 'upload_sales_q3.csv' -> 'upload_sales_q3'."""
+    return re.sub(r"[^A-Za-z0-9_]", "_", os.path.splitext(artifact_name)[0])
+
+
+def _to_json_value(value: Any) -> Any:
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        return [_to_json_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _to_json_value(item) for key, item in value.items()}
+    return str(value)
+
+
+class LocalSQLEngine:
+    """
+    An in-memory DuckDB database holding one chat session's uploaded tables.
+
+    External access (files, URLs, extensions) is disabled and locked after the connection
+    is configured, so queries can only read the registered tables. Only SELECT statements
+    are executed.
+    """
+    def __init__(self, memory_limit: str = LOCAL_ENGINE_MEMORY_LIMIT, threads: int = LOCAL_ENGINE_THREADS):
+        if duckdb is None:
+            raise RuntimeError("duckdb is not installed; the local SQL engine is unavailable.")
+        self._lock = threading.Lock()
+        self._connection = duckdb.connect(":memory:")
+        self._connection.execute(f"SET memory_limit = '{memory_limit}'")
+        self._connection.execute(f"SET threads = {int(threads)}")
+        self._connection.execute("SET enable_external_access = false")
+        self._connection.execute("SET lock_configuration = true")
+        # Table name -> fingerprint of the data it was loaded from.
+        self.sources: Dict[str, str] = {}
+
+    def register_table(self, name: str, table: pa.Table, fingerprint: str) -> None:
+        """Creates or replaces table `name` with the contents of an Arrow table."""
+        source_name = f"__source_{name}"
+        with self._lock:
+            self._connection.register(source_name, table)
+            try:
+                self._connection.execute(f'CREATE OR REPLACE TABLE "{name}" AS SELECT * FROM "{source_name}"')
+            finally:
+                self._connection.unregister(source_name)
+            self.sources[name] = fingerprint
+        logger.info(f"Loaded local table '{name}': {table.num_rows} rows, {table.num_columns} columns.")
+
+    def describe(self) -> List[dict]:
+        """Name, row count and columns (name and type) of every table."""
+        with self._lock:
+            tables = self._connection.execute(
+                "SELECT table_name, estimated_size FROM duckdb_tables() ORDER BY table_name"
+            ).fetchall()
+            columns = self._connection.execute(
+                "SELECT table_name, column_name, data_type FROM duckdb_columns() ORDER BY table_name, column_index"
+            ).fetchall()
+        return [
+            {
+                "table": table_name,
+                "row_count": row_count,
+                "columns": [f"{column} {data_type}" for owner, column, data_type in columns if owner == table_name],
+            }
+            for table_name, row_count in tables
+        ]
+
+    def execute(self, query: str, max_rows: int = LOCAL_SQL_MAX_ROWS) -> dict:
+        """Runs one SELECT statement and returns at most `max_rows` rows in the execute_sql response format."""
+        with self._lock:
+            statements = self._connection.extract_statements(query)
+            if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+                return {
+                    "status": "ERROR",
+                    "error_details": "execute_local_sql runs exactly one read-only SELECT statement.",
+                }
+            result = self._connection.execute(query)
+            columns = [description[0] for description in result.description]
+            rows = result.fetchmany(max_rows + 1)
+        truncated = len(rows) > max_rows
+        return {
+            "status": "SUCCESS",
+            "rows": [
+                {column: _to_json_value(value) for column, value in zip(columns, row)}
+                for row in rows[:max_rows]
+            ],
+            "truncated": truncated,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class LocalEngineRegistry:
+    """Keeps one LocalSQLEngine per session, closing the least recently used beyond `max_sessions`."""
+    def __init__(self, max_sessions: int = LOCAL_ENGINE_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._engines: "OrderedDict[str, LocalSQLEngine]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> LocalSQLEngine:
+        with self._lock:
+            engine = self._engines.get(session_id)
+            if engine is not None:
+                self._engines.move_to_end(session_id)
+                return engine
+            engine = LocalSQLEngine()
+            self._engines[session_id] = engine
+            evicted = []
+            while len(self._engines) > self.max_sessions:
+                evicted.append(self._engines.popitem(last=False)[1])
+        # Evicted sessions reload their tables from artifacts on their next query.
+        for old_engine in evicted:
+            old_engine.close()
+        return engine
+
+
+_registry: Optional[LocalEngineRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_local_engine_registry() -> LocalEngineRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = LocalEngineRegistry()
+        return _registry
+
+
+async def _latest_artifact_version(tool_context: ToolContext, filename: str) -> Optional[int]:
+    invocation_context = tool_context._invocation_context
+    versions = await invocation_context.artifact_service.list_versions(
+        app_name=invocation_context.app_name,
+        user_id=invocation_context.user_id,
+        session_id=invocation_context.session.id,
+        filename=filename,
+    )
+    return max(versions) if versions else None
+
+
+def _rows_to_table(rows: List[dict]) -> pa.Table:
+    return pa.Table.from_pylist([{key: _to_json_value(value) for key, value in row.items()} for row in rows])
+
+
+async def sync_session_tables(engine: LocalSQLEngine, tool_context: ToolContext) -> None:
+    """
+    Loads the session's uploaded tables and its last query result into the engine.
+
+    An upload is read from its CSV artifact again only when a new version of the artifact
+    has been saved; the last query result is reloaded whenever the summary in state
+    changes. Parsing and loading run in worker threads.
+    """
+    for artifact_name in await tool_context.list_artifacts():
+        if not artifact_name.startswith(UPLOAD_ARTIFACT_PREFIX):
+            continue
+        table_name = table_name_for_artifact(artifact_name)
+        version = await _latest_artifact_version(tool_context, artifact_name)
+        if version is None:
+            continue
+        fingerprint = f"{artifact_name}@{version}"
+        if engine.sources.get(table_name) == fingerprint:
+            continue
+        artifact = await tool_context.load_artifact(artifact_name, version=version)
+        if not artifact or not artifact.inline_data:
+            continue
+        table = await asyncio.to_thread(pa_csv.read_csv, io.BytesIO(artifact.inline_data.data))
+        await asyncio.to_thread(engine.register_table, table_name, table, fingerprint)
+
+    summary = tool_context.state.get("query_result")
+    if not summary:
+        return
+    fingerprint = hashlib.sha256(json.dumps(summary, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    if engine.sources.get(LAST_QUERY_RESULT_TABLE) == fingerprint:
+        return
+    rows = await load_query_result(tool_context)
+    if rows:
+        table = await asyncio.to_thread(_rows_to_table, rows)
+        await asyncio.to_thread(engine.register_table, LAST_QUERY_RESULT_TABLE, table, fingerprint)
@@ -0,0 +1,95 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import contextlib
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+DISPLAY_NAME = os.getenv("AGENT_DISPLAY_NAME", "")
+
+# --- Logging Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+class ProgressBus:
+    """
+    Delivers progress events of a chat turn ("planning the query", "query running") from
+    callbacks and tools to the SSE stream serving the same session.
+
+    Events are dropped when no stream is subscribed to the session. `publish` may be called
+    from any thread; events are handed to each subscriber's event loop.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+
+    @contextlib.contextmanager
+    def subscribe(self, session_id: str):
+        """Yields a queue receiving the session's progress events until the block exits."""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers.setdefault(session_id, []).append(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(session_id, [])
+                if subscriber in subscribers:
+                    subscribers.remove(subscriber)
+                if not subscribers:
+                    self._subscribers.pop(session_id, None)
+
+    def publish(self, session_id: Optional[str], stage: str, message: str, **details: Any) -> None:
+        if not session_id:
+            return
+        event = {"stage": stage, "message": message, "time": round(time.time(), 3)}
+        event.update({key: value for key, value in details.items() if value is not None})
+        logger.info(f"[{DISPLAY_NAME}] Progress: {message}")
+        with self._lock:
+            subscribers = list(self._subscribers.get(session_id, []))
+        try:
+            current_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            current_loop = None
+        for loop, queue in subscribers:
+            if loop is current_loop:
+                # Queued right away, so the event precedes the runner events that follow it.
+                queue.put_nowait(event)
+                continue
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # The subscriber's loop has been closed.
+                pass
+
+
+progress_bus = ProgressBus()
+
+
+def publish_progress(context, stage: str, message: str, **details: Any) -> None:
+    """Publishes a progress event for the session of an ADK callback or tool context."""
+    try:
+        session_id = context._invocation_context.session.id
+    except AttributeError:
+        return
+    progress_bus.publish(session_id, stage, message, **details)
@@ -0,0 +1,275 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .clients import get_bigquery_client
+from .fetch_pipeline import map_concurrently
+
+DISPLAY_NAME = os.getenv("AGENT_DISPLAY_NAME", "")
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+QUERY_CACHE_VERSION_TTL_SECONDS = float(os.getenv("QUERY_CACHE_VERSION_TTL_SECONDS", "30"))
+
+# --- Logging Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+# String literals, quoted identifiers and comments. Everything outside of literals and
+# identifiers is case-insensitive GoogleSQL and can be normalized freely.
+_SQL_TOKEN_PATTERN = re.compile(
+    r"""(?P<literal>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`)"""
+    r"""|(?P<comment>--[^\n]*|#[^\n]*|/\*.*?\*/)""",
+    re.DOTALL,
+)
+_TABLE_REFERENCE_PATTERN = re.compile(
+    r"`([A-Za-z0-9_\-]+(?:\.[A-Za-z0-9_\-]+){1,2})`"
+    r"|\b(?:from|join)\s+([A-Za-z_][A-Za-z0-9_\-]*(?:\.[A-Za-z0-9_\-]+){1,2})\b",
+    re.IGNORECASE,
+)
+# Text after an opening parenthesis that starts a subquery rather than function arguments.
+_SUBQUERY_START_PATTERN = re.compile(r"\s*(?:(?:select|with)\b|\()", re.IGNORECASE)
+# Queries whose result depends on when or how often they run are never cached.
+_NON_DETERMINISTIC_PATTERN = re.compile(
+    r"\b(current_(date|time|timestamp|datetime)|rand|generate_uuid|session_user)\b",
+    re.IGNORECASE,
+)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Normalizes a query for cache lookups: comments are removed, whitespace is collapsed,
+    keywords and unquoted identifiers are lowercased and a trailing semicolon is dropped.
+    String literals and backtick-quoted identifiers are kept verbatim.
+    """
+    parts = []
+    position = 0
+    for match in _SQL_TOKEN_PATTERN.finditer(sql):
+        parts.append(sql[position:match.start()].lower())
+        parts.append(match.group("literal") if match.group("literal") else " ")
+        position = match.end()
+    parts.append(sql[position:].lower())
+    normalized = re.sub(r"\s+", " ", "".join(parts)).strip()
+    normalized = re.sub(r"\s*([(),=<>+\-*/])\s*", r"\1", normalized)
+    return normalized.rstrip(";").strip()
+
+
+def _function_argument_mask(sql: str) -> tuple[str, list[bool]]:
+    """
+    Returns the query with string literals and comments blanked out (backtick-quoted
+    identifiers are kept), and for every character whether it lies inside the parentheses
+    of a function call such as `EXTRACT(YEAR FROM t.created_at)` rather than a subquery.
+    """
+    masked = _SQL_TOKEN_PATTERN.sub(
+        lambda match: match.group(0) if match.group(0).startswith("`") else " " * len(match.group(0)), sql
+    )
+    inside_function = []
+    # One entry per open parenthesis: True if it opens a function call's arguments.
+    stack = []
+    for position, character in enumerate(masked):
+        if character == "(":
+            stack.append(not _SUBQUERY_START_PATTERN.match(masked, position + 1))
+        elif character == ")" and stack:
+            stack.pop()
+        inside_function.append(any(stack))
+    return masked, inside_function
+
+
+def extract_table_ids(sql: str, default_project: str) -> list[str]:
+    """
+    Returns the fully qualified IDs of the tables referenced by a query. A FROM inside a
+    function call (`EXTRACT(... FROM col)`, `TRIM(... FROM col)`) is not a table reference.
+    """
+    table_ids = set()
+    masked, inside_function = _function_argument_mask(sql)
+    for match in _TABLE_REFERENCE_PATTERN.finditer(masked):
+        if match.group(2) and inside_function[match.start()]:
+            continue
+        reference = match.group(1) or match.group(2)
+        name_parts = reference.split(".")
+        if len(name_parts) == 2:
+            if not default_project:
+                continue
+            name_parts = [default_project] + name_parts
+        table_ids.add(".".join(name_parts))
+    return sorted(table_ids)
+
+
+def is_cacheable_query(sql: str) -> bool:
+    """Returns True for read-only, deterministic queries."""
+    normalized = normalize_sql(sql)
+    if not normalized.startswith(("select", "with", "(")):
+        return False
+    return not _NON_DETERMINISTIC_PATTERN.search(normalized)
+
+
+class QueryResultCache:
+    """
+    LRU cache of `execute_sql` responses with a byte budget.
+
+    Entries are keyed on the normalized SQL and the `last_modified` time of every table
+    the query reads, so a changed table never serves an old result. When a newer table
+    version is observed, every entry recorded against the older version is dropped.
+    """
+    def __init__(self, max_bytes: int = QUERY_CACHE_MAX_BYTES, version_ttl_seconds: float = QUERY_CACHE_VERSION_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.version_ttl_seconds = version_ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[dict, int, dict]] = OrderedDict()
+        self._size_bytes = 0
+        self._table_versions: dict[str, tuple[str, float]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def build_key(self, sql: str, default_project: str) -> Optional[tuple[str, dict]]:
+        """
+        Returns (cache_key, table_versions) for a query, or None if it must not be cached
+        (non-deterministic, not read-only, or a table version could not be determined).
+        """
+        if not is_cacheable_query(sql):
+            return None
+        table_ids = extract_table_ids(sql, default_project)
+        if not table_ids:
+            return None
+        table_versions = self._get_table_versions(table_ids)
+        if table_versions is None:
+            return None
+        payload = json.dumps({"sql": normalize_sql(sql), "tables": table_versions}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest(), table_versions
+
+    def get(self, cache_key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            return copy.deepcopy(entry[0])
+
+    def put(self, cache_key: str, response: dict, table_versions: dict) -> None:
+        try:
+            size = len(json.dumps(response, default=str).encode("utf-8"))
+        except (TypeError, ValueError):
+            return
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if cache_key in self._entries:
+                self._entries.move_to_end(cache_key)
+                return
+            self._entries[cache_key] = (copy.deepcopy(response), size, table_versions)
+            self._size_bytes += size
+            while self._size_bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._size_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size_bytes = 0
+            self._table_versions.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._size_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _get_table_versions(self, table_ids: list[str]) -> Optional[dict]:
+        now = time.time()
+        versions = {}
+        stale_ids = []
+        with self._lock:
+            for table_id in table_ids:
+                cached = self._table_versions.get(table_id)
+                if cached and now - cached[1] <= self.version_ttl_seconds:
+                    versions[table_id] = cached[0]
+                else:
+                    stale_ids.append(table_id)
+        if stale_ids:
+            fetched = _fetch_table_versions(stale_ids)
+            if fetched is None:
+                return None
+            with self._lock:
+                for table_id, version in fetched.items():
+                    previous = self._table_versions.get(table_id)
+                    if previous and previous[0] != version:
+                        self._invalidate_table(table_id, version)
+                    self._table_versions[table_id] = (version, now)
+            versions.update(fetched)
+        return versions
+
+    def _invalidate_table(self, table_id: str, current_version: str) -> None:
+        stale_keys = [
+            key for key, (_, _, table_versions) in self._entries.items()
+            if table_versions.get(table_id, current_version) != current_version
+        ]
+        for key in stale_keys:
+            _, size, _ = self._entries.pop(key)
+            self._size_bytes -= size
+            self.invalidations += 1
+        if stale_keys:
+            logger.info(
+                f"[{DISPLAY_NAME}] Table {table_id} changed; dropped {len(stale_keys)} cached query results."
+            )
+
+
+def _fetch_table_versions(table_ids: list[str]) -> Optional[dict]:
+    def fetch_version(table_id: str) -> str:
+        client = get_bigquery_client(table_id.split(".")[0])
+        table_obj = client.get_table(table_id)
+        return table_obj.modified.isoformat() if table_obj.modified else ""
+
+    versions = {}
+    for table_id, version, error in map_concurrently(fetch_version, table_ids):
+        if error is not None:
+            logger.warning(
+                f"[{DISPLAY_NAME}] Could not read last_modified of {table_id}; query result will not be cached. Error: {error}"
+            )
+            return None
+        versions[table_id] = version
+    return versions
+
+
+_query_result_cache = QueryResultCache()
+
+
+def get_query_result_cache() -> Optional[QueryResultCache]:
+    """Returns the process-wide query result cache, or None if it is disabled."""
+    return _query_result_cache if QUERY_CACHE_ENABLED else None
@@ -0,0 +1,196 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import re
+import time
+from typing import Optional
+
+from google.api_core.exceptions import BadRequest
+from google.cloud import bigquery
+
+from .clients import get_bigquery_client
+from .utils import ROLLUP_TABLE_SUFFIXES
+
+DISPLAY_NAME = os.getenv("AGENT_DISPLAY_NAME", "")
+LOCATION = os.getenv("BQ_LOCATION", "")
+BQ_COMPUTE_PROJECT_ID = os.getenv("BQ_COMPUTE_PROJECT_ID", "")
+QUERY_GUARD_ENABLED = os.getenv("QUERY_GUARD_ENABLED", "true").lower() not in ("0", "false", "no")
+QUERY_MAX_BYTES_PROCESSED = int(os.getenv("QUERY_MAX_BYTES_PROCESSED", str(10 * 1024 ** 3)))
+QUERY_RAW_ROW_LIMIT = int(os.getenv("QUERY_RAW_ROW_LIMIT", "1000"))
+
+# --- Logging Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+_LITERAL_OR_COMMENT_PATTERN = re.compile(
+    r"""'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`|--[^\n]*|#[^\n]*|/\*.*?\*/""",
+    re.DOTALL,
+)
+_ROLLUP_TABLE_PATTERN = re.compile(
+    "(?:" + "|".join(re.escape(suffix) for suffix in ROLLUP_TABLE_SUFFIXES) + r")\b",
+    re.IGNORECASE,
+)
+_AGGREGATE_PATTERN = re.compile(
+    r"\b(sum|count|countif|avg|min|max|approx_count_distinct|approx_quantiles|approx_top_count"
+    r"|array_agg|string_agg|any_value|logical_and|logical_or|stddev|variance)\s*\(",
+    re.IGNORECASE,
+)
+
+
+def _top_level_sql(sql: str) -> str:
+    """
+    Returns the query with literals, comments and everything nested inside parentheses
+    blanked out, leaving only the outermost statement (e.g. the final SELECT after CTEs).
+    """
+    masked = _LITERAL_OR_COMMENT_PATTERN.sub(lambda match: " " * len(match.group(0)), sql)
+    characters = []
+    depth = 0
+    for character in masked:
+        if character == "(":
+            if depth == 0:
+                characters.append(character)
+            depth += 1
+        elif character == ")":
+            depth = max(depth - 1, 0)
+            if depth == 0:
+                characters.append(character)
+        else:
+            characters.append(character if depth == 0 else " ")
+    return "".join(characters)
+
+
+def returns_raw_rows(sql: str) -> bool:
+    """
+    Returns True if the query is a single SELECT (optionally with CTEs) whose outermost
+    statement has neither a LIMIT (literal or parameter), a GROUP BY, a SELECT DISTINCT
+    nor an aggregate, and reads no rollup table. DML, DDL and scripts are never matched.
+    """
+    top_level = _top_level_sql(sql)
+    statement = top_level.strip().rstrip(";").strip().lower()
+    if not statement.startswith(("select", "with", "(")) or ";" in statement:
+        return False
+    if re.search(r"\blimit\s+(?:\d+|@\w+|\?)", top_level, re.IGNORECASE):
+        return False
+    if re.search(r"\bgroup\s+by\b|\bselect\s+distinct\b", top_level, re.IGNORECASE):
+        return False
+    # Rollups are already aggregated to one row per day and key.
+    if _ROLLUP_TABLE_PATTERN.search(sql):
+        return False
+    return not _AGGREGATE_PATTERN.search(top_level)
+
+
+def inject_limit(sql: str, max_rows: int = QUERY_RAW_ROW_LIMIT) -> tuple[str, bool]:
+    """
+    Appends `LIMIT max_rows` to queries that return raw rows. A trailing semicolon and
+    any comments after the last clause are dropped, so the LIMIT is not commented out.
+
+    Returns:
+        A tuple of (query, limit_injected).
+    """
+    if not returns_raw_rows(sql):
+        return sql, False
+    masked = _LITERAL_OR_COMMENT_PATTERN.sub(
+        lambda match: " " * len(match.group(0)) if match.group(0)[0] in "-#/" else match.group(0), sql
+    )
+    end = len(masked.rstrip().rstrip(";").rstrip())
+    return f"{sql[:end]}\nLIMIT {max_rows}", True
+
+
+def _format_bytes(num_bytes: int) -> str:
+    size = float(num_bytes)
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if size < 1024 or unit == "TiB":
+            return f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def dry_run_query(sql: str, project_id: str) -> bigquery.QueryJob:
+    """Runs a BigQuery dry run, which validates the query and estimates bytes processed at no cost."""
+    client = get_bigquery_client(project_id, LOCATION)
+    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+    return client.query(sql, job_config=job_config)
+
+
+def guard_query(sql: str, project_id: Optional[str] = None) -> dict:
+    """
+    Pre-execution stage for `execute_sql`, run after `inject_limit`.
+
+    Dry runs the query and rejects it if it is not a SELECT or would process more than
+    QUERY_MAX_BYTES_PROCESSED. Blocks on the dry run; call it from a worker thread.
+    Args:
+        sql: The query to run.
+        project_id: The project used to run the dry run.
+    Returns:
+        A dictionary with 'estimated_bytes_processed' and 'statement_type' (None if the dry
+        run could not be run) and 'error', which is None or a structured `execute_sql` error
+        response the agent can act on.
+    """
+    result = {
+        "estimated_bytes_processed": None,
+        "statement_type": None,
+        "error": None,
+    }
+
+    start_time = time.time()
+    try:
+        dry_run_job = dry_run_query(sql, project_id or BQ_COMPUTE_PROJECT_ID)
+    except BadRequest as e:
+        result["error"] = {
+            "status": "ERROR",
+            "error_type": "INVALID_QUERY",
+            "error_details": str(e),
+        }
+        return result
+    except Exception as e:
+        # The guard must never make the tool unusable; let the query run unchecked.
+        logger.warning(f"[{DISPLAY_NAME}] Dry run failed; skipping the scan budget check. Error: {e}")
+        return result
+
+    estimated_bytes = dry_run_job.total_bytes_processed or 0
+    result["estimated_bytes_processed"] = estimated_bytes
+    result["statement_type"] = dry_run_job.statement_type
+    logger.info(
+        f"[{DISPLAY_NAME}] Dry run estimated {_format_bytes(estimated_bytes)} processed "
+        f"(Duration: {time.time() - start_time:.2f} seconds)."
+    )
+
+    if dry_run_job.statement_type and dry_run_job.statement_type != "SELECT":
+        result["error"] = {
+            "status": "ERROR",
+            "error_type": "READ_ONLY_VIOLATION",
+            "error_details": f"Only SELECT statements are allowed, but this is a {dry_run_job.statement_type} statement.",
+        }
+    elif estimated_bytes > QUERY_MAX_BYTES_PROCESSED:
+        result["error"] = {
+            "status": "ERROR",
+            "error_type": "SCAN_BUDGET_EXCEEDED",
+            "error_details": (
+                f"The query would process {_format_bytes(estimated_bytes)}, which exceeds the scan budget of "
+                f"{_format_bytes(QUERY_MAX_BYTES_PROCESSED)}. The query was not executed."
+            ),
+            "estimated_bytes_processed": estimated_bytes,
+            "max_bytes_processed": QUERY_MAX_BYTES_PROCESSED,
+            "suggestions": [
+                "Select only the columns needed instead of SELECT * or wide column lists.",
+                "Add a filter on Created_Time to narrow the time range.",
+                "Aggregate (SUM, COUNT) instead of returning raw rows.",
+            ],
+        }
+    return result
@@ -0,0 +1,126 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+import os
+from typing import Any, Optional
+
+from google.adk.tools.tool_context import ToolContext
+from google.genai import types
+
+QUERY_RESULT_STATE_MAX_ROWS = int(os.getenv("QUERY_RESULT_STATE_MAX_ROWS", "50"))
+QUERY_RESULT_STATE_MAX_BYTES = int(os.getenv("QUERY_RESULT_STATE_MAX_BYTES", str(64 * 1024)))
+TOOL_LOG_MAX_CHARS = int(os.getenv("TOOL_LOG_MAX_CHARS", "1000"))
+
+# --- Logging Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+def truncate_for_log(value: Any, max_chars: int = TOOL_LOG_MAX_CHARS) -> str:
+    """Serializes a value for logging and truncates it to `max_chars` characters."""
+    try:
+        text = json.dumps(value, ensure_ascii=False, default=str)
+    except (TypeError, ValueError):
+        text = repr(value)
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... ({len(text) - max_chars} more characters)"
+
+
+def summarize_rows(
+    rows: list[dict],
+    max_rows: int = QUERY_RESULT_STATE_MAX_ROWS,
+    max_bytes: int = QUERY_RESULT_STATE_MAX_BYTES,
+) -> dict:
+    """
+    Builds a compact columnar summary of query result rows.
+
+    The preview holds at most `max_rows` rows and roughly `max_bytes` of serialized values.
+    Returns:
+        A dictionary with 'columns', 'row_count', 'preview' (column name to list of values),
+        'preview_row_count' and 'truncated'.
+    """
+    columns = list(rows[0].keys()) if rows else []
+    preview = {column: [] for column in columns}
+    preview_bytes = 0
+    preview_row_count = 0
+    for row in rows[:max_rows]:
+        row_bytes = len(json.dumps(row, ensure_ascii=False, default=str).encode("utf-8"))
+        if preview_row_count and preview_bytes + row_bytes > max_bytes:
+            break
+        for column in columns:
+            preview[column].append(row.get(column))
+        preview_bytes += row_bytes
+        preview_row_count += 1
+    return {
+        "columns": columns,
+        "row_count": len(rows),
+        "preview": preview,
+        "preview_row_count": preview_row_count,
+        "truncated": preview_row_count < len(rows),
+    }
+
+
+async def store_query_result(tool_context: ToolContext, rows: list[dict]) -> dict:
+    """
+    Stores a query result for later stages without keeping every row in session state.
+
+    A compact summary is returned for `state['query_result']`. If the result does not fit
+    in the summary preview, the full rows are saved as a JSON artifact of the session and
+    the summary records its filename and version.
+    """
+    summary = summarize_rows(rows)
+    summary["artifact"] = None
+    summary["artifact_version"] = None
+    if summary["truncated"]:
+        filename = f"query_result_{tool_context.function_call_id or 'latest'}.json"
+        try:
+            payload = json.dumps(rows, ensure_ascii=False, default=str).encode("utf-8")
+            version = await tool_context.save_artifact(
+                filename, types.Part.from_bytes(data=payload, mime_type="application/json")
+            )
+            summary["artifact"] = filename
+            summary["artifact_version"] = version
+        except Exception as e:
+            # Without an artifact service the preview is all that is kept.
+            logger.warning(f"Could not save query result artifact '{filename}': {e}")
+    return summary
+
+
+async def load_query_result(tool_context: ToolContext) -> Optional[list[dict]]:
+    """
+    Returns the full rows of the last query result, reading the artifact only when the
+    summary in state is truncated. Returns None if there is no stored result.
+    """
+    summary = tool_context.state.get("query_result")
+    if not summary:
+        return None
+    if not summary.get("truncated"):
+        columns = summary["columns"]
+        return [
+            {column: summary["preview"][column][index] for column in columns}
+            for index in range(summary["preview_row_count"])
+        ]
+    if not summary.get("artifact"):
+        return None
+    artifact = await tool_context.load_artifact(summary["artifact"], version=summary.get("artifact_version"))
+    if not artifact or not artifact.inline_data:
+        return None
+    return json.loads(artifact.inline_data.data)
@@ -12,13 +12,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import logging, os
+import asyncio, logging, os, time
 import google.auth
 from google.adk.tools.bigquery import BigQueryToolset
 from google.adk.tools.bigquery.config import BigQueryToolConfig 
 from google.adk.auth.auth_credential import AuthCredentialTypes
 from google.adk.tools.bigquery.bigquery_credentials import BigQueryCredentialsConfig
 from google.adk.tools.bigquery.config import WriteMode
+from google.adk.tools.tool_context import ToolContext
+
+from .bigquery_jobs import DRY_RUN_STATE_KEY, run_query_job
+from .local_engine import LOCAL_SQL_MAX_ROWS, get_local_engine_registry, sync_session_tables
+from .progress import publish_progress
+from .query_guard import dry_run_query
+from .vector_index import VectorIndexUnavailableError, get_vector_index_manager, embed_query
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
 logger = logging.getLogger(__name__)
@@ -70,3 +77,111 @@ def get_bigquery_toolset() -> BigQueryToolset:
 
     return bigquery_toolset
 
+
+async def execute_sql(project_id: str, query: str, tool_context: ToolContext) -> dict:
+    """Run a BigQuery SQL query in the project and return the result.
+
+    Only read-only SELECT statements are run.
+
+    Args:
+        project_id: The GCP project id in which the query should be executed.
+        query: The BigQuery SQL query to be executed.
+
+    Returns:
+        A dictionary with 'status' and 'rows'. If the result contains
+        'result_is_likely_truncated' set to True, more rows match the query than were
+        returned. If 'limit_injected' is True, the query returned raw rows without a LIMIT,
+        so it was capped and at most 'limit' rows were returned. On error, 'error_details'.
+    """
+    compute_project_id = BQ_COMPUTE_PROJECT_ID or project_id
+    dry_run = tool_context.state.get(DRY_RUN_STATE_KEY) or {}
+    if dry_run.get("query") != query:
+        # The before-tool guard did not validate this query (it is disabled or its dry run failed).
+        try:
+            dry_run_job = await asyncio.to_thread(dry_run_query, query, compute_project_id)
+        except Exception as e:
+            return {"status": "ERROR", "error_details": str(e)}
+        if dry_run_job.statement_type != "SELECT":
+            return {
+                "status": "ERROR",
+                "error_details": f"Only SELECT statements are allowed, but this is a {dry_run_job.statement_type} statement.",
+            }
+        dry_run = {"query": query, "estimated_bytes_processed": dry_run_job.total_bytes_processed}
+
+    return await run_query_job(
+        query,
+        compute_project_id,
+        on_progress=lambda stage, message, **details: publish_progress(tool_context, stage, message, **details),
+        estimated_bytes=dry_run.get("estimated_bytes_processed"),
+    )
+
+
+def search_similar_posts(query: str, top_k: int = 10) -> dict:
+    """Finds the posts whose text is semantically closest to `query`.
+
+    Use this for qualitative questions such as "what are people saying about the camera?"
+    or "find posts similar to 'battery drains too fast'". It searches an in-memory
+    approximate nearest-neighbour index over `text_embedding`, so it answers in
+    milliseconds instead of scanning the table. Use `execute_sql` for counts and metrics.
+
+    Args:
+        query: A short description of what the posts should be about.
+        top_k: The number of posts to return (at most 50).
+
+    Returns:
+        A dictionary with 'status' and 'posts', each post holding its 'similarity'
+        (cosine, higher is closer) and the post's columns such as 'text',
+        'Brands_Mentioned' and 'overall_sentiment'.
+    """
+    start_time = time.time()
+    try:
+        index = get_vector_index_manager().get_index()
+        matches = index.search(embed_query(query), top_k=max(1, min(top_k, 50)))
+    except VectorIndexUnavailableError as e:
+        logger.warning(f"[{DISPLAY_NAME}] Similar post search unavailable: {e}")
+        return {"status": "ERROR", "error_details": str(e)}
+    except Exception as e:
+        logger.error(f"[{DISPLAY_NAME}] Similar post search failed: {e}", exc_info=True)
+        return {"status": "ERROR", "error_details": str(e)}
+    logger.info(
+        f"[{DISPLAY_NAME}] --- Found {len(matches)} similar posts "
+        f"(Duration: {time.time() - start_time:.3f} seconds) ---"
+    )
+    return {
+        "status": "SUCCESS",
+        "posts": [{"similarity": round(score, 4), **metadata} for score, metadata in matches],
+    }
+
+
+async def execute_local_sql(query: str, tool_context: ToolContext) -> dict:
+    """Runs a DuckDB SELECT over the files the user uploaded in this chat and the last query result.
+
+    Uploaded spreadsheets are tables named after the file (e.g. `upload_sales_q3`), and
+    the rows of the latest `execute_sql` call are the table `last_query_result`, so an
+    upload can be filtered, joined and aggregated, or compared with BigQuery data,
+    without copying rows into the conversation. Runs locally; no BigQuery job is started.
+    Use DuckDB SQL syntax.
+
+    Args:
+        query: A single DuckDB SELECT statement.
+
+    Returns:
+        A dictionary with 'status', 'rows' (at most LOCAL_SQL_MAX_ROWS rows) and 'truncated'.
+        On error, 'error_details' and the available 'tables' with their columns.
+    """
+    start_time = time.time()
+    engine = None
+    try:
+        engine = get_local_engine_registry().get(tool_context._invocation_context.session.id)
+        await sync_session_tables(engine, tool_context)
+        response = await asyncio.to_thread(engine.execute, query, LOCAL_SQL_MAX_ROWS)
+    except Exception as e:
+        logger.warning(f"[{DISPLAY_NAME}] Local SQL query failed: {e}")
+        response = {"status": "ERROR", "error_details": str(e)}
+    if response["status"] != "SUCCESS" and engine is not None:
+        response["tables"] = await asyncio.to_thread(engine.describe)
+    logger.info(
+        f"[{DISPLAY_NAME}] --- Local SQL query finished with status {response['status']} "
+        f"(Duration: {time.time() - start_time:.3f} seconds) ---"
+    )
+    return response
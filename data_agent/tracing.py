@@ -0,0 +1,238 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import logging.handlers
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, Hashable, Optional
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none").lower()
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH") or os.path.join(tempfile.gettempdir(), "data_agent_traces.jsonl")
+# The span file is rotated at this size, keeping one previous file.
+TRACE_EXPORT_MAX_BYTES = int(os.getenv("TRACE_EXPORT_MAX_BYTES", str(100 * 1024 * 1024)))
+TRACE_STATS_WINDOW = int(os.getenv("TRACE_STATS_WINDOW", "1000"))
+# Spans whose end hook never ran (e.g. a tool raised) are discarded after this long.
+TRACE_OPEN_SPAN_TTL_SECONDS = 600
+
+# --- Logging Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+# Trace of the chat request being served; set by the backend for each /api/run_sse call.
+_current_trace: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("current_trace", default=None)
+
+
+class _JsonLinesExporter:
+    """
+    Appends one JSON object per span, with OpenTelemetry field names, to a local file that
+    is rotated once it reaches `max_bytes`.
+    """
+    def __init__(self, path: str, max_bytes: int = TRACE_EXPORT_MAX_BYTES):
+        self._handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=1, encoding="utf-8"
+        )
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+
+    def export(self, span: dict) -> None:
+        line = json.dumps(span, ensure_ascii=False, default=str)
+        self._handler.handle(logging.makeLogRecord({"msg": line}))
+
+
+class _OpenTelemetryExporter:
+    """Re-emits spans through the OpenTelemetry API, so any configured OTel exporter receives them."""
+    def __init__(self):
+        from opentelemetry import trace
+
+        self._tracer = trace.get_tracer("data_agent")
+
+    def export(self, span: dict) -> None:
+        otel_span = self._tracer.start_span(
+            span["name"], start_time=span["start_time_unix_nano"], attributes=span["attributes"]
+        )
+        otel_span.end(end_time=span["end_time_unix_nano"])
+
+
+def _create_exporter():
+    if TRACE_EXPORTER == "json":
+        try:
+            return _JsonLinesExporter(TRACE_EXPORT_PATH)
+        except OSError as e:
+            logger.warning(f"Cannot open trace export file {TRACE_EXPORT_PATH}; spans are only aggregated. Error: {e}")
+    elif TRACE_EXPORTER == "otel":
+        try:
+            return _OpenTelemetryExporter()
+        except ImportError:
+            logger.warning("TRACE_EXPORTER is 'otel' but opentelemetry is not installed; spans are only aggregated.")
+    return None
+
+
+class Tracer:
+    """
+    Records per-stage spans of a chat turn and keeps latency percentiles per stage.
+
+    Spans belong to the trace of the current request (see `start_trace`); outside a request,
+    the ADK invocation id is used as the trace id. Stages that begin and end in different
+    callbacks (model calls, tool runs) are opened with `begin` and closed with `end` under
+    a shared key.
+    """
+    def __init__(self, exporter=None, window: int = TRACE_STATS_WINDOW):
+        self._exporter = exporter
+        self._window = window
+        self._lock = threading.Lock()
+        self._durations: Dict[str, deque] = {}
+        self._counts: Dict[str, int] = {}
+        self._open: Dict[Hashable, tuple] = {}
+
+    @contextlib.contextmanager
+    def start_trace(self, name: str = "request", **attributes):
+        """Opens the root span of a request; spans recorded inside it share its trace id."""
+        trace = {"trace_id": uuid.uuid4().hex, "span_id": uuid.uuid4().hex[:16]}
+        token = _current_trace.set(trace)
+        start_ns = time.time_ns()
+        try:
+            yield trace
+        finally:
+            try:
+                _current_trace.reset(token)
+            except ValueError:
+                # The stream was closed from another context (client disconnect).
+                pass
+            self._record(name, start_ns, time.time_ns(), attributes, trace["trace_id"], trace["span_id"], None)
+
+    @contextlib.contextmanager
+    def span(self, stage: str, invocation_id: Optional[str] = None, **attributes):
+        start_ns = time.time_ns()
+        try:
+            yield attributes
+        finally:
+            self.record(stage, start_ns, time.time_ns(), invocation_id, **attributes)
+
+    def begin(self, key: Hashable, stage: str, invocation_id: Optional[str] = None, **attributes) -> None:
+        now = time.time_ns()
+        with self._lock:
+            expired = [
+                open_key for open_key, (_, started_ns, *_rest) in self._open.items()
+                if now - started_ns > TRACE_OPEN_SPAN_TTL_SECONDS * 1e9
+            ]
+            for open_key in expired:
+                del self._open[open_key]
+            self._open[key] = (stage, now, invocation_id, attributes, _current_trace.get())
+
+    def end(self, key: Hashable, **attributes) -> Optional[float]:
+        """Closes the span opened under `key` and returns its duration in seconds (None if none is open)."""
+        with self._lock:
+            opened = self._open.pop(key, None)
+        if opened is None:
+            return None
+        stage, start_ns, invocation_id, begin_attributes, trace = opened
+        end_ns = time.time_ns()
+        self._record_in_trace(stage, start_ns, end_ns, invocation_id, {**begin_attributes, **attributes}, trace)
+        return (end_ns - start_ns) / 1e9
+
+    def record(self, stage: str, start_ns: int, end_ns: int, invocation_id: Optional[str] = None, **attributes) -> None:
+        self._record_in_trace(stage, start_ns, end_ns, invocation_id, attributes, _current_trace.get())
+
+    def stage_stats(self) -> Dict[str, dict]:
+        """Count and p50/p95/p99 latency in milliseconds of each stage over its most recent spans."""
+        with self._lock:
+            snapshot = {stage: sorted(durations) for stage, durations in self._durations.items()}
+            counts = dict(self._counts)
+        stats = {}
+        for stage, durations in sorted(snapshot.items()):
+            def percentile(fraction):
+                return round(durations[min(len(durations) - 1, int(fraction * len(durations)))], 2)
+            stats[stage] = {
+                "count": counts[stage],
+                "p50_ms": percentile(0.50),
+                "p95_ms": percentile(0.95),
+                "p99_ms": percentile(0.99),
+                "max_ms": round(durations[-1], 2),
+            }
+        return stats
+
+    def _record_in_trace(self, stage, start_ns, end_ns, invocation_id, attributes, trace) -> None:
+        trace_id = trace["trace_id"] if trace else (invocation_id or "untraced")
+        parent_id = trace["span_id"] if trace else None
+        if invocation_id:
+            attributes = {**attributes, "invocation_id": invocation_id}
+        self._record(stage, start_ns, end_ns, attributes, trace_id, uuid.uuid4().hex[:16], parent_id)
+
+    def _record(self, stage, start_ns, end_ns, attributes, trace_id, span_id, parent_span_id) -> None:
+        duration_ms = (end_ns - start_ns) / 1e6
+        with self._lock:
+            if stage not in self._durations:
+                self._durations[stage] = deque(maxlen=self._window)
+                self._counts[stage] = 0
+            self._durations[stage].append(duration_ms)
+            self._counts[stage] += 1
+        if self._exporter is None:
+            return
+        try:
+            self._exporter.export({
+                "name": stage,
+                "trace_id": trace_id,
+                "span_id": span_id,
+                "parent_span_id": parent_span_id,
+                "start_time_unix_nano": start_ns,
+                "end_time_unix_nano": end_ns,
+                "duration_ms": round(duration_ms, 3),
+                "attributes": {key: value for key, value in attributes.items() if value is not None},
+            })
+        except Exception as e:
+            logger.warning(f"Failed to export span '{stage}': {e}")
+
+
+tracer = Tracer(_create_exporter())
+
+
+def traced_callback(stage: str) -> Callable:
+    """
+    Records the run time of an ADK callback (sync or async) as `stage`, attributed to the
+    invocation of its callback or tool context.
+    """
+    def decorator(callback):
+        def invocation_of(args, kwargs):
+            for value in list(args) + list(kwargs.values()):
+                invocation_id = getattr(value, "invocation_id", None)
+                if isinstance(invocation_id, str):
+                    return invocation_id
+            return None
+
+        if inspect.iscoroutinefunction(callback):
+            @functools.wraps(callback)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(stage, invocation_of(args, kwargs)):
+                    return await callback(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(callback)
+        def wrapper(*args, **kwargs):
+            with tracer.span(stage, invocation_of(args, kwargs)):
+                return callback(*args, **kwargs)
+        return wrapper
+    return decorator
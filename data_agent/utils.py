@@ -15,10 +15,14 @@
 import logging
 import time
 import os
+from google.api_core.exceptions import NotFound
 from google.cloud import bigquery, dataplex_v1
 from google.cloud.bigquery.table import TableReference
 from proto.marshal.collections import maps, repeated
 
+from .clients import get_bigquery_client, get_dataplex_catalog_client
+from .fetch_pipeline import PartialFetchError, map_concurrently
+
 PROJECT_ID = os.getenv("BQ_DATA_PROJECT_ID", "")
 DATASET_NAME = os.getenv("BQ_DATASET_NAME", "")
 LOCATION = os.getenv("BQ_LOCATION", "")
@@ -28,6 +32,9 @@ ASPECT_TYPES = os.getenv("ASPECT_TYPES", "").split(",") if os.getenv("ASPECT_TYP
 DISPLAY_NAME = os.getenv("AGENT_DISPLAY_NAME", "")
 FEW_SHOT_EXAMPLES_TABLE_FULL_ID = os.getenv("FEW_SHOT_EXAMPLES_TABLE_FULL_ID", "")
 DATA_PROFILES_TABLE_FULL_ID = os.getenv("DATA_PROFILES_TABLE_FULL_ID", "")
+# Pre-aggregated rollups built by infrastructure/setup_agent_infrastructure.py are named
+# after their base table with one of these suffixes.
+ROLLUP_TABLE_SUFFIXES = ["_rollup_daily_sentiment", "_rollup_daily_feature"]
 
 # --- Logging Configuration ---
 logging.basicConfig(
@@ -55,7 +62,7 @@ def fetch_few_shot_examples() -> list[str]:
     logger.info(
         f"[{DISPLAY_NAME}] Starting to fetch few-shot examples for dataset '{DATASET_NAME}' from '{examples_table_id}'."
     )
-    client = bigquery.Client(project=PROJECT_ID)
+    client = get_bigquery_client(PROJECT_ID, LOCATION)
     # Use SELECT * to remain schema-agnostic. The filtering column 'dataset' is assumed to exist.
     query = """
         SELECT *
@@ -90,9 +97,8 @@ def fetch_few_shot_examples() -> list[str]:
         duration = time.time() - start_time
         logger.error(
             f"[{DISPLAY_NAME}] --- Failed to fetch few-shot examples after {duration:.2f} seconds. Check if the table exists and contains a 'dataset' column. Error: {e} ---",
-            exc_info=True,
         )
-        return []
+        raise
 
 
 def fetch_dataset_description() -> str:
@@ -106,7 +112,7 @@ def fetch_dataset_description() -> str:
         return ""
     try:
         start_time = time.time()
-        client = bigquery.Client(project=PROJECT_ID)
+        client = get_bigquery_client(PROJECT_ID, LOCATION)
         dataset_id = f"{PROJECT_ID}.{DATASET_NAME}"
         dataset = client.get_dataset(dataset_id)
         duration = time.time() - start_time
@@ -117,9 +123,8 @@ def fetch_dataset_description() -> str:
     except Exception as e:
         logger.error(
             f"[{DISPLAY_NAME}] Failed to fetch dataset description for {PROJECT_ID}.{DATASET_NAME}: {e}",
-            exc_info=True,
         )
-        return ""
+        raise
 
 
 def fetch_bigquery_data_profiles() -> list[dict]:
@@ -146,7 +151,7 @@ def fetch_bigquery_data_profiles() -> list[dict]:
             f"[{DISPLAY_NAME}] Starting to fetch data profiles for all tables in dataset '{dataset_name_to_filter}' from '{profiles_table_id}'."
         )
 
-    client = bigquery.Client(project=PROJECT_ID)
+    client = get_bigquery_client(PROJECT_ID, LOCATION)
 
     select_clause = """
         SELECT
@@ -230,9 +235,8 @@ def fetch_bigquery_data_profiles() -> list[dict]:
         duration = end_time - start_time
         logger.error(
             f"[{DISPLAY_NAME}] --- Failed to fetch data profiles after {duration:.2f} seconds ---",
-            exc_info=True,
         )
-        return []
+        raise
 
 
 def fetch_sample_data_for_tables(num_rows: int = 3) -> list[dict]:
@@ -242,7 +246,8 @@ def fetch_sample_data_for_tables(num_rows: int = 3) -> list[dict]:
         num_rows: The number of sample rows to fetch for each table.
     Returns:
         A list of dictionaries, where each dictionary contains 'table_name' (fully qualified)
-        and 'sample_rows'. Returns an empty list if no data can be fetched or an error occurs.
+        and 'sample_rows'. Raises if the tables cannot be listed, and `PartialFetchError`
+        with the samples that were fetched if some tables could not be read.
     """
     start_time = time.time()
     sample_data_results: list[dict] = []
@@ -256,13 +261,12 @@ def fetch_sample_data_for_tables(num_rows: int = 3) -> list[dict]:
         )
         return sample_data_results
     try:
-        client = bigquery.Client(project=project_id)
+        client = get_bigquery_client(project_id, LOCATION)
     except Exception as e:
         logger.error(
             f"[{DISPLAY_NAME}] Failed to create BigQuery client for project {project_id}: {e}",
-            exc_info=True,
         )
-        return sample_data_results
+        raise
 
     tables_to_fetch_samples_from_ids: list[str] = []
     if table_names_list:
@@ -277,7 +281,7 @@ def fetch_sample_data_for_tables(num_rows: int = 3) -> list[dict]:
         try:
             dataset_ref = client.dataset(dataset_id, project=project_id)
             for bq_table in client.list_tables(dataset_ref):
-                if bq_table.table_type == "TABLE":
+                if bq_table.table_type == "TABLE" and not is_rollup_table(bq_table.table_id):
                     tables_to_fetch_samples_from_ids.append(bq_table.table_id)
                 else:
                     logger.info(
@@ -286,9 +290,8 @@ def fetch_sample_data_for_tables(num_rows: int = 3) -> list[dict]:
         except Exception as e:
             logger.error(
                 f"[{DISPLAY_NAME}] Error listing tables for {project_id}.{dataset_id}: {e}",
-                exc_info=True,
             )
-            return sample_data_results
+            raise
 
     if not tables_to_fetch_samples_from_ids:
         logger.info(
@@ -296,40 +299,53 @@ def fetch_sample_data_for_tables(num_rows: int = 3) -> list[dict]:
         )
         return sample_data_results
 
-    for table_id_str in tables_to_fetch_samples_from_ids:
+    def fetch_sample_rows(table_id_str: str) -> list[dict]:
         full_table_name = f"{project_id}.{dataset_id}.{table_id_str}"
-        try:
-            logger.info(
-                f"[{DISPLAY_NAME}] Fetching sample data for table: {full_table_name}"
-            )
-            table_reference = TableReference.from_string(
-                full_table_name, default_project=project_id
-            )
-            rows_iterator = client.list_rows(table_reference, max_results=num_rows)
-            table_sample_rows = [dict(row.items()) for row in rows_iterator]
-            if table_sample_rows:
-                sample_data_results.append(
-                    {"table_name": full_table_name, "sample_rows": table_sample_rows}
-                )
-            else:
-                logger.info(
-                    f"[{DISPLAY_NAME}] No sample data found for table '{full_table_name}'."
-                )
-        except Exception as e:
+        logger.info(
+            f"[{DISPLAY_NAME}] Fetching sample data for table: {full_table_name}"
+        )
+        table_reference = TableReference.from_string(
+            full_table_name, default_project=project_id
+        )
+        rows_iterator = client.list_rows(table_reference, max_results=num_rows)
+        return [dict(row.items()) for row in rows_iterator]
+
+    failed_tables = []
+    for table_id_str, table_sample_rows, error in map_concurrently(
+        fetch_sample_rows, tables_to_fetch_samples_from_ids
+    ):
+        full_table_name = f"{project_id}.{dataset_id}.{table_id_str}"
+        if error is not None:
             logger.error(
-                f"[{DISPLAY_NAME}] Error fetching sample data for table {full_table_name}: {e}",
-                exc_info=True,
+                f"[{DISPLAY_NAME}] Error fetching sample data for table {full_table_name}: {error}",
+                exc_info=error,
             )
+            failed_tables.append(full_table_name)
             continue
+        if table_sample_rows:
+            sample_data_results.append(
+                {"table_name": full_table_name, "sample_rows": table_sample_rows}
+            )
+        else:
+            logger.info(
+                f"[{DISPLAY_NAME}] No sample data found for table '{full_table_name}'."
+            )
 
     end_time = time.time()
     duration = end_time - start_time
     logger.info(
         f"[{DISPLAY_NAME}] --- Successfully fetched {len(sample_data_results)} sample data sets (Duration: {duration:.2f} seconds) ---"
     )
+    if failed_tables:
+        raise PartialFetchError(f"Could not fetch sample data of {', '.join(failed_tables)}", sample_data_results)
     return sample_data_results
 
 
+def is_rollup_table(table_name: str) -> bool:
+    """Returns True if the table is one of the pre-aggregated rollups of a base table."""
+    return any(table_name.endswith(suffix) for suffix in ROLLUP_TABLE_SUFFIXES)
+
+
 def convert_proto_to_dict(obj):
     if isinstance(obj, maps.MapComposite):
         return {k: convert_proto_to_dict(v) for k, v in obj.items()}
@@ -345,8 +361,9 @@ def fetch_table_entry_metadata() -> list[dict]:
     The aspects to be fetched are controlled by the ASPECT_TYPES environment variable.
     If ASPECT_TYPES is set (as a comma-separated list of aspect type IDs), only those aspects are fetched.
     If ASPECT_TYPES is empty, no aspects are fetched.
-    This function is designed to fail gracefully, returning an empty list if it
-    encounters any issues (e.g., permissions errors during a CI/CD build).
+    Errors (e.g. missing Dataplex permissions during a CI/CD build) are logged and raised,
+    so the instruction build proceeds without this metadata and does not cache the result;
+    entries that cannot be read raise `PartialFetchError` with the metadata that was fetched.
     """
     try:
         start_time = time.time()
@@ -361,7 +378,7 @@ def fetch_table_entry_metadata() -> list[dict]:
             f"tables='{table_names_val if table_names_val else 'All'}'"
         )
         all_entry_metadata: list[dict] = []
-        client = dataplex_v1.CatalogServiceClient()
+        client = get_dataplex_catalog_client()
         target_entry_names: list[str] = []
 
         if table_names_val:
@@ -387,53 +404,133 @@ def fetch_table_entry_metadata() -> list[dict]:
             )
             return []
 
-        for entry_name in target_entry_names:
-            try:
-                get_entry_request = dataplex_v1.GetEntryRequest(
-                    name=entry_name, view=dataplex_v1.EntryView.CUSTOM
-                )
-                if ASPECT_TYPES:
-                    get_entry_request.aspect_types = [
-                        f"projects/{project_id_val}/locations/{location_val}/aspectTypes/{aspect}"
-                        for aspect in ASPECT_TYPES
-                    ]
-                    logger.debug(f"get_entry_request.aspect_types : {get_entry_request.aspect_types}")
-                else:
-                    continue
+        if not ASPECT_TYPES:
+            logger.info(
+                f"[{DISPLAY_NAME}] ASPECT_TYPES is not configured. Skipping aspect fetching."
+            )
+            return []
 
-                entry = client.get_entry(request=get_entry_request)
-                aspects_data = {
-                    aspect_key: convert_proto_to_dict(aspect.data)
-                    for aspect_key, aspect in entry.aspects.items()
-                    if hasattr(aspect, "data") and aspect.data
-                }
-                if aspects_data:
-                    metadata = {
-                        "table_name": entry_name.split("/")[-1],
-                        "aspects": aspects_data,
-                    }
-                    all_entry_metadata.append(metadata)
-            except Exception as e:
+        aspect_types = [
+            f"projects/{project_id_val}/locations/{location_val}/aspectTypes/{aspect}"
+            for aspect in ASPECT_TYPES
+        ]
+        logger.debug(f"get_entry_request.aspect_types : {aspect_types}")
+
+        def fetch_entry(entry_name: str):
+            get_entry_request = dataplex_v1.GetEntryRequest(
+                name=entry_name,
+                view=dataplex_v1.EntryView.CUSTOM,
+                aspect_types=aspect_types,
+            )
+            return client.get_entry(request=get_entry_request)
+
+        failed_entries = []
+        for entry_name, entry, error in map_concurrently(fetch_entry, target_entry_names):
+            if error is not None:
                 logger.warning(
-                    f"[{DISPLAY_NAME}] Could not fetch metadata for single entry {entry_name}. Skipping. Error: {e}"
+                    f"[{DISPLAY_NAME}] Could not fetch metadata for single entry {entry_name}. Skipping. Error: {error}"
                 )
+                failed_entries.append(entry_name)
                 continue
+            aspects_data = {
+                aspect_key: convert_proto_to_dict(aspect.data)
+                for aspect_key, aspect in entry.aspects.items()
+                if hasattr(aspect, "data") and aspect.data
+            }
+            if aspects_data:
+                metadata = {
+                    "table_name": entry_name.split("/")[-1],
+                    "aspects": aspects_data,
+                }
+                all_entry_metadata.append(metadata)
 
         duration = time.time() - start_time
         logger.info(
             f"[{DISPLAY_NAME}] --- Successfully fetched {len(all_entry_metadata)} entry metadata sets (Duration: {duration:.2f} seconds) ---"
         )
+        if failed_entries:
+            raise PartialFetchError(f"Could not fetch Dataplex metadata of {len(failed_entries)} entries", all_entry_metadata)
         return all_entry_metadata
 
+    except PartialFetchError:
+        raise
     except Exception as e:
         logger.warning(
             f"[{DISPLAY_NAME}] Could not fetch Dataplex metadata. This can be expected during a build process "
             f"if the service account lacks Dataplex permissions. The agent will proceed without this metadata. Error: {e}"
         )
-        return []
+        raise
+
+
+def build_table_ddl(table_ref, table_obj) -> str:
+    """Generates a CREATE TABLE DDL statement with column and table descriptions for a BigQuery table."""
+    ddl_statement = f"CREATE TABLE `{table_ref}`\n(\n"
+
+    fields_ddl = []
+    for field in table_obj.schema:
+        field_type_mapping = {
+            'INTEGER': 'INT64',
+            'FLOAT': 'FLOAT64',
+            'BOOLEAN': 'BOOL'
+        }
+        field_type = field_type_mapping.get(field.field_type, field.field_type)
+
+        field_ddl = f"  {field.name} {field_type}"
+
+        description = field.description or ""
+
+        if description:
+            escaped_description = description.replace('"', '\"')
+            field_ddl += f' OPTIONS(description="{escaped_description}")'
+
+        fields_ddl.append(field_ddl)
+
+    ddl_statement += ",\n".join(fields_ddl)
+    ddl_statement += "\n)"
+
+    partition_clause = _build_partition_clause(table_obj)
+    if partition_clause:
+        ddl_statement += f"\n{partition_clause}"
+    if table_obj.clustering_fields:
+        ddl_statement += f"\nCLUSTER BY {', '.join(table_obj.clustering_fields)}"
+
+    if table_obj.description:
+        escaped_table_description = table_obj.description.replace('"', '\"')
+        ddl_statement += f"\nOPTIONS(\n  description=\"{escaped_table_description}\"\n)"
+
+    ddl_statement += ";\n\n"
+    return ddl_statement
+
+
+def _build_partition_clause(table_obj) -> str:
+    """Returns the PARTITION BY clause of a table, so the model can write partition-pruned filters."""
+    time_partitioning = table_obj.time_partitioning
+    if time_partitioning is not None:
+        granularity = time_partitioning.type_ or "DAY"
+        field_name = time_partitioning.field
+        if not field_name:
+            return "PARTITION BY _PARTITIONDATE" if granularity == "DAY" else f"PARTITION BY TIMESTAMP_TRUNC(_PARTITIONTIME, {granularity})"
+        field_type = next((field.field_type for field in table_obj.schema if field.name == field_name), "TIMESTAMP")
+        if field_type == "DATE":
+            return f"PARTITION BY {field_name}" if granularity == "DAY" else f"PARTITION BY DATE_TRUNC({field_name}, {granularity})"
+        if granularity == "DAY":
+            return f"PARTITION BY DATE({field_name})"
+        truncate_function = "DATETIME_TRUNC" if field_type == "DATETIME" else "TIMESTAMP_TRUNC"
+        return f"PARTITION BY {truncate_function}({field_name}, {granularity})"
+    range_partitioning = table_obj.range_partitioning
+    if range_partitioning is not None:
+        partition_range = range_partitioning.range_
+        return (
+            f"PARTITION BY RANGE_BUCKET({range_partitioning.field}, "
+            f"GENERATE_ARRAY({partition_range.start}, {partition_range.end}, {partition_range.interval}))"
+        )
+    return ""
+
 
 def get_table_info():
     """Retrieves schema and generates DDL with example values for a BigQuery dataset.
+    The per-table `get_table` calls run concurrently; a table that cannot be fetched is skipped
+    and reported by raising `PartialFetchError` with the DDL of the other tables.
 
 
     Returns:
@@ -445,56 +542,125 @@ def get_table_info():
     dataset_id_val = DATASET_NAME
     table_names_val = TABLE_NAMES
 
-    client = bigquery.Client(project=project_id_val)
+    client = get_bigquery_client(project_id_val, LOCATION)
 
     dataset_ref = bigquery.DatasetReference(project_id_val, dataset_id_val)
 
     if not table_names_val:
-        table_names_val = [table.table_id for table in client.list_tables(dataset_ref)]
+        table_names_val = [
+            table.table_id for table in client.list_tables(dataset_ref)
+            if not is_rollup_table(table.table_id)
+        ]
 
     ddl_statements = ""
+    failed_tables = []
 
-    for table_name in table_names_val:
-        table_ref = dataset_ref.table(table_name)
-        table_obj = client.get_table(table_ref)
-
-        ddl_statement = f"CREATE TABLE `{table_ref}`\n(\n"
-        
-        fields_ddl = []
-        for field in table_obj.schema:
-            field_type_mapping = {
-                'INTEGER': 'INT64',
-                'FLOAT': 'FLOAT64',
-                'BOOLEAN': 'BOOL'
-            }
-            field_type = field_type_mapping.get(field.field_type, field.field_type)
+    table_refs = [dataset_ref.table(table_name) for table_name in table_names_val]
+    for table_ref, table_obj, error in map_concurrently(client.get_table, table_refs):
+        if error is not None:
+            logger.error(
+                f"[{DISPLAY_NAME}] Could not fetch schema of table {table_ref}. Skipping. Error: {error}"
+            )
+            failed_tables.append(str(table_ref))
+            continue
+        ddl_statements += build_table_ddl(table_ref, table_obj)
+    
+    end_time = time.time()
+    duration = end_time - start_time
+    logger.info(
+        f"--- Successfully fetched schema of {len(table_names_val)} tables "
+        f"(Duration: {duration:.2f} seconds) ---"
+    )
+    if failed_tables:
+        raise PartialFetchError(f"Could not fetch the schema of {', '.join(failed_tables)}", ddl_statements)
+
+    return ddl_statements
 
-            field_ddl = f"  {field.name} {field_type}"
-            
-            description = field.description or ""
+def fetch_table_last_modified(extra_table_ids: list[str] | None = None) -> dict[str, str | None]:
+    """
+    Fetches the `last_modified` time of the target tables (PROJECT_ID, DATASET_NAME, TABLE_NAMES)
+    and of any extra fully qualified tables, e.g. the data profiles or few-shot examples tables.
+    Only table metadata is read, so this is much cheaper than rebuilding the instruction.
+    Args:
+        extra_table_ids: Additional fully qualified table IDs to include.
+    Returns:
+        A dictionary mapping fully qualified table IDs to ISO formatted `last_modified` times,
+        an empty string for a table that does not exist, or None for a table whose lookup
+        failed. Raises if the dataset's tables cannot be listed.
+    """
+    if not PROJECT_ID or not DATASET_NAME:
+        return {}
+    start_time = time.time()
+    client = get_bigquery_client(PROJECT_ID, LOCATION)
+    dataset_ref = bigquery.DatasetReference(PROJECT_ID, DATASET_NAME)
+    table_names_val = TABLE_NAMES or [
+        table.table_id for table in client.list_tables(dataset_ref)
+        if not is_rollup_table(table.table_id)
+    ]
+    table_ids = [f"{PROJECT_ID}.{DATASET_NAME}.{table_name}" for table_name in table_names_val]
+    table_ids.extend(table_id for table_id in (extra_table_ids or []) if table_id)
+
+    last_modified = {}
+    for table_id, table_obj, error in map_concurrently(client.get_table, table_ids):
+        if isinstance(error, NotFound):
+            last_modified[table_id] = ""
+        elif error is not None:
+            logger.warning(f"[{DISPLAY_NAME}] Could not fetch last_modified of {table_id}. Error: {error}")
+            last_modified[table_id] = None
+        else:
+            last_modified[table_id] = table_obj.modified.isoformat() if table_obj.modified else ""
 
-            if description:
-                escaped_description = description.replace('"', '\"')
-                field_ddl += f' OPTIONS(description="{escaped_description}")'
-            
-            fields_ddl.append(field_ddl)
+    duration = time.time() - start_time
+    logger.info(
+        f"[{DISPLAY_NAME}] --- Fetched last_modified of {len(last_modified)} tables (Duration: {duration:.2f} seconds) ---"
+    )
+    return last_modified
 
-        ddl_statement += ",\n".join(fields_ddl)
-        ddl_statement += "\n)"
 
-        if table_obj.description:
-            escaped_table_description = table_obj.description.replace('"', '\"')
-            ddl_statement += f"\nOPTIONS(\n  description=\"{escaped_table_description}\"\n)"
+def fetch_rollup_tables() -> list:
+    """
+    Fetches the pre-aggregated rollup tables that exist for the target tables.
+    Returns:
+        A list of `bigquery.Table` objects, in base table order. Rollups that have not been
+        built yet are skipped. Raises if the dataset cannot be listed or a rollup lookup
+        fails for any reason other than the table not existing, so a transient error is not
+        mistaken for "no rollups built".
+    """
+    if not PROJECT_ID or not DATASET_NAME:
+        return []
+    client = get_bigquery_client(PROJECT_ID, LOCATION)
+    dataset_ref = bigquery.DatasetReference(PROJECT_ID, DATASET_NAME)
+    base_table_names = TABLE_NAMES or [
+        table.table_id for table in client.list_tables(dataset_ref)
+        if not is_rollup_table(table.table_id)
+    ]
+    rollup_refs = [
+        dataset_ref.table(f"{table_name}{suffix}")
+        for table_name in base_table_names
+        for suffix in ROLLUP_TABLE_SUFFIXES
+    ]
+    rollup_tables = []
+    for table_ref, table_obj, error in map_concurrently(client.get_table, rollup_refs):
+        # A missing rollup simply raises NotFound and is left out.
+        if isinstance(error, NotFound):
+            continue
+        if error is not None:
+            logger.warning(f"[{DISPLAY_NAME}] Could not fetch rollup table {table_ref}. Error: {error}")
+            raise error
+        rollup_tables.append(table_obj)
+    return rollup_tables
 
-        ddl_statement += ";\n\n"
 
-        ddl_statements += ddl_statement
-    
-    end_time = time.time()
-    duration = end_time - start_time
+def get_rollup_table_info() -> str:
+    """Generates DDL statements for the rollup tables that exist, or an empty string if there are none."""
+    start_time = time.time()
+    rollup_tables = fetch_rollup_tables()
+    ddl_statements = "".join(
+        build_table_ddl(table_obj.reference, table_obj) for table_obj in rollup_tables
+    )
+    duration = time.time() - start_time
     logger.info(
-        f"--- Successfully fetched schema of {len(table_names_val)} tables "
+        f"[{DISPLAY_NAME}] --- Successfully fetched schema of {len(rollup_tables)} rollup tables "
         f"(Duration: {duration:.2f} seconds) ---"
     )
-
-    return ddl_statements
\ No newline at end of file
+    return ddl_statements
@@ -0,0 +1,380 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import array
+import functools
+import json
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from .clients import get_bigquery_client, get_genai_client
+
+PROJECT_ID = os.getenv("BQ_DATA_PROJECT_ID", "")
+DATASET_NAME = os.getenv("BQ_DATASET_NAME", "")
+LOCATION = os.getenv("BQ_LOCATION", "")
+TABLE_NAMES = os.getenv("BQ_TABLE_NAMES", "").split(",") if os.getenv("BQ_TABLE_NAMES") else []
+DISPLAY_NAME = os.getenv("AGENT_DISPLAY_NAME", "")
+
+VECTOR_INDEX_TABLE_ID = os.getenv("VECTOR_INDEX_TABLE_ID") or (
+    f"{PROJECT_ID}.{DATASET_NAME}.{TABLE_NAMES[0]}" if PROJECT_ID and DATASET_NAME and TABLE_NAMES else ""
+)
+# Must be persistent storage shared by the build job and the agent; the agent never builds.
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "")
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "8"))
+VECTOR_INDEX_REFRESH_SECONDS = float(os.getenv("VECTOR_INDEX_REFRESH_SECONDS", "3600"))
+VECTOR_INDEX_EMBEDDING_MODEL = os.getenv("VECTOR_INDEX_EMBEDDING_MODEL", "text-embedding-004")
+
+# Columns returned with each match, when the table has them.
+METADATA_COLUMNS = ["id", "text", "Created_Time", "Brands_Mentioned", "overall_sentiment", "mentions"]
+_MAX_TEXT_CHARS = 500
+_KMEANS_ITERATIONS = 10
+_ASSIGN_CHUNK_ROWS = 65536
+
+# --- Logging Configuration ---
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _train_centroids(vectors: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of the (unit-length) vectors."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * 64)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(_KMEANS_ITERATIONS):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        for cluster in range(nlist):
+            members = sample[assignments == cluster]
+            if len(members):
+                centroids[cluster] = members.sum(axis=0)
+        centroids = _normalize_rows(centroids).astype(np.float32)
+    return centroids
+
+
+def _line_offsets(buffer) -> np.ndarray:
+    """Byte offsets of the start of each line, followed by the end of the buffer."""
+    offsets = [0]
+    position = buffer.find(b"\n")
+    while position != -1:
+        offsets.append(position + 1)
+        position = buffer.find(b"\n", position + 1)
+    if offsets[-1] != len(buffer):
+        offsets.append(len(buffer))
+    return np.asarray(offsets, dtype=np.int64)
+
+
+class VectorIndex:
+    """
+    Inverted-file (IVF) approximate nearest-neighbour index over unit-length float32 vectors.
+
+    Vectors are stored sorted by cluster in a memory-mapped `.npy` file, so the process only
+    pages in the clusters a query probes. `offsets[c]:offsets[c + 1]` is the slice of cluster c.
+    The metadata file is memory-mapped too, and only the lines of the returned matches are
+    decoded, through the byte offset of each line in `metadata_offsets.npy`.
+    """
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.index_dir = index_dir
+        self.vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r")
+        self.centroids = np.load(os.path.join(index_dir, "centroids.npy"))
+        self.offsets = np.load(os.path.join(index_dir, "offsets.npy"))
+        self.row_order = np.load(os.path.join(index_dir, "row_order.npy"), mmap_mode="r")
+        with open(os.path.join(index_dir, "metadata.jsonl"), "rb") as f:
+            self._metadata = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        offsets_path = os.path.join(index_dir, "metadata_offsets.npy")
+        if os.path.exists(offsets_path):
+            self.metadata_offsets = np.load(offsets_path, mmap_mode="r")
+        else:
+            # Indexes built before the offsets were saved: find the line starts once.
+            self.metadata_offsets = _line_offsets(self._metadata)
+
+    def get_metadata(self, row: int) -> dict:
+        start, end = int(self.metadata_offsets[row]), int(self.metadata_offsets[row + 1])
+        return json.loads(self._metadata[start:end])
+
+    @property
+    def version(self) -> str:
+        return self.manifest["table_version"]
+
+    def search(self, query_vector, top_k: int = 10, nprobe: int = VECTOR_INDEX_NPROBE) -> list[tuple[float, dict]]:
+        """Returns up to `top_k` (cosine similarity, metadata) pairs, best first."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        nprobe = max(1, min(nprobe, len(self.centroids)))
+        probed_clusters = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+
+        positions, scores = [], []
+        for cluster in probed_clusters:
+            start, end = int(self.offsets[cluster]), int(self.offsets[cluster + 1])
+            if start == end:
+                continue
+            positions.append(np.arange(start, end))
+            scores.append(self.vectors[start:end] @ query)
+        if not scores:
+            return []
+        positions = np.concatenate(positions)
+        scores = np.concatenate(scores)
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [
+            (float(scores[i]), self.get_metadata(int(self.row_order[positions[i]])))
+            for i in best
+        ]
+
+
+class VectorIndexUnavailableError(RuntimeError):
+    """Raised when no index has been built for the table yet."""
+
+
+def _index_root(table_id: str) -> str:
+    if not VECTOR_INDEX_DIR:
+        raise VectorIndexUnavailableError(
+            "VECTOR_INDEX_DIR is not set; point it at persistent storage and build the index "
+            "with `python -m data_agent.vector_index`."
+        )
+    return os.path.join(VECTOR_INDEX_DIR, table_id.replace(".", "__"))
+
+
+def _get_table_version(table_id: str) -> tuple[str, list[str]]:
+    client = get_bigquery_client(table_id.split(".")[0], LOCATION)
+    table_obj = client.get_table(table_id)
+    version = str(int(table_obj.modified.timestamp() * 1000)) if table_obj.modified else "0"
+    column_names = [field.name for field in table_obj.schema]
+    return version, column_names
+
+
+def build_vector_index(table_id: str = VECTOR_INDEX_TABLE_ID) -> VectorIndex:
+    """
+    Builds the index from a snapshot of the rows of `table_id` that have an embedding and
+    writes it under VECTOR_INDEX_DIR, keyed by the table's `last_modified` time. Older
+    versions are removed once the new one is published.
+    Vectors and metadata are streamed to disk page by page, so memory holds one page and
+    the byte offset of each metadata line.
+    """
+    start_time = time.time()
+    version, column_names = _get_table_version(table_id)
+    metadata_columns = [column for column in METADATA_COLUMNS if column in column_names]
+    index_root = _index_root(table_id)
+    os.makedirs(index_root, exist_ok=True)
+    build_dir = tempfile.mkdtemp(dir=index_root, prefix=f"{version}.building.")
+
+    client = get_bigquery_client(table_id.split(".")[0], LOCATION)
+    select_list = ", ".join(f"`{column}`" for column in metadata_columns)
+    query = f"""
+        SELECT {select_list}{", " if select_list else ""}text_embedding
+        FROM `{table_id}`
+        WHERE ARRAY_LENGTH(text_embedding) > 0
+    """
+    raw_path = os.path.join(build_dir, "vectors.raw")
+    num_rows, dimensions = 0, None
+    metadata_offsets = array.array("q", [0])
+    with open(raw_path, "wb") as raw_file, open(os.path.join(build_dir, "metadata.jsonl"), "wb") as meta_file:
+        for page in client.query(query).result(page_size=10000).pages:
+            page_vectors = []
+            for row in page:
+                vector = row["text_embedding"]
+                if dimensions is None:
+                    dimensions = len(vector)
+                if len(vector) != dimensions:
+                    continue
+                page_vectors.append(vector)
+                meta = {column: row[column] for column in metadata_columns}
+                if isinstance(meta.get("text"), str):
+                    meta["text"] = meta["text"][:_MAX_TEXT_CHARS]
+                line = (json.dumps(meta, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+                meta_file.write(line)
+                metadata_offsets.append(metadata_offsets[-1] + len(line))
+            if page_vectors:
+                _normalize_rows(np.asarray(page_vectors, dtype=np.float32)).tofile(raw_file)
+                num_rows += len(page_vectors)
+    if not num_rows:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise ValueError(f"No rows with text_embedding found in {table_id}.")
+
+    unsorted = np.memmap(raw_path, dtype=np.float32, mode="r", shape=(num_rows, dimensions))
+    nlist = int(min(max(np.sqrt(num_rows), 1), 4096))
+    centroids = _train_centroids(unsorted, nlist)
+    assignments = np.empty(num_rows, dtype=np.int32)
+    for start in range(0, num_rows, _ASSIGN_CHUNK_ROWS):
+        chunk = np.asarray(unsorted[start:start + _ASSIGN_CHUNK_ROWS])
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    row_order = np.argsort(assignments, kind="stable")
+    offsets = np.searchsorted(assignments[row_order], np.arange(nlist + 1))
+
+    vectors = np.lib.format.open_memmap(
+        os.path.join(build_dir, "vectors.npy"), mode="w+", dtype=np.float32, shape=(num_rows, dimensions)
+    )
+    for start in range(0, num_rows, _ASSIGN_CHUNK_ROWS):
+        vectors[start:start + _ASSIGN_CHUNK_ROWS] = unsorted[row_order[start:start + _ASSIGN_CHUNK_ROWS]]
+    vectors.flush()
+    del vectors, unsorted
+    os.remove(raw_path)
+    np.save(os.path.join(build_dir, "centroids.npy"), centroids)
+    np.save(os.path.join(build_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(build_dir, "row_order.npy"), row_order)
+    np.save(os.path.join(build_dir, "metadata_offsets.npy"), np.frombuffer(metadata_offsets, dtype=np.int64))
+    manifest = {
+        "table_id": table_id,
+        "table_version": version,
+        "rows": num_rows,
+        "dimensions": dimensions,
+        "nlist": nlist,
+        "built_at": time.time(),
+    }
+    with open(os.path.join(build_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    # Publish atomically; a half-built directory never has the final name.
+    index_dir = os.path.join(index_root, version)
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(build_dir, index_dir)
+    _prune_old_versions(index_root, version)
+    logger.info(
+        f"[{DISPLAY_NAME}] --- Built vector index for {table_id}: {num_rows} vectors, {nlist} clusters "
+        f"(Duration: {time.time() - start_time:.2f} seconds) ---"
+    )
+    return VectorIndex(index_dir)
+
+
+def _prune_old_versions(index_root: str, current_version: str) -> None:
+    """
+    Removes the versions older than `current_version`. Processes still searching an old
+    version keep their memory maps until they load the new one.
+    """
+    for name in os.listdir(index_root):
+        if name.isdigit() and int(name) < int(current_version):
+            shutil.rmtree(os.path.join(index_root, name), ignore_errors=True)
+            logger.info(f"[{DISPLAY_NAME}] Removed vector index version {name} of {index_root}.")
+
+
+def _latest_version(table_id: str) -> Optional[str]:
+    index_root = _index_root(table_id)
+    if not os.path.isdir(index_root):
+        return None
+    versions = [
+        name for name in os.listdir(index_root)
+        if name.isdigit() and os.path.exists(os.path.join(index_root, name, "manifest.json"))
+    ]
+    return max(versions, key=int) if versions else None
+
+
+def _load_latest_index(table_id: str) -> Optional[VectorIndex]:
+    version = _latest_version(table_id)
+    return VectorIndex(os.path.join(_index_root(table_id), version)) if version else None
+
+
+def refresh_vector_index(table_id: str = VECTOR_INDEX_TABLE_ID) -> Optional[VectorIndex]:
+    """Builds a new index if the table changed since the latest one; returns it, or None if current."""
+    version, _ = _get_table_version(table_id)
+    if _latest_version(table_id) == version:
+        logger.info(f"[{DISPLAY_NAME}] Vector index of {table_id} is current (version {version}).")
+        return None
+    return build_vector_index(table_id)
+
+
+class VectorIndexManager:
+    """
+    Holds the loaded index of one table. Indexes are only built offline, by
+    `python -m data_agent.vector_index` (run by the infrastructure setup and on a schedule);
+    this loads the newest version from disk and, every VECTOR_INDEX_REFRESH_SECONDS, a
+    background thread switches to a newer version if one was published, while searches
+    keep using the current one.
+    """
+    def __init__(self, table_id: str = VECTOR_INDEX_TABLE_ID, refresh_seconds: float = VECTOR_INDEX_REFRESH_SECONDS):
+        self.table_id = table_id
+        self.refresh_seconds = refresh_seconds
+        self._index: Optional[VectorIndex] = None
+        self._checked_at = 0.0
+        self._load_lock = threading.Lock()
+        self._refresh_state_lock = threading.Lock()
+        self._refresh_in_progress = False
+
+    def get_index(self) -> VectorIndex:
+        """Raises VectorIndexUnavailableError when no index has been built yet."""
+        if self._index is None:
+            with self._load_lock:
+                if self._index is None:
+                    index = _load_latest_index(self.table_id)
+                    if index is None:
+                        raise VectorIndexUnavailableError(
+                            f"No vector index has been built for {self.table_id} in {VECTOR_INDEX_DIR}; "
+                            "build it with `python -m data_agent.vector_index`."
+                        )
+                    self._index = index
+                    self._checked_at = time.time()
+        elif time.time() - self._checked_at > self.refresh_seconds:
+            self._refresh_in_background()
+        return self._index
+
+    def _refresh_in_background(self) -> None:
+        with self._refresh_state_lock:
+            if self._refresh_in_progress:
+                return
+            self._refresh_in_progress = True
+        threading.Thread(target=self._background_refresh, name="vector-index-refresh", daemon=True).start()
+
+    def _background_refresh(self) -> None:
+        try:
+            version = _latest_version(self.table_id)
+            if version is not None and int(version) > int(self._index.version):
+                self._index = VectorIndex(os.path.join(_index_root(self.table_id), version))
+                logger.info(f"[{DISPLAY_NAME}] Loaded vector index version {version} of {self.table_id}.")
+        except Exception as e:
+            logger.error(f"[{DISPLAY_NAME}] Vector index refresh failed: {e}", exc_info=True)
+        finally:
+            self._checked_at = time.time()
+            with self._refresh_state_lock:
+                self._refresh_in_progress = False
+
+
+@functools.lru_cache(maxsize=1024)
+def embed_query(text: str) -> tuple[float, ...]:
+    """Embeds a search query with the model used to backfill `text_embedding`."""
+    response = get_genai_client().models.embed_content(model=VECTOR_INDEX_EMBEDDING_MODEL, contents=text)
+    return tuple(response.embeddings[0].values)
+
+
+_vector_index_manager = VectorIndexManager()
+
+
+def get_vector_index_manager() -> VectorIndexManager:
+    """Returns the process-wide vector index manager."""
+    return _vector_index_manager
+
+
+if __name__ == "__main__":
+    # Builds the index when the table has changed since the last build; run it after the
+    # embedding backfill and on a schedule:
+    #   python -m data_agent.vector_index
+    refresh_vector_index()
@@ -15,11 +15,13 @@ function App() {
     'Another past chat',
   ]);
   const [isTyping, setIsTyping] = useState(false);
+  const [progress, setProgress] = useState(null);
 
   const handleSendMessage = async (text) => {
     const userMessage = { text, sender: 'user' };
     setMessages(prev => [...prev, userMessage]);
     setIsTyping(true);
+    setProgress(null);
 
     // Create a placeholder for the bot's response
     const botMessageId = Date.now();
@@ -68,7 +70,18 @@ function App() {
                 setSessionId(event.session_id);
               }
 
-              // 2. Parse Content (Text or Tool Calls)
+              // 2. Progress of the turn (planning, query checks, BigQuery job state)
+              if (event.progress) {
+                setProgress(event.progress.message);
+                setMessages(prevMessages => {
+                  const newMsgs = [...prevMessages];
+                  const lastMsg = newMsgs[newMsgs.length - 1];
+                  newMsgs[newMsgs.length - 1] = { ...lastMsg, logs: [...(lastMsg.logs || []), `⏳ ${event.progress.message}`] };
+                  return newMsgs;
+                });
+              }
+
+              // 3. Parse Content (Text or Tool Calls)
               if (event.content && event.content.parts) {
                 setMessages(prevMessages => {
                   const newMsgs = [...prevMessages];
@@ -78,9 +91,18 @@ function App() {
                   const updatedMsg = { ...lastMsg, logs: [...(lastMsg.logs || [])] };
 
                   event.content.parts.forEach(part => {
-                    // A. Text Content
+                    // A. Text Content. Streamed chunks arrive as partial events, then the
+                    // complete response repeats them, so it replaces the streamed chunks.
                     if (part.text) {
-                      updatedMsg.text = (updatedMsg.text || '') + part.text;
+                      const text = updatedMsg.text || '';
+                      const streamedLength = updatedMsg.streamedLength || 0;
+                      if (event.partial) {
+                        updatedMsg.text = text + part.text;
+                        updatedMsg.streamedLength = streamedLength + part.text.length;
+                      } else {
+                        updatedMsg.text = text.slice(0, text.length - streamedLength) + part.text;
+                        updatedMsg.streamedLength = 0;
+                      }
                     }
 
                     // B. Function Calls (Logs)
@@ -104,9 +126,12 @@ function App() {
                   newMsgs[newMsgs.length - 1] = updatedMsg;
                   return newMsgs;
                 });
+                if (event.content.parts.some(part => part.text)) {
+                  setProgress(null);
+                }
               }
 
-              // 3. Handle Errors
+              // 4. Handle Errors
               if (event.error) {
                 console.error("Agent Error:", event.error);
                 setMessages(prev => {
@@ -134,6 +159,7 @@ function App() {
       });
     } finally {
       setIsTyping(false);
+      setProgress(null);
     }
   };
 
@@ -153,7 +179,7 @@ function App() {
         <div className="main-content">
           <Header />
           <div className="chat-container">
-            <ChatWindow messages={messages} isTyping={isTyping} />
+            <ChatWindow messages={messages} isTyping={isTyping} progress={progress} />
             <ChatInput onSendMessage={handleSendMessage} />
           </div>
         </div>
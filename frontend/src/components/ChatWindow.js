@@ -1,14 +1,14 @@
 import React, { useEffect, useRef } from 'react';
 import Message from './Message';
 
-const ChatWindow = ({ messages, isTyping }) => {
+const ChatWindow = ({ messages, isTyping, progress }) => {
   const chatWindowRef = useRef(null);
 
   useEffect(() => {
     if (chatWindowRef.current) {
       chatWindowRef.current.scrollTop = chatWindowRef.current.scrollHeight;
     }
-  }, [messages, isTyping]);
+  }, [messages, isTyping, progress]);
 
   return (
     <div className="chat-window" ref={chatWindowRef}>
@@ -22,6 +22,7 @@ const ChatWindow = ({ messages, isTyping }) => {
           <span></span>
         </div>
       )}
+      {isTyping && progress && <div className="progress-status">{progress}</div>}
     </div>
   );
 };
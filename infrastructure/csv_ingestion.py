@@ -0,0 +1,258 @@
+import datetime
+import logging
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from google.cloud import bigquery
+
+logger = logging.getLogger(__name__)
+
+CSV_SCHEMA_SAMPLE_ROWS = int(os.getenv("CSV_SCHEMA_SAMPLE_ROWS", "50000"))
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "200000"))
+CSV_INGEST_MAX_WORKERS = int(os.getenv("CSV_INGEST_MAX_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+_BOOLEAN_VALUES = {"true": True, "false": False, "t": True, "f": False, "yes": True, "no": False}
+
+
+def sanitize_column_name(name: str) -> str:
+    """Replaces every non-alphanumeric character with '_', as BigQuery column names require."""
+    return "".join([c if c.isalnum() else "_" for c in name])
+
+
+def _parse_timestamps(values: pd.Series) -> pd.Series:
+    parsed = pd.to_datetime(values, errors="coerce", utc=True, format="ISO8601")
+    if parsed.notna().sum() < values.notna().sum():
+        parsed = pd.to_datetime(values, errors="coerce", utc=True, format="mixed")
+    return parsed
+
+
+def infer_column_type(values: pd.Series) -> str:
+    """
+    Infers the BigQuery type of a column of raw CSV strings with vectorized checks.
+    A type is chosen only if every non-empty sampled value parses as that type.
+    """
+    values = values.dropna()
+    values = values[values.str.strip() != ""]
+    if values.empty:
+        return "STRING"
+    lowered = values.str.strip().str.lower()
+    if lowered.isin(_BOOLEAN_VALUES.keys()).all():
+        return "BOOLEAN"
+    numbers = pd.to_numeric(values, errors="coerce")
+    if numbers.notna().all():
+        is_integral = (numbers == numbers.round()).all() and not values.str.contains(r"[.eE]", regex=True).any()
+        return "INTEGER" if is_integral else "FLOAT"
+    if _parse_timestamps(values).notna().all():
+        return "TIMESTAMP"
+    return "STRING"
+
+
+def infer_schema(csv_path: str, sample_rows: int = CSV_SCHEMA_SAMPLE_ROWS) -> List[Tuple[str, str, str]]:
+    """
+    Infers (source column, BigQuery column, BigQuery type) for every column of the CSV
+    from the first `sample_rows` rows.
+    """
+    start_time = time.time()
+    sample = pd.read_csv(csv_path, nrows=sample_rows, dtype=str, keep_default_na=False, na_values=[""])
+    columns = [
+        (column, sanitize_column_name(column), infer_column_type(sample[column]))
+        for column in sample.columns
+    ]
+    logger.info(
+        f"Inferred schema of {len(columns)} columns from {len(sample)} sample rows in {time.time() - start_time:.2f} seconds: "
+        + ", ".join(f"{name} {bq_type}" for _, name, bq_type in columns)
+    )
+    return columns
+
+
+def _parse_integers(values: pd.Series) -> pd.Series:
+    """Parses integer strings straight to int64, without a float round-trip; anything else becomes null."""
+    stripped = values.str.strip()
+    is_integer = stripped.str.fullmatch(r"[+-]?\d+").fillna(False).astype(bool)
+    parsed = pc.cast(pa.array(stripped.where(is_integer, None), type=pa.string()), pa.int64())
+    return pd.Series(parsed.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get), index=values.index)
+
+
+def _convert_chunk(
+    chunk: pd.DataFrame, columns: List[Tuple[str, str, str]], output_path: str
+) -> Tuple[int, int, float, Dict[str, int]]:
+    """
+    Casts a chunk of raw strings to the inferred types and writes it as Parquet. Runs in a worker process.
+    Also returns, per column, how many non-empty values did not parse as its type and became null.
+    """
+    start_time = time.time()
+    converted = {}
+    coerced = {}
+    for source, name, bq_type in columns:
+        values = chunk[source]
+        if bq_type == "INTEGER":
+            converted[name] = _parse_integers(values)
+        elif bq_type == "FLOAT":
+            converted[name] = pd.to_numeric(values, errors="coerce").astype("float64")
+        elif bq_type == "BOOLEAN":
+            converted[name] = values.str.strip().str.lower().map(_BOOLEAN_VALUES).astype("boolean")
+        elif bq_type == "TIMESTAMP":
+            converted[name] = _parse_timestamps(values)
+        else:
+            converted[name] = values.astype("string")
+        non_empty = values.notna() & (values.str.strip() != "")
+        coerced_count = int((non_empty & converted[name].isna()).sum())
+        if coerced_count:
+            coerced[name] = coerced_count
+    frame = pd.DataFrame(converted)
+    frame.to_parquet(output_path, engine="pyarrow", compression="zstd", index=False, coerce_timestamps="us")
+    return len(frame), os.path.getsize(output_path), time.time() - start_time, coerced
+
+
+def _append_new_rows(
+    client: bigquery.Client, staging_table_id: str, table_id: str, dedupe_key: str, watermark_column: Optional[str]
+) -> int:
+    """Inserts the staged rows whose `dedupe_key` is not in the target yet. Returns the number of rows inserted."""
+    query_parameters = []
+    watermark_filter = ""
+    if watermark_column:
+        # A constant bound (unlike a subquery) lets BigQuery prune the target's partitions.
+        min_watermark = next(iter(client.query(
+            f"SELECT MIN({watermark_column}) AS min_watermark FROM `{staging_table_id}`"
+        ).result())).min_watermark
+        if min_watermark is not None:
+            field_type = next(
+                field.field_type for field in client.get_table(table_id).schema if field.name == watermark_column
+            )
+            parameter_type = {"INTEGER": "INT64", "FLOAT": "FLOAT64"}.get(field_type, field_type)
+            query_parameters.append(bigquery.ScalarQueryParameter("min_watermark", parameter_type, min_watermark))
+            watermark_filter = f"AND T.{watermark_column} >= @min_watermark"
+    insert_job = client.query(
+        f"""
+        INSERT INTO `{table_id}`
+        SELECT * FROM `{staging_table_id}` S
+        WHERE NOT EXISTS (
+          SELECT 1 FROM `{table_id}` T
+          WHERE T.{dedupe_key} = S.{dedupe_key} {watermark_filter}
+        )
+        """,
+        job_config=bigquery.QueryJobConfig(query_parameters=query_parameters),
+    )
+    insert_job.result()
+    rows_appended = insert_job.num_dml_affected_rows or 0
+    logger.info(f"Appended {rows_appended} new rows (deduplicated by {dedupe_key}) to {table_id}.")
+    return rows_appended
+
+
+def ingest_csv(
+    client: bigquery.Client,
+    csv_path: str,
+    table_id: str,
+    columns: List[Tuple[str, str, str]],
+    chunk_rows: int = CSV_CHUNK_ROWS,
+    max_workers: int = CSV_INGEST_MAX_WORKERS,
+    dedupe_key: Optional[str] = None,
+    watermark_column: Optional[str] = None,
+) -> Dict[str, float]:
+    """
+    Streams a CSV into `table_id` with bounded memory.
+
+    The file is read in chunks of `chunk_rows` rows. Worker processes convert each chunk
+    to typed Parquet while the next one is read, and each Parquet part is loaded into a
+    uniquely named staging table as soon as it is ready. Once every part has loaded, a
+    single copy job appends the staging table to the target, so a failed run never
+    leaves a partial import behind.
+
+    The load fails if a non-empty value does not parse as its column's inferred type
+    (e.g. text further down a column inferred as INTEGER from the sample), rather than
+    silently loading it as null.
+
+    With `dedupe_key`, the final step instead inserts only the staged rows whose key is
+    not in the target yet. If `watermark_column` is the target's partitioning column,
+    that lookup only scans partitions from the earliest staged value onwards.
+
+    Returns:
+        Ingestion statistics: rows (read from the CSV), rows_appended, csv_bytes, parquet_bytes,
+        duration_seconds, rows_per_second and csv_bytes_per_second.
+    """
+    start_time = time.time()
+    csv_bytes = os.path.getsize(csv_path)
+    # The staging table mirrors the target, so the final copy is a plain append.
+    staging_table_id = f"{table_id}_ingest_staging_{uuid.uuid4().hex[:12]}"
+    staging_table = bigquery.Table(staging_table_id, schema=client.get_table(table_id).schema)
+    staging_table.expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)
+    client.create_table(staging_table)
+
+    load_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.PARQUET,
+        write_disposition="WRITE_APPEND",
+    )
+    total_rows = 0
+    parquet_bytes = 0
+    load_jobs = []
+    pending = {}
+    max_pending = max_workers * 2
+
+    def load_parts(done_futures):
+        nonlocal total_rows, parquet_bytes
+        for future in done_futures:
+            part_path = pending.pop(future)
+            rows, part_bytes, convert_seconds, coerced = future.result()
+            if coerced:
+                raise ValueError(
+                    f"{os.path.basename(part_path)} has values that do not match the inferred column types: "
+                    + ", ".join(f"{name} ({count} values)" for name, count in sorted(coerced.items()))
+                    + ". Raise CSV_SCHEMA_SAMPLE_ROWS so the sample covers them, or create the table as STRING."
+                )
+            total_rows += rows
+            parquet_bytes += part_bytes
+            with open(part_path, "rb") as part_file:
+                load_jobs.append(client.load_table_from_file(part_file, staging_table_id, job_config=load_config))
+            os.remove(part_path)
+            elapsed = time.time() - start_time
+            logger.info(
+                f"Converted {os.path.basename(part_path)}: {rows} rows, {part_bytes / 1024 ** 2:.1f} MiB Parquet "
+                f"in {convert_seconds:.2f} seconds ({total_rows / elapsed:.0f} rows/s overall)."
+            )
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="csv_ingest_") as work_dir, \
+                ProcessPoolExecutor(max_workers=max_workers) as executor:
+            reader = pd.read_csv(csv_path, chunksize=chunk_rows, dtype=str, keep_default_na=False, na_values=[""])
+            for part_number, chunk in enumerate(reader):
+                # Bounded memory: wait for a conversion before reading further ahead.
+                if len(pending) >= max_pending:
+                    done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                    load_parts(done)
+                part_path = os.path.join(work_dir, f"part-{part_number:05d}.parquet")
+                pending[executor.submit(_convert_chunk, chunk, columns, part_path)] = part_path
+            load_parts(list(pending))
+
+        for load_job in load_jobs:
+            load_job.result()
+        if dedupe_key:
+            rows_appended = _append_new_rows(client, staging_table_id, table_id, dedupe_key, watermark_column)
+        else:
+            copy_config = bigquery.CopyJobConfig(write_disposition="WRITE_APPEND")
+            client.copy_table(staging_table_id, table_id, job_config=copy_config).result()
+            rows_appended = total_rows
+    finally:
+        client.delete_table(staging_table_id, not_found_ok=True)
+
+    duration = time.time() - start_time
+    stats = {
+        "rows": total_rows,
+        "rows_appended": rows_appended,
+        "csv_bytes": csv_bytes,
+        "parquet_bytes": parquet_bytes,
+        "duration_seconds": duration,
+        "rows_per_second": total_rows / duration if duration else 0.0,
+        "csv_bytes_per_second": csv_bytes / duration if duration else 0.0,
+    }
+    logger.info(
+        f"Ingested {total_rows} rows ({csv_bytes / 1024 ** 2:.1f} MiB CSV) into {table_id} in {duration:.2f} seconds: "
+        f"{stats['rows_per_second']:.0f} rows/s, {stats['csv_bytes_per_second'] / 1024 ** 2:.1f} MiB/s."
+    )
+    return stats
@@ -0,0 +1,346 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Protocol, Sequence
+
+from google.api_core.exceptions import BadRequest
+
+from embedding_cache import EmbeddingCache, open_embedding_cache, text_hash
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-004")  # 'stub' for offline runs
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "768"))
+EMBEDDING_PAGE_SIZE = int(os.getenv("EMBEDDING_PAGE_SIZE", "2000"))
+EMBEDDING_MAX_WORKERS = int(os.getenv("EMBEDDING_MAX_WORKERS", "8"))
+EMBEDDING_INITIAL_BATCH_SIZE = int(os.getenv("EMBEDDING_INITIAL_BATCH_SIZE", "32"))
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "250"))
+EMBEDDING_MAX_BATCH_CHARS = int(os.getenv("EMBEDDING_MAX_BATCH_CHARS", "60000"))
+EMBEDDING_REQUESTS_PER_MINUTE = float(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "600"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+EMBEDDING_CHECKPOINT_PATH = os.getenv("EMBEDDING_CHECKPOINT_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".embedding_backfill_checkpoint.json"
+)
+
+
+class EmbeddingModel(Protocol):
+    """Anything that turns a batch of texts into one vector per text. `name` scopes cached vectors."""
+    name: str
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        ...
+
+
+class VertexEmbeddingModel:
+    """Vertex AI text embedding model (requires `vertexai.init` to have been called)."""
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        from vertexai.language_models import TextEmbeddingModel
+        self.name = model_name
+        self._model = TextEmbeddingModel.from_pretrained(model_name)
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        return [embedding.values for embedding in self._model.get_embeddings(list(texts))]
+
+
+class StubEmbeddingModel:
+    """
+    Deterministic local model for offline runs: the same text always maps to the same
+    unit vector. `latency_seconds` simulates the model round trip.
+    """
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS, latency_seconds: float = 0.0):
+        self.name = f"stub-{dimensions}"
+        self.dimensions = dimensions
+        self.latency_seconds = latency_seconds
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return [self._vector(text) for text in texts]
+
+    def _vector(self, text: str) -> List[float]:
+        seed = hashlib.sha256(text.encode("utf-8")).digest()
+        rng = random.Random(struct.unpack("<Q", seed[:8])[0])
+        values = [rng.gauss(0.0, 1.0) for _ in range(self.dimensions)]
+        norm = sum(value * value for value in values) ** 0.5 or 1.0
+        return [value / norm for value in values]
+
+
+def load_embedding_model(model_name: str = EMBEDDING_MODEL) -> EmbeddingModel:
+    """Returns the embedding model selected by EMBEDDING_MODEL."""
+    if model_name == "stub":
+        return StubEmbeddingModel()
+    return VertexEmbeddingModel(model_name)
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting model requests to `rate_per_second`, with bursts up to `capacity`."""
+    def __init__(self, rate_per_second: float, capacity: Optional[float] = None):
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity or max(rate_per_second, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate_per_second <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_second)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate_per_second
+            time.sleep(wait_seconds)
+
+
+class AdaptiveBatchSizer:
+    """
+    Additive-increase / multiplicative-decrease batch size: grows after each successful
+    request and halves when the model rejects a batch (payload or token limits).
+    """
+    def __init__(self, initial: int = EMBEDDING_INITIAL_BATCH_SIZE, maximum: int = EMBEDDING_MAX_BATCH_SIZE, step: int = 8):
+        self.maximum = maximum
+        self.step = step
+        self._size = max(1, min(initial, maximum))
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def on_success(self) -> None:
+        with self._lock:
+            self._size = min(self.maximum, self._size + self.step)
+
+    def on_failure(self) -> None:
+        with self._lock:
+            self._size = max(1, self._size // 2)
+
+
+class BackfillCheckpoint:
+    """
+    Progress of a backfill pass, persisted as JSON after every written page.
+
+    `last_id` is the largest id whose page has been written; a restarted run resumes
+    after it. The file is removed once a pass reaches the end of the table, so the next
+    run starts over and retries rows that failed to embed.
+    """
+    def __init__(self, path: str = EMBEDDING_CHECKPOINT_PATH):
+        self.path = path
+        self.last_id = None
+        self.rows_embedded = 0
+        self.rows_failed = 0
+        self.model_calls_saved = 0
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+                self.last_id = state.get("last_id")
+                self.rows_embedded = state.get("rows_embedded", 0)
+                self.rows_failed = state.get("rows_failed", 0)
+                self.model_calls_saved = state.get("model_calls_saved", 0)
+                logger.info(f"Resuming embedding backfill after id {self.last_id!r} ({self.rows_embedded} rows already embedded).")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+
+    def save(self) -> None:
+        state = {
+            "last_id": self.last_id,
+            "rows_embedded": self.rows_embedded,
+            "rows_failed": self.rows_failed,
+            "model_calls_saved": self.model_calls_saved,
+            "updated_at": time.time(),
+        }
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.path)
+
+    def reset(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _split_batches(rows: Sequence[dict], batch_size: int, max_chars: int) -> Iterable[List[dict]]:
+    batch, batch_chars = [], 0
+    for row in rows:
+        text_chars = len(row["text"])
+        if batch and (len(batch) >= batch_size or batch_chars + text_chars > max_chars):
+            yield batch
+            batch, batch_chars = [], 0
+        batch.append(row)
+        batch_chars += text_chars
+    if batch:
+        yield batch
+
+
+class EmbeddingBackfill:
+    """
+    Streams rows without embeddings through the model and writes vectors back in bounded chunks.
+
+    Texts are content-addressed by `text_hash`: each page is deduplicated, vectors already
+    in the embedding cache are reused, and only the remaining distinct texts are sent to
+    the model. One update is written per row, so every repost of a text gets its vector.
+
+    Args:
+        model: The embedding model.
+        fetch_pages: `fetch_pages(last_id, page_size)` yields pages of up to `page_size` rows
+            (dicts with 'id' and 'text') whose id is greater than `last_id`, ordered by id.
+        write_chunk: `write_chunk(updates)` persists a list of {'id', 'text_embedding'} dicts. It may
+            return a future that completes once the updates are written; the checkpoint only
+            moves past a page after that future (and those of all earlier pages) completed.
+        cache: Embedding cache; defaults to the local one (None if EMBEDDING_CACHE_ENABLED is off).
+    """
+    def __init__(
+        self,
+        model: EmbeddingModel,
+        fetch_pages: Callable[[Optional[object], int], Iterable[List[dict]]],
+        write_chunk: Callable[[List[dict]], Optional[Future]],
+        checkpoint: Optional[BackfillCheckpoint] = None,
+        cache: Optional[EmbeddingCache] = None,
+        page_size: int = EMBEDDING_PAGE_SIZE,
+        max_workers: int = EMBEDDING_MAX_WORKERS,
+        requests_per_minute: float = EMBEDDING_REQUESTS_PER_MINUTE,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        max_batch_chars: int = EMBEDDING_MAX_BATCH_CHARS,
+    ):
+        self.model = model
+        self.fetch_pages = fetch_pages
+        self.write_chunk = write_chunk
+        self.checkpoint = checkpoint or BackfillCheckpoint()
+        self.cache = cache if cache is not None else open_embedding_cache()
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.max_batch_chars = max_batch_chars
+        self.rate_limiter = TokenBucket(requests_per_minute / 60.0)
+        self.batch_sizer = AdaptiveBatchSizer()
+
+    def run(self) -> dict:
+        """Runs one pass over the rows after the checkpoint. Returns the pass statistics."""
+        start_time = time.time()
+        pages = 0
+        # Pages handed to the writer whose MERGE may still be running, oldest first.
+        unwritten_pages = deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed") as executor:
+            for rows in self.fetch_pages(self.checkpoint.last_id, self.page_size):
+                if not rows:
+                    continue
+                page_start = time.time()
+                unique_texts = {}
+                row_hashes = []
+                for row in rows:
+                    hash_value = text_hash(row["text"])
+                    unique_texts.setdefault(hash_value, row["text"])
+                    row_hashes.append(hash_value)
+                vectors = self.cache.get_many(self.model.name, unique_texts) if self.cache else {}
+                cache_hits = len(vectors)
+
+                # Batch items carry the text hash as their id.
+                pending = [{"id": hash_value, "text": text} for hash_value, text in unique_texts.items() if hash_value not in vectors]
+                batches = list(_split_batches(pending, self.batch_sizer.size, self.max_batch_chars))
+                embedded = {}
+                for batch, batch_vectors in zip(batches, executor.map(self._embed_batch, batches)):
+                    for item, vector in zip(batch, batch_vectors):
+                        if vector is not None:
+                            embedded[item["id"]] = vector
+                if self.cache:
+                    self.cache.put_many(self.model.name, embedded)
+                vectors.update(embedded)
+
+                updates = [
+                    {"id": row["id"], "text_embedding": vectors[hash_value]}
+                    for row, hash_value in zip(rows, row_hashes)
+                    if hash_value in vectors
+                ]
+                write = self.write_chunk(updates) if updates else None
+                rows_done = sum(1 for hash_value in row_hashes if hash_value in vectors)
+                failed = len(rows) - rows_done
+                unwritten_pages.append((write, rows[-1]["id"], rows_done, failed, len(rows) - len(pending)))
+                self._advance_checkpoint(unwritten_pages, wait=False)
+                pages += 1
+                page_duration = time.time() - page_start
+                logger.info(
+                    f"Embedded page {pages}: {rows_done} rows ({failed} failed), {len(unique_texts)} distinct texts, "
+                    f"{cache_hits} from cache, {len(pending)} sent to the model in {page_duration:.2f} seconds "
+                    f"({len(rows) / page_duration if page_duration else 0:.0f} rows/s, batch size {self.batch_sizer.size})."
+                )
+            self._advance_checkpoint(unwritten_pages, wait=True)
+
+        stats = {
+            "pages": pages,
+            "rows_embedded": self.checkpoint.rows_embedded,
+            "rows_failed": self.checkpoint.rows_failed,
+            "model_calls_saved": self.checkpoint.model_calls_saved,
+            "duration_seconds": time.time() - start_time,
+        }
+        # Full pass done: start from the beginning next time (and retry failed rows).
+        self.checkpoint.reset()
+        logger.info(f"Embedding backfill pass complete: {stats}")
+        return stats
+
+    def _advance_checkpoint(self, unwritten_pages: deque, wait: bool) -> None:
+        """
+        Moves the checkpoint past the leading pages whose writes have completed, in page order,
+        so `last_id` never passes a page whose MERGE is still running or failed. With `wait`,
+        blocks until every page is written. A failed write is re-raised.
+        """
+        while unwritten_pages:
+            write, last_id, rows_done, failed, calls_saved = unwritten_pages[0]
+            if write is not None:
+                if not wait and not write.done():
+                    return
+                write.result()
+            unwritten_pages.popleft()
+            self.checkpoint.last_id = last_id
+            self.checkpoint.rows_embedded += rows_done
+            self.checkpoint.rows_failed += failed
+            self.checkpoint.model_calls_saved += calls_saved
+            self.checkpoint.save()
+
+    def _embed_batch(self, batch: List[dict]) -> List[Optional[List[float]]]:
+        """
+        Embeds one batch. A batch the model rejects as invalid (400: payload or token limits,
+        a malformed text) is split in half and retried, so one bad text only fails itself.
+        Quota (429) and transient errors are retried with exponential backoff on the same
+        batch, since splitting would only multiply the requests. Returns one vector, or
+        None for a row that could not be embedded, per row.
+        """
+        texts = [row["text"] for row in batch]
+        for attempt in range(self.max_retries):
+            self.rate_limiter.acquire()
+            try:
+                vectors = self.model.embed(texts)
+                self.batch_sizer.on_success()
+                return vectors
+            except BadRequest as e:
+                self.batch_sizer.on_failure()
+                if len(batch) > 1:
+                    middle = len(batch) // 2
+                    return self._embed_batch(batch[:middle]) + self._embed_batch(batch[middle:])
+                logger.warning(f"Embedding model rejected text {batch[0]['id']!r}: {e}")
+                return [None]
+            except Exception as e:
+                # Quota exhausted (429), unavailable or timed out: wait, then retry the same batch.
+                if attempt + 1 == self.max_retries:
+                    logger.warning(f"Embedding request failed (attempt {attempt + 1}/{self.max_retries}): {e}.")
+                    break
+                backoff_seconds = min(2 ** attempt, 30) + random.random()
+                logger.warning(
+                    f"Embedding request failed (attempt {attempt + 1}/{self.max_retries}): {e}. "
+                    f"Retrying in {backoff_seconds:.1f} seconds."
+                )
+                time.sleep(backoff_seconds)
+        logger.error(f"Giving up on a batch of {len(batch)} texts after {self.max_retries} attempts.")
+        return [None] * len(batch)
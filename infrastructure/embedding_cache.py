@@ -0,0 +1,97 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".embedding_cache.sqlite"
+)
+
+_WHITESPACE_PATTERN = re.compile(r"[ \t\n\r\f]+")
+
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace runs to one space, trims and lowercases, so reposts that only differ in spacing or case match."""
+    return _WHITESPACE_PATTERN.sub(" ", text).strip(" ").lower()
+
+
+def text_hash(text: str) -> str:
+    """Hex SHA-256 of the normalized text; the content address of its embedding."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Local content-addressed store of embeddings, keyed by (model, text hash).
+
+    Vectors are stored as float32 blobs in a SQLite file, so reruns, reposts and other
+    tables embedded with the same model never pay for the same text twice.
+    """
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                )
+                """
+            )
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model: str, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        """Returns the cached vectors among `hashes`, keyed by hash."""
+        hashes = list(hashes)
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit.
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                cursor = self._connection.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *chunk],
+                )
+                for hash_value, blob in cursor:
+                    found[hash_value] = array("f", blob).tolist()
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]) -> None:
+        if not vectors:
+            return
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(model, hash_value, array("f", vector).tobytes()) for hash_value, vector in vectors.items()],
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+def open_embedding_cache(path: str = EMBEDDING_CACHE_PATH) -> Optional[EmbeddingCache]:
+    """Returns the local embedding cache, or None if it is disabled or cannot be opened."""
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    try:
+        return EmbeddingCache(path)
+    except sqlite3.Error as e:
+        logger.warning(f"Embedding cache at {path} is unavailable; embedding every text. Error: {e}")
+        return None
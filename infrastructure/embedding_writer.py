@@ -0,0 +1,145 @@
+import datetime
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from google.cloud import bigquery
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_WRITER_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_WRITER_MAX_IN_FLIGHT", "2"))
+EMBEDDING_STAGING_EXPIRATION_HOURS = float(os.getenv("EMBEDDING_STAGING_EXPIRATION_HOURS", "24"))
+
+_ARROW_ID_TYPES = {"INTEGER": pa.int64(), "INT64": pa.int64(), "STRING": pa.string()}
+
+
+def _to_parquet(updates: List[dict], id_type: pa.DataType) -> bytes:
+    """Serializes updates to Parquet with float32 vectors (half the size of float64 JSON/CSV rows)."""
+    table = pa.Table.from_pydict(
+        {
+            "id": [update["id"] for update in updates],
+            "text_embedding": [update["text_embedding"] for update in updates],
+        },
+        schema=pa.schema([("id", id_type), ("text_embedding", pa.list_(pa.float32()))]),
+    )
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression="zstd")
+    return buffer.getvalue()
+
+
+class EmbeddingChunkWriter:
+    """
+    Writes embedding updates to the target table in bounded, pipelined chunks.
+
+    Each chunk is loaded as Parquet into its own uniquely named staging table, which
+    expires on its own if a run dies, so concurrent backfills never share a staging table.
+    Loads run while the previous chunk's MERGE is still executing; MERGEs run one at a
+    time so they do not conflict on the target table. At most `max_in_flight` chunks are
+    held in memory.
+    """
+    def __init__(self, client: bigquery.Client, target_table_id: str, max_in_flight: int = EMBEDDING_WRITER_MAX_IN_FLIGHT):
+        self.client = client
+        self.target_table_id = target_table_id
+        self.max_in_flight = max(1, max_in_flight)
+        project_id, dataset_id, table_name = target_table_id.split(".")
+        self._staging_prefix = f"{project_id}.{dataset_id}.{table_name}_embedding_staging"
+        # Staged rows are matched to the target on `id`, so the staging table uses its type.
+        id_field = next(
+            (field for field in client.get_table(target_table_id).schema if field.name == "id"), None
+        )
+        if id_field is None or id_field.field_type not in _ARROW_ID_TYPES:
+            raise ValueError(f"{target_table_id} needs an INTEGER or STRING 'id' column to write embeddings.")
+        self._id_field_type = id_field.field_type
+        self._merge_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-merge")
+        self._in_flight: List[Future] = []
+        self._lock = threading.Lock()
+        self.rows_written = 0
+        self.bytes_written = 0
+
+    def write(self, updates: List[dict]) -> Future:
+        """
+        Starts loading a chunk and queues its MERGE. Blocks only when too many chunks are in flight.
+
+        Returns a future that completes once the chunk's MERGE has finished (or failed).
+        """
+        self._wait_for_capacity()
+        start_time = time.time()
+        payload = _to_parquet(updates, _ARROW_ID_TYPES[self._id_field_type])
+        staging_table_id = f"{self._staging_prefix}_{uuid.uuid4().hex[:12]}"
+        staging_table = bigquery.Table(staging_table_id, schema=[
+            bigquery.SchemaField("id", self._id_field_type),
+            bigquery.SchemaField("text_embedding", "FLOAT", mode="REPEATED"),
+        ])
+        staging_table.expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            hours=EMBEDDING_STAGING_EXPIRATION_HOURS
+        )
+        self.client.create_table(staging_table)
+        parquet_options = bigquery.ParquetOptions()
+        parquet_options.enable_list_inference = True
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition="WRITE_APPEND",
+            parquet_options=parquet_options,
+        )
+        load_job = self.client.load_table_from_file(io.BytesIO(payload), staging_table_id, job_config=job_config)
+        future = self._merge_executor.submit(
+            self._merge_chunk, load_job, staging_table_id, len(updates), len(payload), start_time
+        )
+        with self._lock:
+            self._in_flight.append(future)
+        return future
+
+    def close(self) -> None:
+        """Waits for every queued chunk and re-raises the first failure."""
+        try:
+            with self._lock:
+                in_flight, self._in_flight = self._in_flight, []
+            for future in in_flight:
+                future.result()
+        finally:
+            self._merge_executor.shutdown(wait=True)
+        logger.info(f"Embedding writer finished: {self.rows_written} rows, {self.bytes_written / 1024 ** 2:.1f} MiB staged.")
+
+    def _wait_for_capacity(self) -> None:
+        with self._lock:
+            if len(self._in_flight) < self.max_in_flight:
+                return
+            oldest = self._in_flight.pop(0)
+        oldest.result()
+
+    def _merge_chunk(self, load_job, staging_table_id: str, num_rows: int, num_bytes: int, start_time: float) -> None:
+        try:
+            load_job.result()
+            loaded_at = time.time()
+            # Joined on id: reposts of a text get their own staged row with the shared vector,
+            # so the MERGE never hashes the target's text column.
+            merge_query = f"""
+                MERGE `{self.target_table_id}` T
+                USING `{staging_table_id}` S
+                ON T.id = S.id
+                WHEN MATCHED AND (T.text_embedding IS NULL OR ARRAY_LENGTH(T.text_embedding) = 0) THEN
+                  UPDATE SET text_embedding = S.text_embedding
+            """
+            merge_job = self.client.query(merge_query)
+            merge_job.result()
+            finished_at = time.time()
+        finally:
+            self.client.delete_table(staging_table_id, not_found_ok=True)
+
+        with self._lock:
+            self.rows_written += num_rows
+            self.bytes_written += num_bytes
+        total_seconds = finished_at - start_time
+        logger.info(
+            f"Wrote chunk of {num_rows} rows ({num_bytes / 1024 ** 2:.2f} MiB, {merge_job.num_dml_affected_rows or 0} rows updated): "
+            f"load (incl. queueing) {loaded_at - start_time:.2f}s, merge {finished_at - loaded_at:.2f}s, "
+            f"{num_rows / total_seconds if total_seconds else 0:.0f} rows/s, "
+            f"{num_bytes / 1024 ** 2 / total_seconds if total_seconds else 0:.2f} MiB/s."
+        )
@@ -1,10 +1,11 @@
 
+import json
 import os
+import subprocess
 import sys
 import logging
-import pandas as pd
 import time
-from typing import List, Optional
+from typing import Iterable, List, Optional
 
 from google.cloud import bigquery
 from google.cloud import dataplex_v1
@@ -12,7 +13,10 @@ from google.api_core.exceptions import AlreadyExists, NotFound, GoogleAPICallErr
 from dotenv import load_dotenv
 
 import vertexai
-from vertexai.language_models import TextEmbeddingModel
+
+from embedding_backfill import EmbeddingBackfill, EmbeddingModel, load_embedding_model
+from embedding_writer import EmbeddingChunkWriter
+from csv_ingestion import infer_schema, ingest_csv
 
 # --- Setup Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -35,7 +39,24 @@ PROJECT_ID = os.getenv("BQ_DATA_PROJECT_ID") or os.getenv("GOOGLE_CLOUD_PROJECT"
 LOCATION = os.getenv("BQ_LOCATION", "us-central1")
 DATASET_NAME = os.getenv("BQ_DATASET_NAME", "labeling_pipeline_dataset")
 TABLE_NAME = os.getenv("BQ_TABLE_NAMES", "agent-test").split(',')[0]
-CSV_FILE_PATH = os.path.join(project_root, "251229_final_UNPK_Test.csv")
+CSV_FILE_PATH = os.getenv("CSV_FILE_PATH") or os.path.join(project_root, "251229_final_UNPK_Test.csv")
+CSV_INGEST_MODE = os.getenv("CSV_INGEST_MODE", "if_empty")  # 'if_empty', 'append', 'incremental' or 'skip'
+
+# Daily rollups are re-aggregated from this many days before their latest day on each
+# run, so late-arriving posts are picked up without rebuilding the whole table.
+ROLLUP_REFRESH_LOOKBACK_DAYS = int(os.getenv("ROLLUP_REFRESH_LOOKBACK_DAYS", "3"))
+ROLLUP_FULL_REBUILD = os.getenv("ROLLUP_FULL_REBUILD", "false").lower() in ("1", "true", "yes")
+
+# Layout of the buzz table: daily partitions on PARTITION_COLUMN, clustered on brand and
+# sentiment so the agent's date-range and brand filters only scan matching blocks.
+PARTITION_COLUMN = os.getenv("BQ_PARTITION_COLUMN", "Created_Time")
+CLUSTERING_COLUMNS = os.getenv("BQ_CLUSTERING_COLUMNS", "Brands_Mentioned,overall_sentiment").split(",")
+MIGRATE_TABLE_LAYOUT = os.getenv("MIGRATE_TABLE_LAYOUT", "false").lower() in ("1", "true", "yes")
+# The pre-migration backup table expires after this many days, so it does not keep billing storage.
+MIGRATION_BACKUP_RETENTION_DAYS = int(os.getenv("MIGRATION_BACKUP_RETENTION_DAYS", "7"))
+# Tables a layout migration copies the data into and keeps the original table as.
+_MIGRATED_TABLE_NAME = f"{TABLE_NAME}_partitioned_migration"
+_BACKUP_TABLE_NAME = f"{TABLE_NAME}_pre_partitioning_backup"
 
 DATAPLEX_LAKE_ID = "test-buzz-ai-lake"
 DATAPLEX_ZONE_ID = "test-primary-zone"
@@ -52,31 +73,49 @@ def init_clients():
     vertexai.init(project=PROJECT_ID, location=LOCATION)
 
 def infer_bq_schema_from_csv(csv_path: str) -> List[bigquery.SchemaField]:
-    """Reads CSV header/types and returns BigQuery Schema."""
-    logger.info(f"Inferring schema from {csv_path}...")
-    df = pd.read_csv(csv_path, nrows=100) # Read sample
-    schema = []
-    
-    for col, dtype in df.dtypes.items():
-        bq_type = "STRING"
-        if pd.api.types.is_integer_dtype(dtype):
-            bq_type = "INTEGER"
-        elif pd.api.types.is_float_dtype(dtype):
-            bq_type = "FLOAT"
-        elif pd.api.types.is_bool_dtype(dtype):
-            bq_type = "BOOLEAN"
-        elif "time" in col.lower() or "date" in col.lower():
-             # Basic heuristic for timestamp columns
-             bq_type = "TIMESTAMP" 
-        
-        # Sanitize column name (replace non-alphanumeric with _)
-        sanitized_name = "".join([c if c.isalnum() else "_" for c in col])
-        schema.append(bigquery.SchemaField(sanitized_name, bq_type))
-    
+    """Infers the BigQuery schema from a sample of the CSV (see csv_ingestion.infer_schema)."""
+    schema = [bigquery.SchemaField(name, bq_type) for _, name, bq_type in infer_schema(csv_path)]
     # Add embedding column definition
     schema.append(bigquery.SchemaField("text_embedding", "FLOAT", mode="REPEATED"))
     return schema
 
+def load_csv_if_needed(csv_path: str):
+    """
+    Loads the CSV into the table. With CSV_INGEST_MODE='if_empty' (default) it only runs
+    when the table has no rows yet; 'append' always appends; 'incremental' appends only
+    rows whose id is not in the table yet (for re-exports that overlap earlier loads);
+    'skip' never loads.
+    """
+    if CSV_INGEST_MODE == "skip":
+        logger.info("CSV_INGEST_MODE is 'skip'. Not loading the CSV.")
+        return
+    table_id = f"{PROJECT_ID}.{DATASET_NAME}.{TABLE_NAME}"
+    table = bq_client.get_table(table_id)
+    if CSV_INGEST_MODE == "if_empty" and table.num_rows:
+        logger.info(f"Table {TABLE_NAME} already has {table.num_rows} rows. Skipping CSV load.")
+        return
+    if CSV_INGEST_MODE == "incremental":
+        column_names = {field.name for field in table.schema}
+        ingest_csv(
+            bq_client, csv_path, table_id, infer_schema(csv_path),
+            dedupe_key="id" if "id" in column_names else None,
+            watermark_column=PARTITION_COLUMN if PARTITION_COLUMN in column_names else None,
+        )
+    else:
+        ingest_csv(bq_client, csv_path, table_id, infer_schema(csv_path))
+
+def _table_layout(schema: List[bigquery.SchemaField]):
+    """Returns (TimePartitioning or None, clustering columns) for a schema."""
+    fields = {field.name: field for field in schema}
+    partition_field = fields.get(PARTITION_COLUMN)
+    time_partitioning = None
+    if partition_field is not None and partition_field.field_type in ("TIMESTAMP", "DATE", "DATETIME"):
+        time_partitioning = bigquery.TimePartitioning(type_=bigquery.TimePartitioningType.DAY, field=PARTITION_COLUMN)
+    elif partition_field is not None:
+        logger.warning(f"{PARTITION_COLUMN} is {partition_field.field_type}, not a date/time type. The table will not be partitioned.")
+    clustering_fields = [column for column in CLUSTERING_COLUMNS if column in fields][:4]
+    return time_partitioning, clustering_fields or None
+
 def create_bq_table_if_needed(schema: List[bigquery.SchemaField]):
     dataset_ref = bq_client.dataset(DATASET_NAME)
     
@@ -93,6 +132,8 @@ def create_bq_table_if_needed(schema: List[bigquery.SchemaField]):
 
     # 2. Check/Create Table
     table_ref = dataset_ref.table(TABLE_NAME)
+    # A layout migration interrupted between its renames leaves the table under another name.
+    recover_table_layout_migration()
     try:
         table = bq_client.get_table(table_ref)
         logger.info(f"Table {TABLE_NAME} exists.")
@@ -106,12 +147,122 @@ def create_bq_table_if_needed(schema: List[bigquery.SchemaField]):
             table.schema = new_schema
             bq_client.update_table(table, ["schema"])
             logger.info("Table schema updated with 'text_embedding'.")
+
+        if MIGRATE_TABLE_LAYOUT:
+            migrate_table_layout(table)
             
     except NotFound:
         logger.info(f"Table {TABLE_NAME} not found. Creating with inferred schema...")
         table = bigquery.Table(table_ref, schema=schema)
+        table.time_partitioning, table.clustering_fields = _table_layout(schema)
         bq_client.create_table(table)
-        logger.info(f"Table {TABLE_NAME} created.")
+        logger.info(
+            f"Table {TABLE_NAME} created (partitioned by {table.time_partitioning.field if table.time_partitioning else 'nothing'}, "
+            f"clustered by {table.clustering_fields})."
+        )
+
+def migrate_table_layout(table: bigquery.Table):
+    """
+    Rewrites an existing unpartitioned or unclustered table into the partitioned and
+    clustered layout.
+
+    The data is copied with CREATE TABLE AS SELECT into a new table. Then, in one script,
+    the old table is renamed to `<table>_pre_partitioning_backup` and the new table takes
+    its name. The backup expires after MIGRATION_BACKUP_RETENTION_DAYS days; verify the new
+    table before then. BigQuery transactions cannot contain the renames, so a script that
+    fails halfway is finished by `recover_table_layout_migration` on the next run.
+    """
+    time_partitioning, clustering_fields = _table_layout(table.schema)
+    current_partition_field = table.time_partitioning.field if table.time_partitioning else None
+    wanted_partition_field = time_partitioning.field if time_partitioning else None
+    if current_partition_field == wanted_partition_field and (table.clustering_fields or None) == clustering_fields:
+        logger.info(f"Table {TABLE_NAME} already has the partitioned/clustered layout.")
+        return
+    if table.streaming_buffer is not None:
+        logger.warning(f"Table {TABLE_NAME} has a streaming buffer; skipping layout migration until it is flushed.")
+        return
+
+    table_id = f"{PROJECT_ID}.{DATASET_NAME}.{TABLE_NAME}"
+    migrated_name, backup_name = _MIGRATED_TABLE_NAME, _BACKUP_TABLE_NAME
+    partition_clause = ""
+    if time_partitioning:
+        partition_field = next(field for field in table.schema if field.name == time_partitioning.field)
+        partition_clause = (
+            f"PARTITION BY {partition_field.name}" if partition_field.field_type == "DATE"
+            else f"PARTITION BY DATE({partition_field.name})"
+        )
+    cluster_clause = f"CLUSTER BY {', '.join(clustering_fields)}" if clustering_fields else ""
+
+    logger.info(f"Migrating {table_id} to the partitioned layout ({partition_clause} {cluster_clause})...")
+    start_time = time.time()
+    bq_client.query(f"""
+        CREATE OR REPLACE TABLE `{PROJECT_ID}.{DATASET_NAME}.{migrated_name}`
+        {partition_clause}
+        {cluster_clause}
+        OPTIONS(description = {json.dumps(table.description or "")})
+        AS SELECT * FROM `{table_id}`
+    """).result()
+    bq_client.query(f"""
+        DROP TABLE IF EXISTS `{PROJECT_ID}.{DATASET_NAME}.{backup_name}`;
+        ALTER TABLE `{table_id}` RENAME TO `{backup_name}`;
+        ALTER TABLE `{PROJECT_ID}.{DATASET_NAME}.{migrated_name}` RENAME TO `{TABLE_NAME}`;
+        ALTER TABLE `{PROJECT_ID}.{DATASET_NAME}.{backup_name}` SET OPTIONS (
+          expiration_timestamp = TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL {MIGRATION_BACKUP_RETENTION_DAYS} DAY)
+        );
+    """).result()
+    # CREATE TABLE AS SELECT drops column descriptions; restore them from the old schema.
+    migrated_table = bq_client.get_table(table_id)
+    migrated_table.schema = table.schema
+    bq_client.update_table(migrated_table, ["schema"])
+    logger.info(
+        f"Migrated {table_id} in {time.time() - start_time:.2f} seconds. "
+        f"The previous table is kept as {backup_name} for {MIGRATION_BACKUP_RETENTION_DAYS} days."
+    )
+
+def recover_table_layout_migration():
+    """
+    Finishes a layout migration whose rename script failed after renaming the original table.
+
+    If the table is missing but the fully copied `<table>_partitioned_migration` exists, the
+    copy takes the table's name, as the migration would have done. If only the backup is
+    left, it is renamed back and no longer expires. Does nothing while the table exists.
+    """
+    dataset_prefix = f"{PROJECT_ID}.{DATASET_NAME}"
+    table_id = f"{dataset_prefix}.{TABLE_NAME}"
+
+    def get_table_or_none(full_table_id: str) -> Optional[bigquery.Table]:
+        try:
+            return bq_client.get_table(full_table_id)
+        except NotFound:
+            return None
+
+    if get_table_or_none(table_id) is not None:
+        return
+    migrated_table = get_table_or_none(f"{dataset_prefix}.{_MIGRATED_TABLE_NAME}")
+    backup_table = get_table_or_none(f"{dataset_prefix}.{_BACKUP_TABLE_NAME}")
+    if migrated_table is not None:
+        logger.warning(f"{table_id} is missing after an interrupted layout migration; finishing the migration.")
+        statements = [f"ALTER TABLE `{dataset_prefix}.{_MIGRATED_TABLE_NAME}` RENAME TO `{TABLE_NAME}`;"]
+        if backup_table is not None:
+            statements.append(f"""
+                ALTER TABLE `{dataset_prefix}.{_BACKUP_TABLE_NAME}` SET OPTIONS (
+                  expiration_timestamp = TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL {MIGRATION_BACKUP_RETENTION_DAYS} DAY)
+                );
+            """)
+        bq_client.query("\n".join(statements)).result()
+        if backup_table is not None:
+            # CREATE TABLE AS SELECT drops column descriptions; restore them from the old schema.
+            restored_table = bq_client.get_table(table_id)
+            restored_table.schema = backup_table.schema
+            bq_client.update_table(restored_table, ["schema"])
+        logger.info(f"Finished the layout migration of {table_id}.")
+    elif backup_table is not None:
+        logger.warning(f"{table_id} is missing after an interrupted layout migration; restoring it from {_BACKUP_TABLE_NAME}.")
+        bq_client.query(f"""
+            ALTER TABLE `{dataset_prefix}.{_BACKUP_TABLE_NAME}` RENAME TO `{TABLE_NAME}`;
+            ALTER TABLE `{table_id}` SET OPTIONS (expiration_timestamp = NULL);
+        """).result()
+        logger.info(f"Restored {table_id} from {_BACKUP_TABLE_NAME}.")
 
 def create_dataplex_resources():
     """Creates Lake, Zone, and Asset."""
@@ -175,81 +326,203 @@ def create_dataplex_resources():
         operation.result(timeout=600)
         logger.info(f"Asset {asset_id} created.")
 
-def generate_embeddings_for_missing_rows():
-    """Backfills embeddings for rows where text_embedding is NULL."""
-    model = TextEmbeddingModel.from_pretrained("text-embedding-004")
-    
-    # Fetch rows pending embedding
-    query = f"""
-        SELECT *
-        FROM `{PROJECT_ID}.{DATASET_NAME}.{TABLE_NAME}`
-        WHERE text_embedding IS NULL
-        AND text IS NOT NULL
-        LIMIT 1000
+def _rollup_day_expression(field: bigquery.SchemaField) -> str:
+    """Returns a DATE expression for the Created_Time column, whatever type it was loaded as."""
+    if field.field_type == "DATE":
+        return field.name
+    if field.field_type in ("TIMESTAMP", "DATETIME"):
+        return f"DATE({field.name})"
+    return f"SAFE_CAST(SUBSTR(CAST({field.name} AS STRING), 1, 10) AS DATE)"
+
+def _rollup_flag_predicate(field: bigquery.SchemaField) -> str:
+    """Returns a predicate that is true when a Feature_<name> flag column is set."""
+    if field.field_type in ("BOOLEAN", "BOOL"):
+        return f"{field.name} IS TRUE"
+    if field.field_type in ("INTEGER", "INT64", "FLOAT", "FLOAT64", "NUMERIC"):
+        return f"{field.name} = 1"
+    return f"LOWER(CAST({field.name} AS STRING)) IN ('1', 'true')"
+
+def build_rollup_queries(schema: List[bigquery.SchemaField]) -> dict:
     """
-    logger.info("Fetching rows with missing embeddings...")
-    query_job = bq_client.query(query)
-    rows = list(query_job.result())
-    
-    if not rows:
-        logger.info("No rows found needing embeddings.")
-        return
+    Builds the SELECT statements of the daily rollups from the base table schema.
 
-    logger.info(f"Found {len(rows)} rows to embed. Processing...")
-    
-    BATCH_SIZE = 5
-    updates = []
-    
-    for i in range(0, len(rows), BATCH_SIZE):
-        batch = rows[i:i+BATCH_SIZE]
-        texts = [row.text for row in batch]
-        
-        try:
-            embeddings = model.get_embeddings(texts)
-            for j, embedding in enumerate(embeddings):
-                # We need a unique identifier. Assuming 'id' column exists based on CSV.
-                # If no ID, we might need to rely on row uniqueness or add a temporary ID.
-                row_id = batch[j].id 
-                updates.append({"id": row_id, "text_embedding": embedding.values})
-        except Exception as e:
-            logger.error(f"Error embedding batch: {e}")
+    Returns a dict mapping the rollup table suffix to a query with a `{day_filter}`
+    placeholder, which is either empty (full build) or a predicate on the day column.
+    """
+    fields = {field.name: field for field in schema}
+    if "Created_Time" not in fields:
+        raise ValueError("Base table has no Created_Time column; cannot build daily rollups.")
+    # The day filter references the derived `day` column, so every branch reads from
+    # this subquery; BigQuery still prunes unused columns and pushes the filter down.
+    day = _rollup_day_expression(fields["Created_Time"])
+    source = f"(SELECT *, {day} AS day FROM `{PROJECT_ID}.{DATASET_NAME}.{TABLE_NAME}`)"
+    brand = "Brands_Mentioned" if "Brands_Mentioned" in fields else "CAST(NULL AS STRING)"
+    mentions = "mentions" if "mentions" in fields else "1"
+
+    queries = {
+        "_rollup_daily_sentiment": f"""
+            SELECT
+              day,
+              {brand} AS Brands_Mentioned,
+              overall_sentiment,
+              SUM({mentions}) AS mentions,
+              COUNT(*) AS posts
+            FROM {source}
+            WHERE day IS NOT NULL {{day_filter}}
+            GROUP BY day, Brands_Mentioned, overall_sentiment
+        """
+    }
+
+    # Unpivot every Feature_<name> flag into one (feature, feature_sentiment) row per post.
+    feature_selects = []
+    for name, field in fields.items():
+        if not name.startswith("Feature_"):
             continue
-            
-    # Update back to BigQuery
-    # Efficient update via temporary table + MERGE
-    if updates:
-        _update_bq_with_embeddings(updates)
-
-def _update_bq_with_embeddings(updates):
-    """Updates BQ table using a temporary staging table and MERGE statement."""
-    logger.info(f"Updating {len(updates)} rows in BigQuery...")
-    
-    temp_table_id = f"{DATASET_NAME}.temp_embedding_updates"
-    
-    # Create DF
-    df = pd.DataFrame(updates)
-    
-    job_config = bigquery.LoadJobConfig(
-        write_disposition="WRITE_TRUNCATE",
-    )
-    
-    # Load to temp table
-    load_job = bq_client.load_table_from_dataframe(df, temp_table_id, job_config=job_config)
-    load_job.result()
-    
-    # MERGE
-    merge_query = f"""
-        MERGE `{PROJECT_ID}.{DATASET_NAME}.{TABLE_NAME}` T
-        USING `{PROJECT_ID}.{temp_table_id}` S
-        ON T.id = S.id
-        WHEN MATCHED THEN
-          UPDATE SET text_embedding = S.text_embedding
+        feature = name[len("Feature_"):]
+        sentiment_column = f"feature_sentiments_{feature}"
+        feature_sentiment = (
+            f"CAST({sentiment_column} AS STRING)" if sentiment_column in fields else "CAST(NULL AS STRING)"
+        )
+        feature_selects.append(f"""
+              SELECT
+                day,
+                {brand} AS Brands_Mentioned,
+                '{feature}' AS feature,
+                {feature_sentiment} AS feature_sentiment,
+                overall_sentiment,
+                {mentions} AS mentions
+              FROM {source}
+              WHERE {_rollup_flag_predicate(field)} AND day IS NOT NULL {{day_filter}}""")
+    if feature_selects:
+        queries["_rollup_daily_feature"] = f"""
+            SELECT
+              day,
+              Brands_Mentioned,
+              feature,
+              feature_sentiment,
+              overall_sentiment,
+              SUM(mentions) AS mentions,
+              COUNT(*) AS posts
+            FROM ({" UNION ALL ".join(feature_selects)}
+            )
+            GROUP BY day, Brands_Mentioned, feature, feature_sentiment, overall_sentiment
+        """
+    return queries
+
+def refresh_rollup_tables():
     """
-    bq_client.query(merge_query).result()
-    logger.info("Update complete.")
-    
-    # Cleanup
-    bq_client.delete_table(temp_table_id, not_found_ok=True)
+    Creates the daily rollup tables of the base table, or refreshes them incrementally.
+
+    A missing rollup (or ROLLUP_FULL_REBUILD=true) is built in full with CREATE OR REPLACE.
+    Otherwise the days from ROLLUP_REFRESH_LOOKBACK_DAYS before the rollup's latest day
+    are deleted and re-aggregated in one transaction, so each run only scans recent
+    partitions of the raw table.
+    """
+    base_table = bq_client.get_table(f"{PROJECT_ID}.{DATASET_NAME}.{TABLE_NAME}")
+    queries = build_rollup_queries(base_table.schema)
+
+    for suffix, select_query in queries.items():
+        rollup_id = f"{PROJECT_ID}.{DATASET_NAME}.{TABLE_NAME}{suffix}"
+        clustering = "Brands_Mentioned, feature" if suffix == "_rollup_daily_feature" else "Brands_Mentioned, overall_sentiment"
+        try:
+            bq_client.get_table(rollup_id)
+            exists = True
+        except NotFound:
+            exists = False
+
+        start_time = time.time()
+        if not exists or ROLLUP_FULL_REBUILD:
+            logger.info(f"Building rollup table {rollup_id}...")
+            statement = f"""
+                CREATE OR REPLACE TABLE `{rollup_id}`
+                PARTITION BY day
+                CLUSTER BY {clustering}
+                AS {select_query.format(day_filter="")}
+            """
+        else:
+            logger.info(f"Refreshing rollup table {rollup_id} (lookback {ROLLUP_REFRESH_LOOKBACK_DAYS} days)...")
+            statement = f"""
+                DECLARE refresh_from DATE DEFAULT (
+                  SELECT DATE_SUB(MAX(day), INTERVAL {ROLLUP_REFRESH_LOOKBACK_DAYS} DAY) FROM `{rollup_id}`
+                );
+                BEGIN TRANSACTION;
+                DELETE FROM `{rollup_id}` WHERE refresh_from IS NULL OR day >= refresh_from;
+                INSERT INTO `{rollup_id}`
+                {select_query.format(day_filter="AND (refresh_from IS NULL OR day >= refresh_from)")};
+                COMMIT TRANSACTION;
+            """
+        job = bq_client.query(statement)
+        job.result()
+        logger.info(
+            f"Rollup table {rollup_id} is up to date "
+            f"({(job.total_bytes_processed or 0) / 1024 ** 2:.1f} MiB processed, {time.time() - start_time:.2f} seconds)."
+        )
+
+def _fetch_rows_missing_embeddings(last_id, page_size: int) -> Iterable[List[dict]]:
+    """
+    Yields pages of the rows that still need an embedding (only `id` and `text`), ordered by id.
+
+    Each page is its own keyset query (`id > @last_id ORDER BY id LIMIT @page_size`), so every
+    job is bounded by the page size and an interrupted pass resumes with a single page query.
+    `last_id` (from the checkpoint) skips rows a previous run already wrote.
+    """
+    while True:
+        query_parameters = [bigquery.ScalarQueryParameter("page_size", "INT64", page_size)]
+        after_clause = ""
+        if last_id is not None:
+            id_type = "INT64" if isinstance(last_id, int) else "STRING"
+            query_parameters.append(bigquery.ScalarQueryParameter("last_id", id_type, last_id))
+            after_clause = "AND id > @last_id"
+        query = f"""
+            SELECT id, text
+            FROM `{PROJECT_ID}.{DATASET_NAME}.{TABLE_NAME}`
+            WHERE (text_embedding IS NULL OR ARRAY_LENGTH(text_embedding) = 0)
+            AND text IS NOT NULL
+            {after_clause}
+            ORDER BY id
+            LIMIT @page_size
+        """
+        job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+        rows = [{"id": row.id, "text": row.text} for row in bq_client.query(query, job_config=job_config).result()]
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        # Pages follow the last id read, not the checkpoint, which waits for the page's MERGE.
+        last_id = rows[-1]["id"]
+
+def generate_embeddings_for_missing_rows(model: Optional[EmbeddingModel] = None):
+    """
+    Backfills embeddings for rows where text_embedding is empty.
+
+    Reads the rows needing an embedding one keyset page at a time, embeds each page with concurrent, rate-limited,
+    adaptively sized model requests and writes it back before moving on, so memory stays
+    bounded by EMBEDDING_PAGE_SIZE. Progress is checkpointed to EMBEDDING_CHECKPOINT_PATH
+    and an interrupted run resumes from the last written page. Pages are written through
+    EmbeddingChunkWriter, which loads and MERGEs them in a pipeline. Duplicate texts are
+    embedded once and vectors are reused from the local embedding cache across runs.
+    """
+    writer = EmbeddingChunkWriter(bq_client, f"{PROJECT_ID}.{DATASET_NAME}.{TABLE_NAME}")
+    backfill = EmbeddingBackfill(
+        model=model or load_embedding_model(),
+        fetch_pages=_fetch_rows_missing_embeddings,
+        write_chunk=writer.write,
+    )
+    try:
+        stats = backfill.run()
+    finally:
+        writer.close()
+    if not stats["pages"]:
+        logger.info("No rows found needing embeddings.")
+
+def build_vector_index():
+    """Builds the agent's similar post index in VECTOR_INDEX_DIR; the agent only loads it."""
+    if not os.getenv("VECTOR_INDEX_DIR"):
+        logger.warning("VECTOR_INDEX_DIR not set; skipping the vector index build. Similar post search stays unavailable.")
+        return
+    subprocess.run([sys.executable, "-m", "data_agent.vector_index"], cwd=project_root, check=True)
+
 
 def main():
     if not PROJECT_ID:
@@ -262,6 +535,7 @@ def main():
     if os.path.exists(CSV_FILE_PATH):
         schema = infer_bq_schema_from_csv(CSV_FILE_PATH)
         create_bq_table_if_needed(schema)
+        load_csv_if_needed(CSV_FILE_PATH)
     else:
         logger.error(f"CSV file not found at {CSV_FILE_PATH}. Cannot infer schema.")
         return
@@ -278,6 +552,18 @@ def main():
     except Exception as e:
         logger.error(f"Embedding generation failed: {e}")
         
+    print("--- 4. Building Daily Rollup Tables ---")
+    try:
+        refresh_rollup_tables()
+    except Exception as e:
+        logger.error(f"Rollup table refresh failed: {e}")
+
+    print("--- 5. Building the Vector Index ---")
+    try:
+        build_vector_index()
+    except Exception as e:
+        logger.error(f"Vector index build failed: {e}")
+
     print("\n\nDone! Infrastructure setup complete.")
     print("To verify, check your BigQuery table schema for 'text_embedding' and visit the Dataplex console.")
 